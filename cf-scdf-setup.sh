@@ -61,14 +61,25 @@ elif [[ "$os" == "Darwin" ]]; then
 
 fi
 export PYTHONPATH=./src:$PYTHONPATH
-python3 -m install.clean --appsOnly
+# Use the installer daemon (python3 -m install.daemon), if it is running, to skip the login and inventory scans
+DAEMON_SOCKET=${SCDF_CF_SETUP_SOCKET:-${CACHE_DIR:-$HOME/.scdf_cf_setup}/daemon.sock}
+if [[ -S "$DAEMON_SOCKET" ]]; then
+  INSTALLER="install.daemon_client"
+  CLEAN="$INSTALLER clean"
+  SETUP="$INSTALLER setup"
+else
+  CLEAN="install.clean"
+  SETUP="install.setup"
+fi
+
+python3 -m $CLEAN --appsOnly
 if [[ $? > 0 ]]; then
   exit 1
 fi
 
-python3 -m install.setup $ARGS
+python3 -m $SETUP $ARGS
 if [[ $? > 0 ]]; then
   exit 1
 fi
-load_file "cf_scdf.properties"
+load_file "${WORK_DIR:-.}/cf_scdf.properties"
 echo "SERVER_URI=$SPRING_CLOUD_DATAFLOW_CLIENT_SERVER_URI"
@@ -0,0 +1,80 @@
+__copyright__ = '''
+Copyright 2022 the original author or authors.
+  Licensed under the Apache License, Version 2.0 (the "License");
+  you may not use this file except in compliance with the License.
+  You may obtain a copy of the License at
+      http://www.apache.org/licenses/LICENSE-2.0
+  Unless required by applicable law or agreed to in writing, software
+  distributed under the License is distributed on an "AS IS" BASIS,
+  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+  See the License for the specific language governing permissions and
+  limitations under the License.
+'''
+
+__author__ = 'David Turanski'
+
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class ReadCache:
+    """
+    A read-through cache for cf cli queries. Entries are grouped by kind, e.g., 'service', and expire after the TTL
+    configured for their kind. Kinds without a TTL are never cached. Callers wrap the commands that change entries
+    with invalidating().
+    """
+
+    def __init__(self, ttl_sec, clock=time.monotonic):
+        self.ttl_sec = ttl_sec
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.entries = {}
+        # Bumped by every invalidation, so a value loaded before it is not cached
+        self.generations = {}
+        # The number of commands changing each kind. Values loaded meanwhile may be stale, so they are not cached.
+        self.changing = {}
+
+    def get(self, kind, key, load, refresh=False):
+        ttl = self.ttl_sec.get(kind)
+        if not ttl:
+            return load()
+        with self.lock:
+            entry = self.entries.get((kind, key))
+            generation = self.generations.get(kind, 0)
+        if entry and not refresh and self.clock() < entry[0]:
+            logger.debug("cached %s %s" % (kind, str(key)))
+            return entry[1]
+        value = load()
+        with self.lock:
+            if not self.changing.get(kind) and self.generations.get(kind, 0) == generation:
+                self.entries[(kind, key)] = (self.clock() + ttl, value)
+        return value
+
+    def invalidate(self, kind, key=None):
+        """
+        Removes the entry for key, or all entries of the kind if key is None.
+        """
+        with self.lock:
+            self.generations[kind] = self.generations.get(kind, 0) + 1
+            for entry_key in list(self.entries.keys()):
+                if entry_key[0] == kind and (key is None or entry_key[1] == key):
+                    del self.entries[entry_key]
+
+    @contextmanager
+    def invalidating(self, kind, key=None):
+        """
+        Wraps a command that changes the entry for key, or all entries of the kind. Nothing of the kind is cached while
+        it runs, and the entry is invalidated once it is done, even if it failed.
+        """
+        with self.lock:
+            self.changing[kind] = self.changing.get(kind, 0) + 1
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.changing[kind] = self.changing[kind] - 1
+            self.invalidate(kind, key)
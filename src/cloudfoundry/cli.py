@@ -15,9 +15,17 @@ __author__ = 'David Turanski'
 
 import json
 import logging
+import os
 import re
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+
 from install.shell import Shell
+from cloudfoundry.cache import ReadCache
 from cloudfoundry.domain import Service, App
+from cloudfoundry.oauth import TokenProvider, token_cache_path
+from install.http_client import HttpClient
 from install.util import Poller, masked
 
 logger = logging.getLogger(__name__)
@@ -28,25 +36,32 @@ Basically a cf cli screen scraper
 
 
 class CloudFoundry:
-    initialized = False
+    # Query results are reused for this long if the read cache is enabled
+    READ_CACHE_TTL_SEC = {'target': 60, 'services': 10, 'service': 10, 'service_key': 60, 'apps': 10, 'app': 10}
 
     @classmethod
     def connect(cls, deployer_config, config_props, shell=Shell()):
         logger.debug("connection config:\n%s" % deployer_config.masked())
         cf = CloudFoundry(deployer_config, config_props, shell)
 
-        if not CloudFoundry.initialized:
+        if not cf.initialized:
             logger.debug("logging in to CF - api: %s org: %s space: %s" % (
                 deployer_config.api_endpoint, deployer_config.org, deployer_config.space))
-            proc = cf.login()
-            if proc.returncode:
-                logger.error("CF login failed: " + Shell.stdout_to_s(proc))
-                cf.logout()
-                raise RuntimeError(
-                    "cf login failed for some reason. Verify the username/password and that org %s and space %s exist"
-                    % (deployer_config.org, deployer_config.space))
+            try:
+                proc = cf.login()
+                if proc.returncode:
+                    logger.error("CF login failed: " + Shell.stdout_to_s(proc))
+                    cf.logout()
+                    raise RuntimeError(
+                        "cf login failed for some reason. Verify the username/password and that org %s exists"
+                        % deployer_config.org)
+                # The space is targeted after login, so a new space can be created
+                cf.target_space()
+            except Exception:
+                cf.close()
+                raise
             logger.info("\n" + json.dumps(cf.current_target()))
-            CloudFoundry.initialized = True
+            cf.initialized = True
         else:
             logger.debug("Already logged in")
         return cf
@@ -61,15 +76,32 @@ class CloudFoundry:
         self.poller = Poller(config_props.deploy_wait_sec, config_props.max_retries)
         self.config_props = config_props
         self.deployer_config = deployer_config
-
-        self.shell = shell
+        # Session state is per connection, so several installs can run in the same process or on the same host
+        self.initialized = False
+        self.cf_home_dir = None
+        self.cf_home = None
+        if config_props.cf_home:
+            self.cf_home = os.path.expanduser(config_props.cf_home)
+        elif config_props.cf_home_isolated:
+            # An isolated cf cli config (.cf/config.json), removed at exit
+            self.cf_home_dir = tempfile.TemporaryDirectory(prefix='cf_home_')
+            self.cf_home = self.cf_home_dir.name
+        self.work_dir = os.path.abspath(os.path.expanduser(config_props.work_dir))
+        Path(self.work_dir).mkdir(parents=True, exist_ok=True)
+
+        self.shell = shell.with_env({'CF_HOME': self.cf_home}) if self.cf_home else shell
+        cache_path = token_cache_path(config_props.cache_path('tokens'), deployer_config.api_endpoint,
+                                      deployer_config.username) if config_props.token_cache_enabled else None
+        self.token_provider = TokenProvider(self.fetch_oauth_token, cache_path=cache_path)
+        self.http = HttpClient(verify=not deployer_config.skip_ssl_validation)
+        self.cache = ReadCache(self.READ_CACHE_TTL_SEC if config_props.cf_read_cache_enabled else {})
         try:
             self.shell.exec('cf --version')
         except Exception:
             raise RuntimeError('cf cli is not installed')
 
         if shell.dry_run:
-            CloudFoundry.initialized = True
+            self.initialized = True
             return
 
         target = self.current_target()
@@ -84,17 +116,22 @@ class CloudFoundry:
             proc = self.target(org=deployer_config.org)
             if proc.returncode:
                 raise RuntimeError("Unable to target org %s" % deployer_config.org)
-            proc = self.target(space=deployer_config.space)
-            if proc.returncode:
-                self.create_space(deployer_config.space)
+            self.target_space()
             target = self.current_target()
 
         if target and target.get('api endpoint') == deployer_config.api_endpoint and \
                 target.get('org') == deployer_config.org and target.get('space') == deployer_config.space:
-            CloudFoundry.initialized = True
+            self.initialized = True
+
+    def work_path(self, name):
+        return os.path.join(self.work_dir, name)
+
+    def close(self):
+        if self.cf_home_dir:
+            self.cf_home_dir.cleanup()
 
     def current_target(self):
-        proc = self.shell.exec("cf target")
+        proc = self.cache.get('target', None, lambda: self.shell.exec("cf target"))
         contents = self.shell.stdout_to_s(proc)
         logger.debug(contents)
         target = {}
@@ -112,24 +149,39 @@ class CloudFoundry:
             cmd = cmd + " -o %s" % (org)
         if space is not None:
             cmd = cmd + " -s %s" % (space)
-        return self.shell.exec(cmd)
+        with self.cache.invalidating('target'):
+            return self.shell.exec(cmd)
+
+    def target_space(self):
+        """
+        Targets the configured space, creating it if it does not exist.
+        """
+        proc = self.target(space=self.deployer_config.space)
+        if proc.returncode:
+            self.create_space(self.deployer_config.space)
+            proc = self.target(space=self.deployer_config.space)
+            if proc.returncode:
+                raise RuntimeError("Unable to target space %s" % self.deployer_config.space)
 
     def push(self, args):
         cmd = 'cf push %s' % args
-        proc = self.shell.exec(cmd, capture_output=False)
+        with self.cache.invalidating('apps'), self.cache.invalidating('app'):
+            proc = self.shell.exec(cmd, capture_output=False)
         if proc.returncode:
             logger.error(self.shell.log_stdout(proc))
             raise RuntimeError('cf push failed: %s' % str(proc.args))
         return proc
 
     def is_logged_in(self):
-        proc = self.shell.exec("cf target")
+        proc = self.cache.get('target', None, lambda: self.shell.exec("cf target"))
         return proc.returncode == 0
 
     def logout(self):
-        proc = self.shell.exec("cf logout")
+        with self.cache.invalidating('target'):
+            proc = self.shell.exec("cf logout")
         if proc.returncode == 0:
-            CloudFoundry.initialized = False
+            self.initialized = False
+            self.token_provider.invalidate()
         return proc
 
     def login(self):
@@ -137,23 +189,23 @@ class CloudFoundry:
         if self.deployer_config.skip_ssl_validation:
             skip_ssl = "--skip-ssl-validation"
 
-        cmd = "cf login -a %s -o %s -s %s -u %s -p %s %s" % \
+        cmd = "cf login -a %s -o %s -u %s -p %s %s" % \
               (self.deployer_config.api_endpoint,
                self.deployer_config.org,
-               self.deployer_config.space,
                self.deployer_config.username,
                self.deployer_config.password,
                skip_ssl)
-        return self.shell.exec(cmd)
+        with self.cache.invalidating('target'):
+            return self.shell.exec(cmd)
 
     def create_service(self, service_config):
         logger.info("creating service " + masked(service_config))
 
         # Looks like pretty clean code, but having to pass this mess on the command line? WTF
         config = "-c '%s'" % json.dumps(service_config.config) if service_config.config else ""
-
-        proc = self.shell.exec("cf create-service %s %s %s %s" % (service_config.service, service_config.plan,
-                                                                  service_config.name, config))
+        with self.changing_service(service_config.name):
+            proc = self.shell.exec("cf create-service %s %s %s %s" % (service_config.service, service_config.plan,
+                                                                      service_config.name, config))
         self.shell.log_stdout(proc)
         if self.shell.dry_run:
             return proc
@@ -168,7 +220,7 @@ class CloudFoundry:
 
     def wait_for_create_service(self, service_config):
         if not self.poller.wait_for(
-                success_condition=lambda: self.service(service_config.name).status == 'create succeeded',
+                success_condition=lambda: self.service(service_config.name, refresh=True).status == 'create succeeded',
                 failure_condition=lambda: self.service(service_config.name).status == 'create failed',
                 wait_message="waiting for service %s status 'create succeeded'" % service_config.name):
             raise RuntimeError("FATAL: unable to create service %s" % service_config)
@@ -177,8 +229,8 @@ class CloudFoundry:
 
     def delete_service(self, service_name):
         logger.info("deleting service %s" % service_name)
-
-        proc = self.shell.exec("cf delete-service -f %s" % service_name)
+        with self.changing_service(service_name):
+            proc = self.shell.exec("cf delete-service -f %s" % service_name)
         self.shell.log_stdout(proc)
         if self.shell.dry_run:
             return proc
@@ -194,7 +246,7 @@ class CloudFoundry:
             service = self.service(service_name)
             return service and service.status == 'delete failed'
 
-        if not self.poller.wait_for(success_condition=lambda: self.service(service_name) is None,
+        if not self.poller.wait_for(success_condition=lambda: self.service(service_name, refresh=True) is None,
                                     failure_condition=fail,
                                     wait_message="waiting for %s to be deleted" % service_name):
             raise RuntimeError("FATAL: %s " % str(self.service(service_name)))
@@ -202,6 +254,10 @@ class CloudFoundry:
             logger.info("deleted service %s" % service_name)
 
     def service_key(self, service_name, key_name='scdf_cf_setup'):
+        return self.cache.get('service_key', (service_name, key_name),
+                              lambda: self.fetch_service_key(service_name, key_name))
+
+    def fetch_service_key(self, service_name, key_name):
         logger.info("getting service key %s for service %s" % (key_name, service_name))
         proc = self.shell.exec("cf service-key %s %s" % (service_name, key_name))
         msg = self.shell.stdout_to_s(proc)
@@ -214,7 +270,8 @@ class CloudFoundry:
     def create_service_key(self, service_name, key_name):
         if not self.service_key(service_name, key_name):
             logger.info("creating service key %s for service %s" % (key_name, service_name))
-            proc = self.shell.exec("cf create-service-key %s %s" % (service_name, key_name))
+            with self.cache.invalidating('service_key', (service_name, key_name)):
+                proc = self.shell.exec("cf create-service-key %s %s" % (service_name, key_name))
             if proc.returncode:
                 logger.error(self.shell.stdout_to_s(proc))
                 raise RuntimeError("FATAL: Failed to create service key %s %s" % (service_name, key_name))
@@ -225,7 +282,8 @@ class CloudFoundry:
     def delete_service_key(self, service_name, key_name):
         if self.service_key(service_name, key_name):
             logger.info("deleting service key %s for service %s" % (key_name, service_name))
-            proc = self.shell.exec("cf delete-service-key -f %s %s" % (service_name, key_name))
+            with self.cache.invalidating('service_key', (service_name, key_name)):
+                proc = self.shell.exec("cf delete-service-key -f %s %s" % (service_name, key_name))
             if proc.returncode:
                 logger.error(self.shell.stdout_to_s(proc))
             else:
@@ -236,6 +294,9 @@ class CloudFoundry:
             return None
 
     def apps(self):
+        return self.cache.get('apps', None, self.fetch_apps)
+
+    def fetch_apps(self):
         appnames = []
         proc = self.shell.exec("cf apps")
         contents = self.shell.stdout_to_s(proc)
@@ -247,6 +308,9 @@ class CloudFoundry:
         return appnames
 
     def app(self, app_name):
+        return self.cache.get('app', app_name, lambda: self.fetch_app(app_name))
+
+    def fetch_app(self, app_name):
         proc = self.shell.exec("cf app %s" % app_name)
         msg = self.shell.stdout_to_s(proc)
         if proc.returncode:
@@ -255,11 +319,30 @@ class CloudFoundry:
         return App.parse(msg)
 
     def delete_app(self, app_name):
-        proc = self.shell.exec("cf delete -f %s" % app_name)
+        with self.changing_app(app_name):
+            proc = self.shell.exec("cf delete -f %s" % app_name)
         msg = self.shell.stdout_to_s(proc)
         if proc.returncode:
             logger.error("Failed to delete app %s [%s]" % (app_name, msg))
 
+    def stop_app(self, app_name):
+        logger.info("stopping app %s" % app_name)
+        with self.changing_app(app_name):
+            proc = self.shell.exec("cf stop %s" % app_name)
+        if proc.returncode:
+            logger.error(self.shell.stdout_to_s(proc))
+            raise RuntimeError("FATAL: Failed to stop app %s" % app_name)
+        return proc
+
+    def start_app(self, app_name):
+        logger.info("starting app %s" % app_name)
+        with self.changing_app(app_name):
+            proc = self.shell.exec("cf start %s" % app_name)
+        if proc.returncode:
+            logger.error(self.shell.stdout_to_s(proc))
+            raise RuntimeError("FATAL: Failed to start app %s" % app_name)
+        return proc
+
     def delete_orphaned_routes(self):
         proc = self.shell.exec("cf delete-orphaned-routes -f")
         msg = self.shell.stdout_to_s(proc)
@@ -272,7 +355,15 @@ class CloudFoundry:
             self.delete_app(app)
         self.delete_orphaned_routes()
 
-    def service(self, service_name):
+    @contextmanager
+    def changing_app(self, app_name):
+        with self.cache.invalidating('apps'), self.cache.invalidating('app', app_name):
+            yield
+
+    def service(self, service_name, refresh=False):
+        return self.cache.get('service', service_name, lambda: self.fetch_service(service_name), refresh)
+
+    def fetch_service(self, service_name):
         proc = self.shell.exec("cf service " + service_name)
         if proc.returncode != 0:
             logger.debug("service %s does not exist, or there is some other issue." % service_name)
@@ -280,7 +371,15 @@ class CloudFoundry:
 
         return Service.parse(self.shell.stdout_to_s(proc))
 
+    @contextmanager
+    def changing_service(self, service_name):
+        with self.cache.invalidating('services'), self.cache.invalidating('service', service_name):
+            yield
+
     def services(self):
+        return self.cache.get('services', None, self.fetch_services)
+
+    def fetch_services(self):
         logger.debug("getting services")
         proc = self.shell.exec("cf services")
         contents = self.shell.stdout_to_s(proc)
@@ -301,6 +400,9 @@ class CloudFoundry:
         return services
 
     def oauth_token(self):
+        return self.token_provider.token()
+
+    def fetch_oauth_token(self):
         logger.debug("getting oauth-token")
         proc = self.shell.exec("cf oauth-token")
         contents = self.shell.stdout_to_s(proc)
@@ -309,8 +411,24 @@ class CloudFoundry:
             return None
         return contents.rstrip('\n')
 
+    def space_guid(self):
+        proc = self.shell.exec("cf space %s --guid" % self.deployer_config.space)
+        if proc.returncode:
+            raise RuntimeError("Unable to get the guid of space %s" % self.deployer_config.space)
+        return self.shell.stdout_to_s(proc).strip()
+
+    def curl(self, path):
+        proc = self.shell.exec("cf curl '%s'" % path)
+        if proc.returncode:
+            raise RuntimeError("cf curl %s failed: %s" % (path, self.shell.stdout_to_s(proc)))
+        response = json.loads(self.shell.stdout_to_s(proc))
+        if response.get('errors'):
+            raise RuntimeError("cf curl %s failed: %s" % (path, json.dumps(response['errors'])))
+        return response
+
     def create_space(self, space):
         logger.info("creating space %s" % space)
-        proc = self.shell.exec("cf create-space %s" % space)
+        with self.cache.invalidating('target'):
+            proc = self.shell.exec("cf create-space %s" % space)
         if proc.returncode:
             raise RuntimeError("Unable to create space %s" % space)
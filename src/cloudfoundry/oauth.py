@@ -0,0 +1,116 @@
+__copyright__ = '''
+Copyright 2022 the original author or authors.
+  Licensed under the Apache License, Version 2.0 (the "License");
+  you may not use this file except in compliance with the License.
+  You may obtain a copy of the License at
+      http://www.apache.org/licenses/LICENSE-2.0
+  Unless required by applicable law or agreed to in writing, software
+  distributed under the License is distributed on an "AS IS" BASIS,
+  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+  See the License for the specific language governing permissions and
+  limitations under the License.
+'''
+
+__author__ = 'David Turanski'
+
+import base64
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+
+def jwt_expiry(token):
+    """
+    Returns the 'exp' claim, in epoch seconds, of a (possibly 'bearer ' prefixed) JWT, or None if it can't be decoded.
+    The signature is not verified, the token is only inspected to know when to refresh it.
+    """
+    try:
+        jwt = token.split(' ')[-1]
+        payload = jwt.split('.')[1]
+        claims = json.loads(base64.urlsafe_b64decode(payload + '=' * (-len(payload) % 4)))
+        return int(claims['exp'])
+    except (IndexError, KeyError, TypeError, ValueError):
+        return None
+
+
+def token_cache_path(cache_dir, api_endpoint, username):
+    # One token per CF target and user, the file name doesn't expose either.
+    key = hashlib.sha256(('%s|%s' % (api_endpoint, username)).encode()).hexdigest()
+    return os.path.join(cache_dir, key + '.json')
+
+
+class TokenProvider(requests.auth.AuthBase):
+    """
+    Caches an oauth token until shortly before it expires. 'fetch' returns a new token, e.g., from `cf oauth-token`.
+    If cache_path is set, the token is also saved there, so it can be reused by the next run against the same target.
+    A TokenProvider can be passed to requests as 'auth' to set the Authorization header.
+    """
+
+    def __init__(self, fetch, refresh_margin_sec=60, cache_path=None, clock=time.time):
+        self.fetch = fetch
+        self.refresh_margin_sec = refresh_margin_sec
+        self.cache_path = cache_path
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.access_token = None
+        self.expires_at = None
+        self.load()
+
+    def token(self):
+        with self.lock:
+            if not self.is_valid():
+                logger.debug("refreshing oauth-token")
+                token = self.fetch()
+                if not token:
+                    return None
+                self.access_token = token
+                self.expires_at = jwt_expiry(token)
+                self.save()
+            return self.access_token
+
+    def is_valid(self):
+        if not self.access_token:
+            return False
+        # A token that is not a JWT is kept until invalidated.
+        return self.expires_at is None or self.clock() < self.expires_at - self.refresh_margin_sec
+
+    def invalidate(self):
+        with self.lock:
+            self.access_token = None
+            self.expires_at = None
+            if self.cache_path and os.path.exists(self.cache_path):
+                os.remove(self.cache_path)
+
+    def load(self):
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return
+        try:
+            with open(self.cache_path) as file:
+                cached = json.load(file)
+            self.access_token = cached['access_token']
+            self.expires_at = cached.get('expires_at')
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning("ignoring oauth-token cache %s: %s" % (self.cache_path, str(e)))
+
+    def save(self):
+        if not self.cache_path:
+            return
+        Path(self.cache_path).parent.mkdir(parents=True, exist_ok=True)
+        # The token is a credential, only the owner may read it
+        fd = os.open(self.cache_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as file:
+            json.dump({'access_token': self.access_token, 'expires_at': self.expires_at}, file)
+
+    def __call__(self, r):
+        token = self.token()
+        if token:
+            r.headers['Authorization'] = token
+        return r
@@ -0,0 +1,102 @@
+__copyright__ = '''
+Copyright 2022 the original author or authors.
+  Licensed under the Apache License, Version 2.0 (the "License");
+  you may not use this file except in compliance with the License.
+  You may obtain a copy of the License at
+      http://www.apache.org/licenses/LICENSE-2.0
+  Unless required by applicable law or agreed to in writing, software
+  distributed under the License is distributed on an "AS IS" BASIS,
+  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+  See the License for the specific language governing permissions and
+  limitations under the License.
+'''
+
+__author__ = 'David Turanski'
+
+import logging
+import os
+
+from cloudfoundry.platform.config.preset import PresetConfig
+
+logger = logging.getLogger(__name__)
+
+'''
+Binder performance settings for the stream apps, set by dataflow as common stream application properties. A named
+preset provides the settings, and each one can be overridden by an environment variable, e.g., KAFKA_LINGER_MS=5.
+'''
+
+
+class BinderPerformanceConfig(PresetConfig):
+    stream_properties_key = 'spring.cloud.dataflow.applicationProperties.stream.'
+    # Defined by subclasses
+    binder = None
+
+    @classmethod
+    def description(cls):
+        return '%s binder settings' % cls.binder
+
+    @classmethod
+    def from_env_vars(cls, env=os.environ):
+        config = super().from_env_vars(env)
+        return config if config.settings else None
+
+    def application_properties(self):
+        return self.properties_for(self.stream_properties_key)
+
+
+class KafkaPerformanceConfig(BinderPerformanceConfig):
+    binder = 'kafka'
+    prefix = 'KAFKA_'
+    preset_key = prefix + 'PERFORMANCE_PRESET'
+    properties = {
+        'batch_size': 'spring.cloud.stream.kafka.binder.producerProperties.batch.size',
+        'linger_ms': 'spring.cloud.stream.kafka.binder.producerProperties.linger.ms',
+        'compression_type': 'spring.cloud.stream.kafka.binder.producerProperties.compression.type',
+        'fetch_min_bytes': 'spring.cloud.stream.kafka.binder.consumerProperties.fetch.min.bytes',
+        'max_poll_records': 'spring.cloud.stream.kafka.binder.consumerProperties.max.poll.records',
+        'min_partition_count': 'spring.cloud.stream.kafka.binder.minPartitionCount',
+        'concurrency': 'spring.cloud.stream.default.consumer.concurrency'
+    }
+    # The concurrency does not exceed the partition count, so no consumer thread is idle
+    presets = {
+        'throughput': {'batch_size': 131072, 'linger_ms': 20, 'compression_type': 'lz4', 'fetch_min_bytes': 65536,
+                       'max_poll_records': 1000, 'min_partition_count': 4, 'concurrency': 4},
+        'latency': {'batch_size': 16384, 'linger_ms': 0, 'compression_type': 'none', 'fetch_min_bytes': 1,
+                    'max_poll_records': 100, 'min_partition_count': 1, 'concurrency': 1}
+    }
+
+
+class RabbitPerformanceConfig(BinderPerformanceConfig):
+    binder = 'rabbit'
+    prefix = 'RABBIT_'
+    preset_key = prefix + 'PERFORMANCE_PRESET'
+    properties = {
+        'prefetch': 'spring.cloud.stream.rabbit.default.consumer.prefetch',
+        'concurrency': 'spring.cloud.stream.default.consumer.concurrency',
+        'max_concurrency': 'spring.cloud.stream.rabbit.default.consumer.maxConcurrency',
+        'transacted': 'spring.cloud.stream.rabbit.default.consumer.transacted',
+        # Consumer batches are only delivered to apps with batch mode consumers
+        'consumer_batching': 'spring.cloud.stream.rabbit.default.consumer.enableBatching',
+        'consumer_batch_size': 'spring.cloud.stream.rabbit.default.consumer.batchSize',
+        # Producer batches are split by any consumer
+        'producer_batching': 'spring.cloud.stream.rabbit.default.producer.batchingEnabled',
+        'producer_batch_size': 'spring.cloud.stream.rabbit.default.producer.batchSize',
+        'compress': 'spring.cloud.stream.rabbit.default.producer.compress'
+    }
+    presets = {
+        'throughput': {'prefetch': 250, 'concurrency': 2, 'max_concurrency': 4, 'transacted': 'false',
+                       'producer_batching': 'true', 'producer_batch_size': 100},
+        'latency': {'prefetch': 10, 'concurrency': 1, 'max_concurrency': 2, 'transacted': 'false',
+                    'producer_batching': 'false'}
+    }
+
+
+binder_performance_configs = {config.binder: config for config in [KafkaPerformanceConfig, RabbitPerformanceConfig]}
+
+
+def binder_performance_config(binder, env=os.environ):
+    """
+    Returns the performance config for the binder, or None if there are no settings.
+    """
+    config = binder_performance_configs.get(binder)
+    return config.from_env_vars(env) if config else None
@@ -33,7 +33,11 @@ class ConfigurationProperties(EnvironmentAware):
             'max_retries': lambda x: int(x),
             'maven_repos': lambda x: json.loads(x),
             'task_services': lambda x: x.split(','),
-            'stream_services': lambda x: x.split(',')
+            'stream_services': lambda x: x.split(','),
+            'token_cache_enabled': lambda x: x.lower() in ['true', 'y', 'yes'],
+            'cf_read_cache_enabled': lambda x: x.lower() in ['true', 'y', 'yes'],
+            'fast_start_enabled': lambda x: x.lower() in ['true', 'y', 'yes'],
+            'cf_home_isolated': lambda x: x.lower() in ['true', 'y', 'yes']
         })
         config = ConfigurationProperties(**kwargs)
         return config
@@ -55,7 +59,14 @@ class ConfigurationProperties(EnvironmentAware):
                  stream_services=['rabbit'],
                  task_apps_uri='https://dataflow.spring.io/task-maven-latest',
                  cert_host=None,
-                 service_key_name='scdf_cf_setup'
+                 service_key_name='scdf_cf_setup',
+                 cache_dir='~/.scdf_cf_setup',
+                 token_cache_enabled=False,
+                 cf_read_cache_enabled=False,
+                 cf_home=None,
+                 cf_home_isolated=False,
+                 work_dir='.',
+                 fast_start_enabled=False
                  ):
         self.platform = platform
         self.binder = binder
@@ -74,8 +85,26 @@ class ConfigurationProperties(EnvironmentAware):
         self.task_apps_uri = task_apps_uri
         self.cert_host = cert_host
         self.service_key_name = service_key_name
+        # Local state kept between runs, e.g., resolved maven artifacts
+        self.cache_dir = cache_dir
+        # Reuse the oauth token between runs, until it expires
+        self.token_cache_enabled = token_cache_enabled
+        # Reuse cf query results (target, services, service keys, apps) for a few seconds
+        self.cf_read_cache_enabled = cf_read_cache_enabled
+        # The cf cli config directory, ~/.cf by default
+        self.cf_home = cf_home
+        # If CF_HOME is not set, log in with a temporary cf cli config, so concurrent installs don't share a target
+        self.cf_home_isolated = cf_home_isolated
+        # Where generated files, e.g. manifests and trust-stores, are written. Use a different one for each concurrent
+        # install.
+        self.work_dir = work_dir
+        # Trade the servers' peak performance for a shorter startup, see manifest.util.fast_start_env()
+        self.fast_start_enabled = fast_start_enabled
 
         if self.binder == 'rabbit':
             self.stream_apps_uri = 'https://dataflow.spring.io/rabbitmq-maven-latest'
         elif self.binder == 'kafka':
             self.stream_apps_uri = 'https://dataflow.spring.io/kafka-maven-latest'
+
+    def cache_path(self, name):
+        return os.path.join(os.path.expanduser(self.cache_dir), name)
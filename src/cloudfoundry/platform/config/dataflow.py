@@ -48,6 +48,7 @@ class DataflowConfig(EnvironmentAware):
         self.env = env
         self.validate()
         self.kafka_binder_configuration = {}
+        self.binder_performance_configuration = {}
         self.oracle_configuration = {}
         self.trust_certs_configuration = {}
 
@@ -64,6 +65,7 @@ class DataflowConfig(EnvironmentAware):
                     DataflowConfig.schedules_enabled_key: self.schedules_enabled
                     })
         env.update(self.kafka_binder_configuration)
+        env.update(self.binder_performance_configuration)
         env.update(self.oracle_configuration)
         env.update(self.trust_certs_configuration)
         return env
@@ -98,3 +100,7 @@ class DataflowConfig(EnvironmentAware):
             kafka_binder_key + 'configuration.sasl.mechanism': 'PLAIN'
         }
         self.kafka_binder_configuration = env
+
+    def add_binder_performance_application_properties(self, binder_performance_config):
+        logger.debug('configuring %s binder performance' % binder_performance_config.binder)
+        self.binder_performance_configuration = binder_performance_config.application_properties()
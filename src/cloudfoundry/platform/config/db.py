@@ -23,20 +23,26 @@ logger = logging.getLogger(__name__)
 
 
 class Provider:
-    oracle_keys = ['oracle']
-    postgresql_keys = ['postgresql', 'postgres']
-    all_keys = oracle_keys + postgresql_keys
+    # Maps each supported key to the provider name. Providers are registered by install.db.DBProviders, which the
+    # installer commands import before reading the configuration
+    names = {}
+
+    @classmethod
+    def register(cls, name, aliases=[]):
+        for key in [name] + aliases:
+            cls.names[key] = name
 
     def __init__(self, p):
-        if not p in Provider.all_keys:
+        if not p in Provider.names:
             raise ValueError("provider '%s' is unsupported or missing" % str(p))
         self.p = p
+        self.name = Provider.names[p]
 
     def is_postrgesql(self):
-        return self.p in Provider.postgresql_keys
+        return self.name == 'postgresql'
 
     def is_oracle(self):
-        return self.p in Provider.oracle_keys
+        return self.name == 'oracle'
 
 
 class DBConfig(EnvironmentAware):
@@ -51,6 +57,8 @@ class DBConfig(EnvironmentAware):
     service_name_key = prefix + 'SERVICE_NAME'
     system_username_key = prefix + 'SYSTEM_USERNAME'
     system_password_key = prefix + 'SYSTEM_PASSWORD'
+    probe_warn_latency_ms_key = prefix + 'PROBE_WARN_LATENCY_MS'
+    probe_max_latency_ms_key = prefix + 'PROBE_MAX_LATENCY_MS'
 
     @classmethod
     def assert_required_keys(cls, env):
@@ -81,11 +89,13 @@ class DBConfig(EnvironmentAware):
                         skipper_db_name=env.get(cls.skipper_db_name_key),
                         service_name=env.get(cls.service_name_key),
                         system_username=env.get(cls.system_username_key),
-                        system_password=env.get(cls.system_password_key)
+                        system_password=env.get(cls.system_password_key),
+                        probe_warn_latency_ms=int(env.get(cls.probe_warn_latency_ms_key, 100)),
+                        probe_max_latency_ms=int(env.get(cls.probe_max_latency_ms_key, 1000))
                         )
 
     def __init__(self, host, port, username, password, provider, dataflow_db_name, system_username, system_password,
-                 skipper_db_name=None, service_name=None):
+                 skipper_db_name=None, service_name=None, probe_warn_latency_ms=100, probe_max_latency_ms=1000):
         self.host = host
         self.port = port
         self.username = username
@@ -96,6 +106,9 @@ class DBConfig(EnvironmentAware):
         self.service_name = service_name
         self.system_username = system_username
         self.system_password = system_password
+        # Query round trip latency thresholds for the DB probe
+        self.probe_warn_latency_ms = probe_warn_latency_ms
+        self.probe_max_latency_ms = probe_max_latency_ms
 
         if not self.skipper_db_name:
             self.skipper_db_name = self.dataflow_db_name
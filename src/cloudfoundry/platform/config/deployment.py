@@ -0,0 +1,83 @@
+__copyright__ = '''
+Copyright 2022 the original author or authors.
+  Licensed under the Apache License, Version 2.0 (the "License");
+  you may not use this file except in compliance with the License.
+  You may obtain a copy of the License at
+      http://www.apache.org/licenses/LICENSE-2.0
+  Unless required by applicable law or agreed to in writing, software
+  distributed under the License is distributed on an "AS IS" BASIS,
+  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+  See the License for the specific language governing permissions and
+  limitations under the License.
+'''
+
+__author__ = 'David Turanski'
+
+import logging
+
+from cloudfoundry.platform.config.preset import PresetConfig
+
+logger = logging.getLogger(__name__)
+
+'''
+Cloud Foundry deployer properties for the task and stream apps, written to the deployment block of the dataflow and
+skipper platform accounts. A named preset provides the properties, and each one can be overridden by an environment
+variable, e.g., TASK_DEPLOYMENT_MAXIMUM_CONCURRENT_TASKS=50.
+'''
+
+
+class PlatformDeploymentConfig(PresetConfig):
+    @classmethod
+    def description(cls):
+        return 'deployment settings'
+
+    def deployment(self):
+        return self.properties_for()
+
+
+class TaskDeploymentConfig(PlatformDeploymentConfig):
+    prefix = 'TASK_DEPLOYMENT_'
+    preset_key = prefix + 'PRESET'
+    properties = {
+        'maximum_concurrent_tasks': 'maximumConcurrentTasks',
+        'memory': 'memory',
+        'disk': 'disk',
+        'staging_timeout': 'stagingTimeout',
+        'startup_timeout': 'startupTimeout',
+        # seconds
+        'api_timeout': 'apiTimeout',
+        # milliseconds
+        'status_timeout': 'statusTimeout'
+    }
+    # Many concurrent launches stage and start slower, so they get more time
+    presets = {
+        'high_concurrency': {'maximum_concurrent_tasks': 100, 'memory': '1g', 'disk': '1g', 'staging_timeout': '30m',
+                             'startup_timeout': '10m', 'api_timeout': 600, 'status_timeout': 10000}
+    }
+
+
+class StreamDeploymentConfig(PlatformDeploymentConfig):
+    prefix = 'STREAM_DEPLOYMENT_'
+    preset_key = prefix + 'PRESET'
+    properties = {
+        'memory': 'memory',
+        'disk': 'disk',
+        'instances': 'instances',
+        # port, process or http
+        'health_check': 'healthCheck',
+        # seconds
+        'health_check_timeout': 'healthCheckTimeout',
+        'staging_timeout': 'stagingTimeout',
+        'startup_timeout': 'startupTimeout',
+        # seconds
+        'api_timeout': 'apiTimeout',
+        # milliseconds
+        'status_timeout': 'statusTimeout'
+    }
+    defaults = {'memory': 2048}
+    # Streams with many apps deploy faster with less memory each, and need more time to stage them all
+    presets = {
+        'large_streams': {'memory': 1024, 'disk': 1024, 'instances': 1, 'health_check': 'port',
+                          'health_check_timeout': 120, 'staging_timeout': '30m', 'startup_timeout': '10m',
+                          'api_timeout': 600, 'status_timeout': 10000}
+    }
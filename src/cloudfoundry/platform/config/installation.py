@@ -24,6 +24,9 @@ from cloudfoundry.platform.config.service import CloudFoundryServicesConfig
 from cloudfoundry.platform.config.dataflow import DataflowConfig
 from cloudfoundry.platform.config.skipper import SkipperConfig
 from cloudfoundry.platform.config.kafka import KafkaConfig
+from cloudfoundry.platform.config.binder import binder_performance_config
+from cloudfoundry.platform.config.sizing import ServerSizingConfig
+from cloudfoundry.platform.config.deployment import TaskDeploymentConfig, StreamDeploymentConfig
 
 logger = logging.getLogger(__name__)
 
@@ -38,6 +41,10 @@ class InstallationContext(EnvironmentAware):
         kafka_config = KafkaConfig.from_env_vars(env)
         services_config = CloudFoundryServicesConfig.from_env_vars(env)
         skipper_config = SkipperConfig.from_env_vars(env)
+        sizing_config = ServerSizingConfig.from_env_vars(env)
+        performance_config = binder_performance_config(config_properties.binder, env)
+        task_deployment_config = TaskDeploymentConfig.from_env_vars(env)
+        stream_deployment_config = StreamDeploymentConfig.from_env_vars(env)
 
         return InstallationContext(deployer_config=deployer_config,
                                    dataflow_config=dataflow_config,
@@ -46,11 +53,17 @@ class InstallationContext(EnvironmentAware):
                                    kafka_config=kafka_config,
                                    config_props=config_properties,
                                    services_config=services_config,
+                                   sizing_config=sizing_config,
+                                   binder_performance_config=performance_config,
+                                   task_deployment_config=task_deployment_config,
+                                   stream_deployment_config=stream_deployment_config,
                                    env=env
                                    )
 
     def __init__(self, deployer_config, config_props, dataflow_config=None, skipper_config=None, db_config=None,
-                 services_config=None, kafka_config=None, env={}):
+                 services_config=None, kafka_config=None, sizing_config=None,
+                 binder_performance_config=None, task_deployment_config=None, stream_deployment_config=None,
+                 env={}):
         self.deployer_config = deployer_config
         self.dataflow_config = dataflow_config
         self.skipper_config = skipper_config
@@ -58,6 +71,11 @@ class InstallationContext(EnvironmentAware):
         self.config_props = config_props
         self.db_config = db_config
         self.kafka_config = kafka_config
+        self.sizing_config = sizing_config if sizing_config else ServerSizingConfig()
+        self.binder_performance_config = binder_performance_config
+        self.task_deployment_config = task_deployment_config if task_deployment_config else TaskDeploymentConfig()
+        self.stream_deployment_config = stream_deployment_config if stream_deployment_config else \
+            StreamDeploymentConfig()
         """
         Set during external db initialization, if db_config is present. Otherwise must configure default sql service.
         """
@@ -83,6 +101,9 @@ class InstallationContext(EnvironmentAware):
                 logger.warning('removing rabbit from stream services for Kafka binder')
                 self.config_props.stream_services.remove('rabbit')
 
+        if self.dataflow_config.streams_enabled and self.binder_performance_config:
+            self.dataflow_config.add_binder_performance_application_properties(self.binder_performance_config)
+
         if self.dataflow_config.tasks_enabled and self.db_config and self.db_config.provider == 'oracle':
             self.dataflow_config.add_oracle_application_properties()
 
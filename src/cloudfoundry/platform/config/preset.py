@@ -0,0 +1,72 @@
+__copyright__ = '''
+Copyright 2022 the original author or authors.
+  Licensed under the Apache License, Version 2.0 (the "License");
+  you may not use this file except in compliance with the License.
+  You may obtain a copy of the License at
+      http://www.apache.org/licenses/LICENSE-2.0
+  Unless required by applicable law or agreed to in writing, software
+  distributed under the License is distributed on an "AS IS" BASIS,
+  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+  See the License for the specific language governing permissions and
+  limitations under the License.
+'''
+
+__author__ = 'David Turanski'
+
+import logging
+import os
+
+from cloudfoundry.platform.config.environment import EnvironmentAware
+
+logger = logging.getLogger(__name__)
+
+'''
+Settings provided by a named preset, each of which can be overridden by an environment variable named by the prefix
+and the upper case setting name.
+'''
+
+
+class PresetConfig(EnvironmentAware):
+    # Defined by subclasses
+    prefix = None
+    preset_key = None
+    # setting name -> property
+    properties = {}
+    # settings used without a preset or override
+    defaults = {}
+    # preset name -> {setting name: value}
+    presets = {}
+
+    @classmethod
+    def description(cls):
+        return 'settings'
+
+    @classmethod
+    def from_env_vars(cls, env=os.environ):
+        preset = env.get(cls.preset_key)
+        if preset and preset not in cls.presets:
+            raise ValueError("%s must be one of %s" % (cls.preset_key, str(list(cls.presets.keys()))))
+        settings = dict(cls.presets[preset]) if preset else {}
+        for setting in cls.properties.keys():
+            val = env.get(cls.prefix + setting.upper())
+            if val:
+                settings[setting] = val
+        logger.debug("%s preset %s, settings %s" % (cls.description(), preset, str(settings)))
+        return cls(preset=preset, settings=settings)
+
+    def __init__(self, preset=None, settings={}):
+        self.preset = preset
+        self.settings = dict(self.defaults)
+        self.settings.update(settings)
+        self.validate()
+
+    def validate(self):
+        unknown = [setting for setting in self.settings.keys() if setting not in self.properties]
+        if unknown:
+            raise ValueError("unknown %s %s" % (self.description(), str(unknown)))
+
+    def properties_for(self, settings_key=''):
+        """
+        Maps each setting to its property, prefixed by settings_key.
+        """
+        return {settings_key + self.properties[setting]: value for setting, value in self.settings.items()}
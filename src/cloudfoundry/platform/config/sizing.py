@@ -0,0 +1,106 @@
+__copyright__ = '''
+Copyright 2022 the original author or authors.
+  Licensed under the Apache License, Version 2.0 (the "License");
+  you may not use this file except in compliance with the License.
+  You may obtain a copy of the License at
+      http://www.apache.org/licenses/LICENSE-2.0
+  Unless required by applicable law or agreed to in writing, software
+  distributed under the License is distributed on an "AS IS" BASIS,
+  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+  See the License for the specific language governing permissions and
+  limitations under the License.
+'''
+
+__author__ = 'David Turanski'
+
+import logging
+import os
+
+import yaml
+
+from cloudfoundry.platform.config.environment import EnvironmentAware
+
+logger = logging.getLogger(__name__)
+
+'''
+Sizing of the dataflow and skipper servers pushed by the standalone platform. SERVER_SIZING selects a profile, and any
+setting can be overridden per server, e.g., DATAFLOW_SERVER_MEMORY=6G or SKIPPER_SERVER_DB_POOL_SIZE=30.
+'''
+
+
+class ServerSizing(EnvironmentAware):
+    int_keys = ['instances', 'stack_threads', 'max_threads', 'db_pool_size']
+
+    def __init__(self, memory='2G', disk_quota='2G', instances=1, stack_threads=None, max_threads=200,
+                 db_pool_size=10):
+        self.memory = memory
+        self.disk_quota = disk_quota
+        self.instances = instances
+        # The java buildpack memory calculator reserves stack space for this many threads. By default, the tomcat
+        # threads and 50 more.
+        self.stack_threads = stack_threads if stack_threads else max_threads + 50
+        self.max_threads = max_threads
+        self.db_pool_size = db_pool_size
+        self.validate()
+
+    def validate(self):
+        for key in self.int_keys:
+            if getattr(self, key) < 1:
+                raise ValueError("'%s' must be positive" % key)
+
+    def jbp_config_open_jdk_jre(self, jbp_jre_version):
+        """
+        Adds the memory calculator settings to the JBP_CONFIG_OPEN_JDK_JRE value, e.g., "{ jre: { version: 1.8.+ }}".
+        """
+        jbp_config = yaml.safe_load(jbp_jre_version) if jbp_jre_version else {}
+        jbp_config.setdefault('memory_calculator', {})['stack_threads'] = self.stack_threads
+        return yaml.safe_dump(jbp_config, default_flow_style=True).strip()
+
+    def as_env(self):
+        return {'SERVER_TOMCAT_THREADS_MAX': self.max_threads,
+                'SPRING_DATASOURCE_HIKARI_MAXIMUM_POOL_SIZE': self.db_pool_size}
+
+
+class ServerSizingConfig(EnvironmentAware):
+    profile_key = 'SERVER_SIZING'
+    servers = {'dataflow': 'DATAFLOW_SERVER_', 'skipper': 'SKIPPER_SERVER_'}
+    # 'custom' starts from the medium settings, and is meant to be completed with overrides.
+    # Skipper keeps its release state in memory while deploying, so it is never scaled out.
+    profiles = {
+        'small': {
+            'dataflow': {'memory': '1G', 'disk_quota': '1G', 'instances': 1, 'max_threads': 50, 'db_pool_size': 5},
+            'skipper': {'memory': '1G', 'disk_quota': '1G', 'instances': 1, 'max_threads': 50, 'db_pool_size': 5}
+        },
+        'medium': {
+            'dataflow': {'memory': '2G', 'disk_quota': '2G', 'instances': 1, 'max_threads': 200, 'db_pool_size': 10},
+            'skipper': {'memory': '2G', 'disk_quota': '2G', 'instances': 1, 'max_threads': 200, 'db_pool_size': 10}
+        },
+        'large': {
+            'dataflow': {'memory': '4G', 'disk_quota': '2G', 'instances': 2, 'max_threads': 400, 'db_pool_size': 20},
+            'skipper': {'memory': '4G', 'disk_quota': '2G', 'instances': 1, 'max_threads': 400, 'db_pool_size': 20}
+        }
+    }
+    profiles['custom'] = profiles['medium']
+
+    @classmethod
+    def from_env_vars(cls, env=os.environ):
+        profile = env.get(cls.profile_key, 'medium')
+        if profile not in cls.profiles:
+            raise ValueError("%s must be one of %s" % (cls.profile_key, str(list(cls.profiles.keys()))))
+        sizing = {}
+        for server, prefix in cls.servers.items():
+            kwargs = dict(cls.profiles[profile][server])
+            for key in ['memory', 'disk_quota'] + ServerSizing.int_keys:
+                val = env.get(prefix + key.upper())
+                if val:
+                    kwargs[key] = int(val) if key in ServerSizing.int_keys else val
+            sizing[server] = ServerSizing(**kwargs)
+        logger.debug("server sizing profile %s" % profile)
+        return ServerSizingConfig(profile=profile, **sizing)
+
+    def __init__(self, profile='medium', dataflow=None, skipper=None):
+        self.profile = profile
+        self.dataflow = dataflow if dataflow else ServerSizing(**self.profiles[profile]['dataflow'])
+        self.skipper = skipper if skipper else ServerSizing(**self.profiles[profile]['skipper'])
+        if self.skipper.instances > 1:
+            raise ValueError("%sINSTANCES must be 1, skipper cannot be scaled out" % self.servers['skipper'])
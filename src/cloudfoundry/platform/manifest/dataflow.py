@@ -14,8 +14,10 @@ Copyright 2022 the original author or authors.
 __author__ = 'David Turanski'
 
 import logging
+import os
 import random
-from cloudfoundry.platform.manifest.util import format_saj, spring_application_json, format_yaml_list, format_env
+from cloudfoundry.platform.manifest.util import format_saj, spring_application_json, format_yaml_list, format_env, \
+    fast_start_env, fast_start_health_check
 from string import Template
 
 logger = logging.getLogger(__name__)
@@ -25,19 +27,22 @@ manifest_template = '''
 applications:
 - name: $application_name
   host: $host_name
-  memory: 2G
-  disk_quota: 2G
-  instances: 1
+  memory: $memory
+  disk_quota: $disk_quota
+  instances: $instances
   buildpack: $buildpack
   path: $path
+  $health_check
 
   env:
     SPRING_PROFILES_ACTIVE: cloud
     JBP_CONFIG_SPRING_AUTO_RECONFIGURATION: '{enabled: false}'
-    JBP_CONFIG_OPEN_JDK_JRE: '$jbp_jre_version'   
+    JBP_CONFIG_OPEN_JDK_JRE: '$jbp_config_open_jdk_jre'   
     SPRING_APPLICATION_NAME: $application_name
     SPRING_CLOUD_SKIPPER_CLIENT_SERVER_URI: '$skipper_uri'
     $datasource_config
+    $sizing_config
+    $fast_start_config
     $app_config
     $top_level_deployer_properties
     $spring_application_json
@@ -51,12 +56,14 @@ def create_manifest(installation, application_name='dataflow-server', params={})
     config_props = installation.config_props
     jar_path = config_props.dataflow_jar_path
     deployer_config = installation.deployer_config
-    app_deployment = {'services': config_props.task_services}
+    app_deployment = installation.task_deployment_config.deployment()
+    app_deployment['services'] = config_props.task_services
     if dataflow_config.schedules_enabled:
         app_deployment['scheduler-url'] = installation.deployer_config.scheduler_url
     server_services = [installation.services_config.get('sql').name] if installation.services_config.get('sql') else []
     excluded_deployer_props = deployer_config.required_keys
     excluded_deployer_props.extend([deployer_config.skip_ssl_validation_key])
+    sizing = installation.sizing_config.dataflow
     template = Template(manifest_template)
     logger.info('creating manifest for application %s using jar path %s' % (application_name, jar_path))
     saj = format_saj(spring_application_json(installation, app_deployment,
@@ -67,9 +74,17 @@ def create_manifest(installation, application_name='dataflow-server', params={})
         'application_name': application_name,
         'host_name': "%s-%d" % (application_name, random.randint(0, 1000)),
         'buildpack': installation.config_props.buildpack,
-        'path': jar_path,
+        # The manifest may not be in the current directory
+        'path': os.path.abspath(jar_path),
         'skipper_uri': params.get('skipper_uri'),
-        'jbp_jre_version': installation.config_props.jbp_jre_version,
+        'memory': sizing.memory,
+        'disk_quota': sizing.disk_quota,
+        'instances': sizing.instances,
+        'jbp_config_open_jdk_jre': sizing.jbp_config_open_jdk_jre(installation.config_props.jbp_jre_version),
+        'sizing_config': format_env(sizing.as_env()),
+        'health_check': fast_start_health_check() if config_props.fast_start_enabled else '',
+        'fast_start_config': format_env(fast_start_env(lazy_initialization=True)) if config_props.fast_start_enabled
+        else '',
         'datasource_config': format_env(datasource_config.as_env()),
         'app_config': format_env(app_config),
         'top_level_deployer_properties': format_env(
@@ -14,9 +14,11 @@ Copyright 2022 the original author or authors.
 __author__ = 'David Turanski'
 
 import logging
+import os
 import random
 from string import Template
-from cloudfoundry.platform.manifest.util import format_saj, spring_application_json, format_yaml_list, format_env
+from cloudfoundry.platform.manifest.util import format_saj, spring_application_json, format_yaml_list, format_env, \
+    fast_start_env, fast_start_health_check
 from install.util import masked
 
 logger = logging.getLogger(__name__)
@@ -26,19 +28,22 @@ manifest_template = '''
 applications:
 - name: $application_name
   host: $host_name
-  memory: 2G
-  disk_quota: 2G
-  instances: 1
+  memory: $memory
+  disk_quota: $disk_quota
+  instances: $instances
   buildpack: $buildpack
   path: $path
+  $health_check
 
   env:
     SPRING_PROFILES_ACTIVE: cloud
     JBP_CONFIG_SPRING_AUTO_RECONFIGURATION: '{enabled: false}'    
     SPRING_APPLICATION_NAME: $application_name
-    JBP_JRE_VERSION: '$jbp_jre_version'
+    JBP_CONFIG_OPEN_JDK_JRE: '$jbp_config_open_jdk_jre'
     $app_config
     $datasource_config
+    $sizing_config
+    $fast_start_config
     $top_level_deployer_properties
     $spring_application_json
   $services
@@ -51,25 +56,34 @@ def create_manifest(installation, application_name='skipper-server', params={}):
     config_props = installation.config_props
     jar_path = config_props.skipper_jar_path
     server_services = [installation.services_config.get('sql').name] if installation.services_config.get('sql') else []
-    app_deployment = {'services': config_props.stream_services,
-                      'deleteRoutes': False,
-                      'enableRandomAppNamePrefix': False,
-                      'memory': 2048
-                      }
+    app_deployment = installation.stream_deployment_config.deployment()
+    app_deployment.update({'services': config_props.stream_services,
+                           'deleteRoutes': False,
+                           'enableRandomAppNamePrefix': False
+                           })
     deployer_config = installation.deployer_config
     excluded_deployer_props = deployer_config.required_keys
     excluded_deployer_props.extend([deployer_config.skip_ssl_validation_key, deployer_config.scheduler_url_key])
     app_config = installation.skipper_config.as_env()
     saj = format_saj(spring_application_json(installation, app_deployment,
                                              'spring.cloud.skipper.server.platform.cloudfoundry.accounts'))
+    sizing = installation.sizing_config.skipper
     template = Template(manifest_template)
     return template.substitute({
         'application_name': application_name,
         'host_name': "%s-%d" % (application_name, random.randint(0, 1000)),
         'buildpack': installation.config_props.buildpack,
-        'path': jar_path,
+        # The manifest may not be in the current directory
+        'path': os.path.abspath(jar_path),
         'app_config': format_env(app_config),
-        'jbp_jre_version': installation.config_props.jbp_jre_version,
+        'memory': sizing.memory,
+        'disk_quota': sizing.disk_quota,
+        'instances': sizing.instances,
+        'jbp_config_open_jdk_jre': sizing.jbp_config_open_jdk_jre(installation.config_props.jbp_jre_version),
+        'sizing_config': format_env(sizing.as_env()),
+        'health_check': fast_start_health_check() if config_props.fast_start_enabled else '',
+        'fast_start_config': format_env(fast_start_env(lazy_initialization=False)) if config_props.fast_start_enabled
+        else '',
         'datasource_config': format_env(datasource_config.as_env()),
         'top_level_deployer_properties': format_env(
             installation.deployer_config.as_env(excluded=excluded_deployer_props)),
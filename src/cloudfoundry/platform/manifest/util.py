@@ -30,6 +30,26 @@ def spring_application_json(installation, app_deployment, platform_accounts_key)
     return saj
 
 
+def fast_start_env(lazy_initialization):
+    """
+    JVM and Spring Boot settings to start a server faster: C1 compilation only, and optionally lazy bean
+    initialization. Skipper initializes eagerly, so its deployment state machine is ready before the first stream is
+    deployed.
+    """
+    env = {'JBP_CONFIG_JAVA_OPTS': "'{ from_environment: true, java_opts: \"-XX:TieredStopAtLevel=1\" }'",
+           'MANAGEMENT_ENDPOINT_HEALTH_PROBES_ENABLED': 'true'}
+    if lazy_initialization:
+        env['SPRING_MAIN_LAZY_INITIALIZATION'] = 'true'
+    return env
+
+
+def fast_start_health_check(indent=2):
+    """
+    The app is healthy once its readiness probe is up, rather than when it opens a port.
+    """
+    return "health-check-type: http\n%shealth-check-http-endpoint: /actuator/health/readiness" % (' ' * indent)
+
+
 def format_saj(application_json):
     saj = ''
     for k, v in application_json.items():
@@ -0,0 +1,463 @@
+__copyright__ = '''
+Copyright 2022 the original author or authors.
+  Licensed under the Apache License, Version 2.0 (the "License");
+  you may not use this file except in compliance with the License.
+  You may obtain a copy of the License at
+      http://www.apache.org/licenses/LICENSE-2.0
+  Unless required by applicable law or agreed to in writing, software
+  distributed under the License is distributed on an "AS IS" BASIS,
+  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+  See the License for the specific language governing permissions and
+  limitations under the License.
+'''
+
+__author__ = 'David Turanski'
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import xml.etree.ElementTree as ElementTree
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+import requests
+
+from install.http_client import HttpClient
+
+logger = logging.getLogger(__name__)
+
+
+class MavenArtifact:
+    """
+    Maven coordinates, as used in a maven:// app registration uri: groupId:artifactId[:extension[:classifier]]:version
+    """
+
+    @classmethod
+    def parse(cls, uri):
+        coordinates = uri.replace('maven://', '', 1)
+        parts = coordinates.split(':')
+        if len(parts) == 3:
+            return MavenArtifact(group_id=parts[0], artifact_id=parts[1], version=parts[2])
+        if len(parts) == 4:
+            return MavenArtifact(group_id=parts[0], artifact_id=parts[1], extension=parts[2], version=parts[3])
+        if len(parts) == 5:
+            return MavenArtifact(group_id=parts[0], artifact_id=parts[1], extension=parts[2], classifier=parts[3],
+                                 version=parts[4])
+        raise ValueError("invalid maven coordinates %s" % uri)
+
+    def __init__(self, group_id, artifact_id, version, extension='jar', classifier=None):
+        self.group_id = group_id
+        self.artifact_id = artifact_id
+        self.version = version
+        self.extension = extension
+        self.classifier = classifier
+        self.validate()
+
+    def validate(self):
+        if not self.group_id:
+            raise ValueError("'group_id' is required")
+        if not self.artifact_id:
+            raise ValueError("'artifact_id' is required")
+        if not self.version:
+            raise ValueError("'version' is required")
+
+    def is_snapshot(self):
+        return self.version.endswith('-SNAPSHOT')
+
+    def directory(self):
+        return '%s/%s/%s' % (self.group_id.replace('.', '/'), self.artifact_id, self.version)
+
+    def file_name(self, version=None):
+        classifier = '-' + self.classifier if self.classifier else ''
+        return '%s-%s%s.%s' % (self.artifact_id, version if version else self.version, classifier, self.extension)
+
+    def path(self):
+        return '%s/%s' % (self.directory(), self.file_name())
+
+    def metadata_path(self):
+        return '%s/maven-metadata.xml' % self.directory()
+
+    def __str__(self):
+        classifier = ':' + self.classifier if self.classifier else ''
+        return '%s:%s:%s%s:%s' % (self.group_id, self.artifact_id, self.extension, classifier, self.version)
+
+    def __eq__(self, other):
+        return isinstance(other, MavenArtifact) and str(self) == str(other)
+
+    def __hash__(self):
+        return hash(str(self))
+
+
+def repo_url(repo, path):
+    return '%s/%s' % (repo.rstrip('/'), path)
+
+
+class MavenResolver:
+    """
+    Checks that maven artifacts exist in any of the configured remote repositories, using concurrent HEAD requests
+    over pooled connections. A SNAPSHOT is resolved by its version's maven-metadata.xml, since a repository may only
+    serve timestamped snapshot jars. Released artifacts that were found are cached in 'cache_path', if provided, and
+    are not checked again. A SNAPSHOT can be removed from a repository, so it is always checked.
+    """
+
+    def __init__(self, maven_repos, cache_path=None, max_workers=8, timeout=10, session=None):
+        if not maven_repos:
+            raise ValueError("'maven_repos' is required")
+        self.maven_repos = maven_repos
+        self.cache_path = cache_path
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.session = session if session else HttpClient(pool_size=max_workers)
+        self.resolved = self.load_cache()
+
+    def resolve(self, artifact):
+        """
+        Returns the url of the first repository containing the artifact, or None.
+        """
+        cached = None if artifact.is_snapshot() else self.resolved.get(str(artifact))
+        if cached:
+            return cached
+        path = artifact.metadata_path() if artifact.is_snapshot() else artifact.path()
+        for repo in self.maven_repos.values():
+            url = repo_url(repo, path)
+            try:
+                response = self.session.head(url, allow_redirects=True, timeout=self.timeout)
+                logger.debug("HEAD %s %d" % (url, response.status_code))
+                if response.status_code == 200:
+                    if not artifact.is_snapshot():
+                        self.resolved[str(artifact)] = repo
+                    return repo
+            except requests.RequestException as e:
+                logger.warning("unable to reach %s: %s" % (url, str(e)))
+        return None
+
+    def missing(self, artifacts):
+        """
+        Resolves the artifacts concurrently and returns the ones that do not exist in any repository.
+        """
+        artifacts = list(dict.fromkeys(artifacts))
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            repos = list(executor.map(self.resolve, artifacts))
+        self.save_cache()
+        return [artifact for artifact, repo in zip(artifacts, repos) if not repo]
+
+    def load_cache(self):
+        if self.cache_path and os.path.exists(self.cache_path):
+            try:
+                with open(self.cache_path) as cache:
+                    return json.load(cache)
+            except ValueError:
+                logger.warning("ignoring invalid maven resolver cache %s" % self.cache_path)
+        return {}
+
+    def save_cache(self):
+        if not self.cache_path:
+            return
+        Path(self.cache_path).parent.mkdir(parents=True, exist_ok=True)
+        with open(self.cache_path, 'w') as cache:
+            json.dump(self.resolved, cache, indent=4)
+
+
+def snapshot_version(artifact, metadata):
+    """
+    Returns the timestamped version of the latest SNAPSHOT build from a version's maven-metadata.xml, e.g.
+    2.10.0-20220510.143215-12, or None if the metadata does not include one.
+    """
+    root = ElementTree.fromstring(metadata)
+    for entry in root.findall('./versioning/snapshotVersions/snapshotVersion'):
+        if entry.findtext('extension') == artifact.extension and \
+                (entry.findtext('classifier') or None) == artifact.classifier:
+            return entry.findtext('value')
+    timestamp = root.findtext('./versioning/snapshot/timestamp')
+    build_number = root.findtext('./versioning/snapshot/buildNumber')
+    if timestamp and build_number:
+        return '%s-%s-%s' % (artifact.version.replace('-SNAPSHOT', ''), timestamp, build_number)
+    return None
+
+
+class ArtifactCache:
+    """
+    A local cache of downloaded artifacts, keyed by coordinates and, for a SNAPSHOT, the timestamped version of the
+    latest build. A cached SNAPSHOT is current if the version's maven-metadata.xml still resolves to the same build,
+    so an unchanged artifact costs only the metadata request. If the metadata is not available, a SNAPSHOT is
+    always downloaded.
+    """
+
+    def __init__(self, cache_dir, session=None, timeout=10):
+        if not cache_dir:
+            raise ValueError("'cache_dir' is required")
+        self.cache_dir = cache_dir
+        self.session = session if session else HttpClient()
+        self.timeout = timeout
+
+    def resolved_version(self, repo, artifact):
+        if not artifact.is_snapshot():
+            return artifact.version
+        url = repo_url(repo, artifact.metadata_path())
+        try:
+            response = self.session.get(url, timeout=self.timeout)
+            if response.status_code == 200:
+                return snapshot_version(artifact, response.content)
+            logger.debug("GET %s %d" % (url, response.status_code))
+        except (requests.RequestException, ElementTree.ParseError) as e:
+            logger.warning("unable to resolve snapshot version from %s: %s" % (url, str(e)))
+        return None
+
+    def cached_path(self, artifact, version):
+        return os.path.join(self.cache_dir, artifact.directory(), artifact.file_name(version))
+
+    def fetch(self, repo, artifact, download):
+        """
+        Returns the local path of the artifact in the cache, calling download(url, path) if it is not current.
+        """
+        resolved_version = self.resolved_version(repo, artifact)
+        path = self.cached_path(artifact, resolved_version if resolved_version else artifact.version)
+        if resolved_version and os.path.exists(path):
+            logger.info("%s %s is current in the local cache" % (str(artifact), resolved_version))
+            return path
+
+        url = repo_url(repo, '%s/%s' % (artifact.directory(),
+                                        artifact.file_name(resolved_version if resolved_version else artifact.version)))
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        download_path = path + '.download'
+        download(url, download_path)
+        os.replace(download_path, path)
+        self.evict(artifact, keep=path)
+        return path
+
+    def evict(self, artifact, keep):
+        # Only the latest build of a SNAPSHOT is kept
+        directory = os.path.dirname(keep)
+        for file in os.listdir(directory):
+            file = os.path.join(directory, file)
+            if file not in [keep, keep + '.download']:
+                logger.debug("evicting %s from the local cache" % file)
+                os.remove(file)
+
+
+def install_artifact(cached_path, destination):
+    """
+    Hard links the cached artifact to the destination, or copies it if a link is not possible.
+    """
+    path = Path(destination)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if os.path.lexists(destination):
+        os.remove(destination)
+    try:
+        os.link(cached_path, destination)
+    except OSError:
+        shutil.copyfile(cached_path, destination)
+
+
+DownloadResult = namedtuple('DownloadResult', ['url', 'path', 'size', 'resumed_from', 'elapsed', 'sha1'])
+
+
+class Downloader:
+    """
+    Streams a file to disk in chunks, computing the SHA-1 as it goes and verifying it against the repository's .sha1
+    file, if there is one. A partial file left by an interrupted download is resumed with an HTTP Range request.
+    """
+
+    def __init__(self, session=None, chunk_size=1024 * 1024, timeout=30, progress_interval_sec=10):
+        self.session = session if session else HttpClient()
+        self.chunk_size = chunk_size
+        self.timeout = timeout
+        self.progress_interval_sec = progress_interval_sec
+
+    def download(self, url, path):
+        sha1 = hashlib.sha1()
+        resumed_from = os.path.getsize(path) if os.path.exists(path) else 0
+        headers = {}
+        if resumed_from:
+            with open(path, 'rb') as partial:
+                for chunk in iter(lambda: partial.read(self.chunk_size), b''):
+                    sha1.update(chunk)
+            headers['Range'] = 'bytes=%d-' % resumed_from
+
+        start = time.time()
+        with self.session.get(url, headers=headers, stream=True, timeout=self.timeout) as response:
+            if resumed_from and response.status_code == 416:
+                return self.complete_or_restart(url, path, sha1.hexdigest())
+            elif resumed_from and response.status_code == 206:
+                logger.info("resuming download of %s at %d bytes" % (url, resumed_from))
+                mode = 'ab'
+            elif response.status_code == 200:
+                resumed_from = 0
+                sha1 = hashlib.sha1()
+                mode = 'wb'
+            else:
+                raise RuntimeError('FATAL: Unable to download %s: HTTP status %d' % (url, response.status_code))
+
+            content_length = response.headers.get('Content-Length')
+            total = resumed_from + int(content_length) if content_length else None
+            size = resumed_from
+            last_progress = start
+            with open(path, mode) as file:
+                for chunk in response.iter_content(chunk_size=self.chunk_size):
+                    file.write(chunk)
+                    sha1.update(chunk)
+                    size = size + len(chunk)
+                    now = time.time()
+                    if now - last_progress >= self.progress_interval_sec:
+                        last_progress = now
+                        logger.info("%s %s" % (url, progress(size, total, resumed_from, now - start)))
+
+        elapsed = time.time() - start
+        result = DownloadResult(url=url, path=path, size=size, resumed_from=resumed_from, elapsed=elapsed,
+                                sha1=sha1.hexdigest())
+        self.verify(result)
+        logger.info("downloaded %s %s" % (url, progress(size, total, resumed_from, elapsed)))
+        return result
+
+    def complete_or_restart(self, url, path, partial_sha1):
+        """
+        The server rejects a Range starting at or past the end of the file, so the partial file is either already
+        complete or not a prefix of the remote file. Keep it if it matches the checksum, otherwise download it again.
+        """
+        size = os.path.getsize(path)
+        if self.expected_sha1(url) == partial_sha1:
+            logger.info("%s is already complete at %d bytes" % (url, size))
+            return DownloadResult(url=url, path=path, size=size, resumed_from=size, elapsed=0, sha1=partial_sha1)
+        logger.warning("unable to resume %s at %d bytes, restarting the download" % (url, size))
+        os.remove(path)
+        return self.download(url, path)
+
+    def verify(self, result):
+        expected = self.expected_sha1(result.url)
+        if not expected:
+            logger.warning("no checksum available for %s, skipping verification" % result.url)
+            return
+        if expected != result.sha1:
+            os.remove(result.path)
+            raise RuntimeError("FATAL: checksum mismatch for %s expected sha1 %s but was %s" % (
+                result.url, expected, result.sha1))
+        logger.debug("verified sha1 %s for %s" % (result.sha1, result.url))
+
+    def expected_sha1(self, url):
+        try:
+            response = self.session.get(url + '.sha1', timeout=self.timeout)
+            if response.status_code == 200 and response.text.strip():
+                return response.text.split()[0].lower()
+        except requests.RequestException as e:
+            logger.warning("unable to get checksum %s.sha1: %s" % (url, str(e)))
+        return None
+
+
+def progress(size, total, resumed_from, elapsed):
+    throughput = (size - resumed_from) / elapsed / (1024 * 1024) if elapsed > 0 else 0
+    downloaded = '%.1f MB' % (size / (1024 * 1024))
+    if total:
+        downloaded = '%s of %.1f MB (%d%%)' % (downloaded, total / (1024 * 1024), size * 100 / total)
+    return '%s in %.1f sec %.1f MB/s' % (downloaded, elapsed, throughput)
+
+
+class MavenRepositories:
+    """
+    Fetches artifacts from whichever configured repository responds fastest. Every repository is probed at once and
+    the first to confirm the artifact exists is used. If a fetch fails, the remaining repositories are tried in order
+    of their historical latency. Latency and failures per repository are kept in 'stats_path', if provided.
+    """
+
+    def __init__(self, maven_repos, stats_path=None, session=None, timeout=10):
+        if not maven_repos:
+            raise ValueError("'maven_repos' is required")
+        self.maven_repos = maven_repos
+        self.stats_path = stats_path
+        self.session = session if session else HttpClient(pool_size=len(maven_repos))
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.stats = self.load_stats()
+
+    def probe(self, repo, artifact):
+        path = artifact.metadata_path() if artifact.is_snapshot() else artifact.path()
+        url = repo_url(repo, path)
+        start = time.time()
+        try:
+            response = self.session.head(url, allow_redirects=True, timeout=self.timeout)
+            self.record(repo, time.time() - start)
+            logger.debug("HEAD %s %d in %.3f sec" % (url, response.status_code, time.time() - start))
+            return response.status_code == 200
+        except requests.RequestException as e:
+            self.record(repo, failed=True)
+            logger.warning("unable to reach %s: %s" % (url, str(e)))
+            return False
+
+    def rank(self, artifact):
+        """
+        Returns the repository urls, the fastest one found to contain the artifact first, then the rest by
+        historical latency.
+        """
+        repos = list(dict.fromkeys(self.maven_repos.values()))
+        fastest = None
+        if len(repos) > 1:
+            executor = ThreadPoolExecutor(max_workers=len(repos))
+            futures = {executor.submit(self.probe, repo, artifact): repo for repo in repos}
+            try:
+                for future in as_completed(futures):
+                    if future.result():
+                        fastest = futures[future]
+                        break
+            finally:
+                # Don't wait for slower repositories
+                executor.shutdown(wait=False)
+        ranked = sorted(repos, key=self.mean_latency)
+        if fastest:
+            logger.info("using fastest maven repo %s for %s" % (fastest, str(artifact)))
+            ranked.remove(fastest)
+            ranked.insert(0, fastest)
+        return ranked
+
+    def fetch(self, artifact, fetch):
+        """
+        Calls fetch(repo) for each ranked repository until one succeeds.
+        """
+        errors = []
+        for repo in self.rank(artifact):
+            try:
+                return fetch(repo)
+            except (RuntimeError, OSError, requests.RequestException) as e:
+                self.record(repo, failed=True)
+                logger.warning("unable to fetch %s from %s: %s" % (str(artifact), repo, str(e)))
+                errors.append('%s: %s' % (repo, str(e)))
+            finally:
+                self.save_stats()
+        raise RuntimeError("FATAL: unable to fetch %s from any maven repo:\n%s" % (str(artifact), '\n'.join(errors)))
+
+    def record(self, repo, elapsed=None, failed=False):
+        with self.lock:
+            stats = self.stats.setdefault(repo, {'requests': 0, 'failures': 0, 'mean_latency_sec': None})
+            stats['requests'] = stats['requests'] + 1
+            if failed:
+                stats['failures'] = stats['failures'] + 1
+            elif elapsed is not None:
+                mean = stats['mean_latency_sec']
+                # Exponential moving average, weighted to recent requests
+                stats['mean_latency_sec'] = elapsed if mean is None else 0.7 * mean + 0.3 * elapsed
+
+    def mean_latency(self, repo):
+        stats = self.stats.get(repo)
+        if not stats or stats['mean_latency_sec'] is None:
+            return float('inf')
+        return stats['mean_latency_sec']
+
+    def load_stats(self):
+        if self.stats_path and os.path.exists(self.stats_path):
+            try:
+                with open(self.stats_path) as stats:
+                    return json.load(stats)
+            except ValueError:
+                logger.warning("ignoring invalid maven repo stats %s" % self.stats_path)
+        return {}
+
+    def save_stats(self):
+        if not self.stats_path:
+            return
+        Path(self.stats_path).parent.mkdir(parents=True, exist_ok=True)
+        with self.lock:
+            with open(self.stats_path, 'w') as stats:
+                json.dump(self.stats, stats, indent=4)
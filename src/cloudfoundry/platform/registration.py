@@ -13,6 +13,7 @@ Copyright 2022 the original author or authors.
 
 import logging
 import re
+from collections import OrderedDict, namedtuple
 from string import Template
 from os.path import exists
 import json
@@ -21,7 +22,8 @@ logger = logging.getLogger(__name__)
 
 __author__ = 'David Turanski'
 
-import requests
+from cloudfoundry.platform.maven import MavenArtifact, MavenResolver
+from install.plan import apply_changes, plan_registrations, REGISTER
 
 
 def register_apps(cf, installation, server_uri, app_import_path='app-imports.properties'):
@@ -39,11 +41,35 @@ def register_apps(cf, installation, server_uri, app_import_path='app-imports.pro
     logger.debug("registered apps:\n%s" % json.dumps(app_registrations.apps(), indent=4))
 
 
+def validate_app_imports(installation, app_import_path='app-imports.properties'):
+    """
+    Pre-flight check that every maven:// app in the app imports file exists in one of the configured maven repos.
+    Raises a RuntimeError listing all the missing artifacts.
+    """
+    if not exists(app_import_path):
+        logger.warning("app imports file for additional apps:%s does not exist" % app_import_path)
+        return
+    config_props = installation.config_props
+    parser = AppImportsParser(binder=config_props.binder,
+                              dataflow_version=config_props.dataflow_version or AppRegistrations.DEFAULT_DATAFLOW_VERSION)
+    app_imports = parser.read(app_import_path)
+    app_imports.assert_valid()
+    artifacts = [MavenArtifact.parse(app.uri) for app in app_imports.apps if app.uri.startswith('maven://')]
+    logger.info("verifying %d maven artifacts in %s" % (len(artifacts), app_import_path))
+    resolver = MavenResolver(config_props.maven_repos, cache_path=config_props.cache_path('maven-resolved.json'))
+    missing = resolver.missing(artifacts)
+    if missing:
+        raise RuntimeError("FATAL: the following artifacts in %s do not exist in %s:\n%s" % (
+            app_import_path, str(list(config_props.maven_repos.values())), '\n'.join([str(a) for a in missing])))
+
+
 class AppRegistrations:
     DEFAULT_DATAFLOW_VERSION = '2.10.0-M1'
 
     def __init__(self, cf, config_props, server_uri, app_import_path='app-imports.properties'):
-        self.headers = headers = {'Authorization': cf.oauth_token()}
+        # Sets a current token on each request, long registrations outlive a single token
+        self.auth = cf.token_provider
+        self.http = cf.http
         self.app_import_path = app_import_path
         self.apps_url = "%s/apps" % server_uri
         self.task_apps_uri = config_props.task_apps_uri
@@ -54,48 +80,147 @@ class AppRegistrations:
             logger.warning(
                 "'dataflow_version' is not defined in test configuration - using default: %s" % self.DEFAULT_DATAFLOW_VERSION)
             self.dataflow_version = self.DEFAULT_DATAFLOW_VERSION
+        self.parser = AppImportsParser(binder=self.binder, dataflow_version=self.dataflow_version)
 
     def register_stream_apps(self):
         logger.info("registering stream apps from %s" % self.stream_apps_uri)
-        requests.post(url=self.apps_url, headers=self.headers, params={'uri': self.stream_apps_uri, 'force': True})
+        # The server imports the apps before it responds, which can take longer than any default timeout
+        self.http.post(url=self.apps_url, auth=self.auth, params={'uri': self.stream_apps_uri, 'force': True},
+                       timeout=None)
 
     def register_task_apps(self):
         logger.info("registering task apps from %s" % self.task_apps_uri)
-        requests.post(url=self.apps_url, params={'uri': self.task_apps_uri, 'force': True}, headers=self.headers)
+        self.http.post(url=self.apps_url, params={'uri': self.task_apps_uri, 'force': True}, auth=self.auth,
+                       timeout=None)
 
     def register_test_apps(self):
         logger.info("registering test apps from %s" % self.app_import_path)
         if exists(self.app_import_path):
-            with open(self.app_import_path) as imports:
-                app_registrations = imports.readlines()
-                for app_reg in app_registrations:
-                    if not app_reg.startswith('#') and len(app_reg.rstrip()) > 0:
-                        app_name, app_type, uri, version = self.parse_app(app_reg)
-                        logger.debug("registering app %s" % app_reg)
-                        requests.post(url='%s/%s/%s/%s' % (self.apps_url, app_type, app_name, version),
-                                      headers=self.headers,
-                                      params={'uri': uri, 'force': True})
+            # Only the apps that are not registered yet, or registered with a different uri
+            changes = [change for change in self.plan() if change.action == REGISTER]
+            logger.info("registering %d test apps" % len(changes))
+            apply_changes(changes, lambda change: self.register_app(change.target))
         else:
             logger.warning("app imports file for additional apps:%s does not exist" % self.app_import_path)
 
+    def register_app(self, app):
+        logger.debug("registering app %s.%s=%s" % (app.app_type, app.app_name, app.uri))
+        response = self.http.post(url='%s/%s/%s/%s' % (self.apps_url, app.app_type, app.app_name, app.version),
+                                  auth=self.auth,
+                                  params={'uri': app.uri, 'force': True})
+        if response.status_code >= 400:
+            raise RuntimeError("failed to register %s.%s: %d %s" % (app.app_type, app.app_name,
+                                                                     response.status_code, response.text))
+
+    def plan(self):
+        if not exists(self.app_import_path):
+            return []
+        app_imports = self.parser.read(self.app_import_path)
+        app_imports.assert_valid()
+        registered = self.apps()
+        return plan_registrations(app_imports,
+                                  registered.get('_embedded', {}).get('appRegistrationResourceList', [])
+                                  if registered else [])
+
     def parse_app(self, data):
-        valid_chars = '[a-zA-Z0-9/\_\:\-\$\.]+'
-        pattern = '(%s)\.(%s)=(%s)' % (valid_chars, valid_chars, valid_chars)
-        match = re.match(pattern, data)
-        if match:
-            app_type = match.group(1)
-            app_name = (match.group(2))
-            template = Template(match.group(3))
-            uri = template.substitute({'BINDER': self.binder, 'DATAFLOW_VERSION': self.dataflow_version})
-            version = (uri.split(':')[3])
-            return app_name, app_type, uri, version
-        else:
-            raise ValueError("Unable to parse app registration %s" % data)
+        app = self.parser.parse_line(data)
+        return app.app_name, app.app_type, app.uri, app.version
 
     def apps(self):
-        r = requests.get(url=self.apps_url, headers=self.headers)
+        # All of them in one page
+        r = self.http.get(url=self.apps_url, auth=self.auth, params={'size': 10000})
         if r.status_code != 200:
             logger.error("Unable to get registered apps")
             return None
 
         return r.json()
+
+
+AppImport = namedtuple('AppImport', ['app_type', 'app_name', 'uri', 'version', 'line_number'])
+AppImportDuplicate = namedtuple('AppImportDuplicate', ['key', 'line_number', 'overridden_line_number'])
+AppImportError = namedtuple('AppImportError', ['line_number', 'line', 'message'])
+
+
+class AppImports:
+    """
+    The result of parsing an app imports file: the apps to register, in file order, along with any duplicate and
+    malformed entries found along the way.
+    """
+
+    def __init__(self, path, apps, duplicates, errors):
+        self.path = path
+        self.apps = apps
+        self.duplicates = duplicates
+        self.errors = errors
+
+    def assert_valid(self):
+        for duplicate in self.duplicates:
+            logger.warning("%s line %d: duplicate app registration %s overrides line %d" % (
+                self.path, duplicate.line_number, duplicate.key, duplicate.overridden_line_number))
+        if self.errors:
+            for error in self.errors:
+                logger.error("%s line %d: %s" % (self.path, error.line_number, error.message))
+            raise ValueError("%s contains %d malformed app registration(s)" % (self.path, len(self.errors)))
+
+
+class AppImportsParser:
+    """
+    Parses the app import format '<type>.<name>=<uri>', resolving $BINDER and $DATAFLOW_VERSION in the uri.
+    The version registered is the 4th segment of a maven uri.
+    """
+    valid_chars = r'[a-zA-Z0-9/_:\-$.]+'
+    pattern = re.compile(r'(%s)\.(%s)=(%s)' % (valid_chars, valid_chars, valid_chars))
+
+    def __init__(self, binder, dataflow_version):
+        self.substitutions = {'BINDER': binder, 'DATAFLOW_VERSION': dataflow_version}
+
+    def parse_line(self, data, line_number=0):
+        match = self.pattern.fullmatch(data.strip())
+        if not match:
+            raise ValueError("Unable to parse app registration %s" % data)
+        uri = match.group(3)
+        if '$' in uri:
+            try:
+                uri = Template(uri).substitute(self.substitutions)
+            except (KeyError, ValueError) as e:
+                raise ValueError("Unable to resolve uri %s in app registration %s" % (str(e), data))
+        parts = uri.split(':')
+        if len(parts) < 4:
+            raise ValueError("Unable to determine the version of app registration %s" % data)
+        return AppImport(app_type=match.group(1), app_name=match.group(2), uri=uri, version=parts[3],
+                         line_number=line_number)
+
+    def parse(self, lines):
+        """
+        Generates an AppImport, or an AppImportError if the line is malformed, for each registration in lines.
+        Comments and blank lines are skipped.
+        """
+        for line_number, line in enumerate(lines, start=1):
+            if line.startswith('#') or not line.strip():
+                continue
+            try:
+                yield self.parse_line(line, line_number)
+            except ValueError as e:
+                yield AppImportError(line_number=line_number, line=line.rstrip('\n'), message=str(e))
+
+    def read(self, path):
+        """
+        Streams an app imports file, so the whole file is validated before any apps are registered.
+        The same app registered more than once with the same version is reported as a duplicate and the last entry
+        wins. Registering different versions of the same app is allowed.
+        """
+        apps = OrderedDict()
+        duplicates = []
+        errors = []
+        with open(path) as imports:
+            for entry in self.parse(imports):
+                if isinstance(entry, AppImportError):
+                    errors.append(entry)
+                    continue
+                key = '%s.%s:%s' % (entry.app_type, entry.app_name, entry.version)
+                previous = apps.pop(key, None)
+                if previous:
+                    duplicates.append(AppImportDuplicate(key=key, line_number=entry.line_number,
+                                                         overridden_line_number=previous.line_number))
+                apps[key] = entry
+        return AppImports(path=path, apps=list(apps.values()), duplicates=duplicates, errors=errors)
@@ -28,24 +28,31 @@ Copyright 2022 the original author or authors.
 
 __author__ = 'David Turanski'
 
+import json
 import logging
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 
 import cloudfoundry.platform.manifest.skipper as skipper_manifest
 import cloudfoundry.platform.manifest.dataflow as dataflow_manifest
 
+from cloudfoundry.platform.maven import ArtifactCache, Downloader, MavenArtifact, MavenRepositories, install_artifact
+from install.plan import plan_app, read_app_states, record_app, NONE
 from install.shell import Shell
 from install.util import Poller, wait_for_200
 
 logger = logging.getLogger(__name__)
 
 
-def setup(cf, installation, do_not_download, shell=Shell()):
+def setup(cf, installation, do_not_download, shell=Shell(), db_reset={}):
     """
     :param cf:
     :param installation:
     :param do_not_download:
     :param shell:
+    :param db_reset: the servers whose DB was just reset, mapped to the outcome. They are pushed even if up to date.
     :return:
     """
     poller = Poller(installation.config_props.deploy_wait_sec, installation.config_props.max_retries)
@@ -56,29 +63,37 @@ def setup(cf, installation, do_not_download, shell=Shell()):
         logger.info("downloading jars")
         download_server_jars(installation.config_props, shell)
 
+    apps = read_app_states(cf)
     skipper_uri = None
     if installation.dataflow_config.streams_enabled:
         logger.debug("deploying skipper server")
-        deploy(cf=cf, manifest_path='skipper_manifest.yml',
-               create_manifest=skipper_manifest.create_manifest, application_name='skipper-server',
-               installation=installation, params={})
+        start = time.monotonic()
+        pushed = deploy(cf=cf, manifest_path='skipper_manifest.yml',
+                        create_manifest=skipper_manifest.create_manifest, application_name='skipper-server',
+                        installation=installation, params={}, apps=apps, db_reset=db_reset.get('skipper-server'))
         skipper_app = cf.app('skipper-server')
         # TODO: Try https
         skipper_uri = 'http://%s/api' % skipper_app.route
         logger.debug("waiting for skipper api %s to be live" % skipper_uri)
-        if not wait_for_200(poller, skipper_uri):
+        # The skipper route is http, so the CF token is not sent
+        if not wait_for_200(poller, skipper_uri, http=cf.http):
             raise RuntimeError("skipper server deployment failed")
+        if pushed:
+            record_push_time(installation.config_props, 'skipper-server', time.monotonic() - start)
 
     logger.debug("getting dataflow server url")
     logger.debug("waiting for dataflow server to start")
-    deploy(cf=cf, manifest_path='dataflow_manifest.yml', application_name='dataflow-server',
-           create_manifest=dataflow_manifest.create_manifest, installation=installation,
-           params={'skipper_uri': skipper_uri})
+    start = time.monotonic()
+    pushed = deploy(cf=cf, manifest_path='dataflow_manifest.yml', application_name='dataflow-server',
+                    create_manifest=dataflow_manifest.create_manifest, installation=installation,
+                    params={'skipper_uri': skipper_uri}, apps=apps, db_reset=db_reset.get('dataflow-server'))
 
     dataflow_app = cf.app('dataflow-server')
     dataflow_uri = "https://" + dataflow_app.route
-    if not wait_for_200(poller, dataflow_uri):
+    if not wait_for_200(poller, dataflow_uri, auth=cf.token_provider, http=cf.http):
         raise RuntimeError("dataflow server deployment failed")
+    if pushed:
+        record_push_time(installation.config_props, 'dataflow-server', time.monotonic() - start)
 
     runtime_properties=installation.deployer_config.as_env().copy()
     runtime_properties.update({
@@ -87,50 +102,120 @@ def setup(cf, installation, do_not_download, shell=Shell()):
     return runtime_properties
 
 
-def clean(cf, config):
-    pass
+def stop_servers(cf, installation):
+    cf.stop_app('dataflow-server')
+    if installation.dataflow_config.streams_enabled:
+        cf.stop_app('skipper-server')
 
 
-def deploy(cf, application_name, manifest_path, create_manifest, installation, params={}):
-    manifest = open(manifest_path, 'w')
-    try:
-        mf = create_manifest(installation, application_name=application_name, params=params)
-        manifest.write(mf)
-        manifest.close()
-        cf.push('-f ' + manifest_path)
-    finally:
-        manifest.close()
+def start_servers(cf, installation):
+    poller = Poller(installation.config_props.deploy_wait_sec, installation.config_props.max_retries)
+    if installation.dataflow_config.streams_enabled:
+        cf.start_app('skipper-server')
+        skipper_uri = 'http://%s/api' % cf.app('skipper-server').route
+        if not wait_for_200(poller, skipper_uri, http=cf.http):
+            raise RuntimeError("skipper server failed to restart")
+    cf.start_app('dataflow-server')
+    dataflow_uri = "https://" + cf.app('dataflow-server').route
+    if not wait_for_200(poller, dataflow_uri, auth=cf.token_provider, http=cf.http):
+        raise RuntimeError("dataflow server failed to restart")
 
 
-def download_server_jars(config_props, shell):
-    skipper_url = 'https://repo.spring.io/libs-snapshot/org/springframework/cloud/spring-cloud-skipper-server/%s/spring-cloud-skipper-server-%s.jar' \
-                  % (config_props.skipper_version, config_props.skipper_version)
-    download_maven_jar(skipper_url, config_props.skipper_jar_path, shell)
+def clean(cf, config):
+    pass
 
-    dataflow_url = 'https://repo.spring.io/libs-snapshot/org/springframework/cloud/spring-cloud-dataflow-server/%s/spring-cloud-dataflow-server-%s.jar' \
-                   % (config_props.dataflow_version, config_props.dataflow_version)
-    download_maven_jar(dataflow_url, config_props.dataflow_jar_path, shell)
 
+def plan(cf, installation, apps):
+    changes = []
+    skipper_uri = None
+    if installation.dataflow_config.streams_enabled:
+        changes.append(plan_app(cf, 'skipper-server', skipper_manifest.create_manifest(
+            installation, application_name='skipper-server', params={}), apps))
+        skipper_app = apps.get('skipper-server')
+        if skipper_app and skipper_app.routes:
+            skipper_uri = 'http://%s/api' % skipper_app.routes[0]
+    changes.append(plan_app(cf, 'dataflow-server', dataflow_manifest.create_manifest(
+        installation, application_name='dataflow-server', params={'skipper_uri': skipper_uri}), apps))
+    return changes
+
+
+def deploy(cf, application_name, manifest_path, create_manifest, installation, params={}, apps=None, db_reset=None):
+    """
+    Pushes the app, unless apps, the current app states, shows it is already running with the same manifest and
+    db_reset, the outcome of resetting its DB, is None.
+    Returns True if the app was pushed.
+    """
+    mf = create_manifest(installation, application_name=application_name, params=params)
+    if apps is not None:
+        change = plan_app(cf, application_name, mf, apps, db_reset)
+        if change.action == NONE:
+            logger.info("%s is up to date, %s" % (application_name, change.reason))
+            return False
+        logger.info("pushing %s, %s" % (application_name, change.reason))
+    manifest_path = cf.work_path(manifest_path)
+    with open(manifest_path, 'w') as manifest:
+        manifest.write(mf)
+    cf.push('-f ' + manifest_path)
+    if cf.shell.dry_run:
+        return False
+    record_app(cf, application_name, mf)
+    return True
 
-def download_maven_jar(url, destination, shell):
-    logger.info("downloading jar %s to %s" % (url, destination))
-    from os.path import exists
-    from pathlib import Path
-    path = Path(destination)
 
-    if not exists(path.parent):
-        logger.info("creating directory %s" % path.parent)
-        os.mkdir(path.parent)
+def record_push_time(config_props, application_name, elapsed_sec, clock=time.time):
+    """
+    Appends the time from push to healthy to $CACHE_DIR/push-times.jsonl, and logs the mean times with and without
+    the fast start profile, over all recorded pushes of the app.
+    """
+    path = config_props.cache_path('push-times.jsonl')
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'a') as push_times:
+        push_times.write(json.dumps({'app': application_name, 'fast_start': config_props.fast_start_enabled,
+                                     'elapsed_sec': round(elapsed_sec, 1), 'time': clock()}) + '\n')
+    logger.info("%s was healthy %.1f sec after push (fast start %s)" % (
+        application_name, elapsed_sec, 'enabled' if config_props.fast_start_enabled else 'disabled'))
+    for fast_start, mean_sec, count in push_time_summary(path, application_name):
+        logger.info("%s mean push to healthy time with fast start %s: %.1f sec (%d pushes)" % (
+            application_name, 'enabled' if fast_start else 'disabled', mean_sec, count))
+
+
+def push_time_summary(path, application_name):
+    times = {}
+    if os.path.exists(path):
+        with open(path) as push_times:
+            for line in push_times:
+                entry = json.loads(line)
+                if entry['app'] == application_name:
+                    times.setdefault(entry['fast_start'], []).append(entry['elapsed_sec'])
+    return [(fast_start, sum(elapsed) / len(elapsed), len(elapsed)) for fast_start, elapsed in sorted(times.items())]
 
-    if exists(destination):
-        logger.debug("deleting existing file %s" % destination)
-        os.remove(destination)
 
-    cmd = 'wget %s -q -O %s' % (url, destination)
+def download_server_jars(config_props, shell):
+    if shell.dry_run:
+        logger.info("dry_run: skipping download of server jars")
+        return
+    cache = ArtifactCache(config_props.cache_path('artifacts'))
+    downloader = Downloader()
+    repos = MavenRepositories(config_props.maven_repos, stats_path=config_props.cache_path('maven-repo-stats.json'))
+
+    jars = {config_props.skipper_jar_path: MavenArtifact(group_id='org.springframework.cloud',
+                                                         artifact_id='spring-cloud-skipper-server',
+                                                         version=config_props.skipper_version),
+            config_props.dataflow_jar_path: MavenArtifact(group_id='org.springframework.cloud',
+                                                          artifact_id='spring-cloud-dataflow-server',
+                                                          version=config_props.dataflow_version)}
+    with ThreadPoolExecutor(max_workers=len(jars)) as executor:
+        futures = [executor.submit(download_maven_jar, repos, cache, artifact, destination, downloader)
+                   for destination, artifact in jars.items()]
+        for future in futures:
+            future.result()
+
+
+def download_maven_jar(repos, cache, artifact, destination, downloader):
     try:
-        proc = shell.exec(cmd, capture_output=False)
-        if proc.returncode:
-            raise RuntimeError('FATAL: Unable to download maven artifact %s to %s' % (url, destination))
+        cached_path = repos.fetch(artifact, lambda repo: cache.fetch(repo, artifact, downloader.download))
     except BaseException as e:
         logger.error(e)
         raise e
+    logger.info("installing %s to %s" % (cached_path, destination))
+    install_artifact(cached_path, destination)
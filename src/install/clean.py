@@ -25,6 +25,8 @@ from cloudfoundry.platform.config.dataflow import DataflowConfig
 from cloudfoundry.platform.config.db import DatasourceConfig
 from cloudfoundry.platform.config.deployer import CloudFoundryDeployerConfig
 from install import enable_debug_logging
+# Registers the DB providers, so the configuration can be read
+import install.db
 
 logger = logging.getLogger(__name__)
 
@@ -38,7 +40,7 @@ def cf_config_from_env():
                                dataflow_config=dataflow_config)
 
 
-def clean(args):
+def clean(args, installation=None, cf=None):
     parser = OptionParser()
     parser.usage = "%prog clean options"
 
@@ -52,26 +54,33 @@ def clean(args):
         options, arguments = parser.parse_args(args)
         if options.debug:
             enable_debug_logging()
-        installation = InstallationContext.from_env_vars()
-        cf = CloudFoundry.connect(deployer_config=installation.deployer_config, config_props=installation.config_props)
-        if not options.apps_only:
-            logger.info("deleting current services...")
-            services = cf.services()
-            for service in services:
-                if cf.service_key(service.name, installation.config_props.service_key_name):
-                    cf.delete_service_key(service.name, installation.config_props.service_key_name)
-                cf.delete_service(service.name)
-        else:
-            logger.info("'apps-only' option is set, keeping existing current services")
-        logger.info("cleaning apps")
-        cf.delete_apps()
-        if installation.config_props.platform == "tile":
-            return tile.clean(cf, installation)
-        elif installation.config_props.platform == "cloudfoundry":
-            return standalone.clean(cf, installation)
-        else:
-            logger.error("invalid platform type %s should be in [cloudfoundry,tile]" % installation.config_props.platform)
-
+        installation = installation if installation else InstallationContext.from_env_vars()
+        # A connection made here is closed here, removing its isolated cf home
+        connected = not cf
+        cf = cf if cf else CloudFoundry.connect(deployer_config=installation.deployer_config,
+                                                config_props=installation.config_props)
+        try:
+            if not options.apps_only:
+                logger.info("deleting current services...")
+                services = cf.services()
+                for service in services:
+                    if cf.service_key(service.name, installation.config_props.service_key_name):
+                        cf.delete_service_key(service.name, installation.config_props.service_key_name)
+                    cf.delete_service(service.name)
+            else:
+                logger.info("'apps-only' option is set, keeping existing current services")
+            logger.info("cleaning apps")
+            cf.delete_apps()
+            if installation.config_props.platform == "tile":
+                return tile.clean(cf, installation)
+            elif installation.config_props.platform == "cloudfoundry":
+                return standalone.clean(cf, installation)
+            else:
+                logger.error("invalid platform type %s should be in [cloudfoundry,tile]" %
+                             installation.config_props.platform)
+        finally:
+            if connected:
+                cf.close()
     except SystemExit:
         parser.print_help()
         exit(1)
@@ -0,0 +1,233 @@
+__copyright__ = '''
+Copyright 2022 the original author or authors.
+  Licensed under the Apache License, Version 2.0 (the "License");
+  you may not use this file except in compliance with the License.
+  You may obtain a copy of the License at
+      http://www.apache.org/licenses/LICENSE-2.0
+  Unless required by applicable law or agreed to in writing, software
+  distributed under the License is distributed on an "AS IS" BASIS,
+  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+  See the License for the specific language governing permissions and
+  limitations under the License.
+'''
+
+__author__ = 'David Turanski'
+
+import json
+import logging
+import os
+import socketserver
+import sys
+import threading
+import time
+from optparse import OptionParser
+from pathlib import Path
+
+from cloudfoundry.cli import CloudFoundry
+from cloudfoundry.platform.config.configuration import ConfigurationProperties
+from cloudfoundry.platform.config.deployer import CloudFoundryDeployerConfig
+from cloudfoundry.platform.config.installation import InstallationContext
+from install import enable_debug_logging
+from install.clean import clean
+from install.daemon_client import default_socket_path
+from install.setup import setup, write_properties
+from install.util import get_traceback
+
+logger = logging.getLogger(__name__)
+
+'''
+Keeps one logged in cf session, with its read cache and HTTP connection pool, for any number of setup, clean and
+status requests sent by install.daemon_client over a Unix socket. Each request is a JSON line
+{"command": "setup", "args": [...], "env": {...}, "cwd": "..."}. The daemon streams {"log": "..."} lines while it
+runs, and ends with {"ok": true|false, "result": ..., "error": ...}.
+
+Each request is configured by the client's environment, and its relative paths resolve against the client's current
+directory. Requests whose environment needs a different session, e.g., another space, are refused.
+'''
+
+# Read by the daemon process itself, e.g., to load the Oracle client libs, so they can't change per request
+PROCESS_ENV = ['LD_LIBRARY_PATH', 'JAVA_HOME']
+
+
+def session_key(env):
+    """
+    The settings of the logged in cf session, and of the daemon process, that a request must share with the daemon.
+    """
+    deployer_config = CloudFoundryDeployerConfig.from_env_vars(env)
+    config_props = ConfigurationProperties.from_env_vars(env)
+    key = {'api endpoint': deployer_config.api_endpoint,
+           'org': deployer_config.org,
+           'space': deployer_config.space,
+           'username': deployer_config.username,
+           'skip ssl validation': deployer_config.skip_ssl_validation,
+           'CF_HOME': config_props.cf_home,
+           'CF_HOME_ISOLATED': config_props.cf_home_isolated,
+           'CACHE_DIR': os.path.expanduser(config_props.cache_dir)}
+    key.update({name: env.get(name) for name in PROCESS_ENV})
+    return key
+
+
+class StreamingLogHandler(logging.Handler):
+    """
+    Sends the log records of a request to its client. It is installed on the root logger, so it only takes the records
+    of the request thread and of the threads it starts, e.g., to create services concurrently, not those of threads
+    that were already running.
+    """
+
+    def __init__(self, send):
+        super().__init__()
+        self.send = send
+        self.setFormatter(logging.Formatter('%(name)s - %(asctime)s - %(levelname)s:  %(message)s'))
+        current = threading.get_ident()
+        other_threads = {thread.ident for thread in threading.enumerate() if thread.ident != current}
+        self.addFilter(lambda record: record.thread not in other_threads)
+
+    def emit(self, record):
+        try:
+            self.send({'log': self.format(record)})
+        except OSError:
+            # The client went away, the request still runs to completion
+            pass
+
+
+class InstallerDaemon:
+    def __init__(self, env=os.environ, cf=None):
+        self.env = env
+        self.started = time.time()
+        self.requests = 0
+        self.session_key = session_key(env)
+        # setup and clean change the space, and the current directory, one at a time
+        self.lock = threading.Lock()
+        if cf:
+            self.cf = cf
+        else:
+            installation = InstallationContext.from_env_vars(env)
+            installation.config_props.cf_read_cache_enabled = True
+            self.cf = CloudFoundry.connect(deployer_config=installation.deployer_config,
+                                           config_props=installation.config_props)
+
+    def assert_same_session(self, env):
+        different = [name for name, value in session_key(env).items() if value != self.session_key[name]]
+        if different:
+            raise ValueError("the installer daemon was started with a different %s. Restart it with this environment, "
+                             "or run install.setup or install.clean directly" % ', '.join(different))
+
+    def handle(self, command, args, send, properties_path='cf_scdf.properties', env=None, cwd=None):
+        self.requests = self.requests + 1
+        if command == 'status':
+            return self.status()
+        if command not in ['setup', 'clean']:
+            raise ValueError("unknown command %s" % command)
+        env = env if env is not None else self.env
+        self.assert_same_session(env)
+        with self.lock:
+            handler = StreamingLogHandler(send)
+            logging.getLogger().addHandler(handler)
+            daemon_cwd = os.getcwd()
+            daemon_work_dir = self.cf.work_dir
+            try:
+                if cwd:
+                    os.chdir(cwd)
+                # The configuration is read for every request, since setup adds derived properties to it.
+                installation = InstallationContext.from_env_vars(env)
+                self.cf.work_dir = os.path.abspath(os.path.expanduser(installation.config_props.work_dir))
+                Path(self.cf.work_dir).mkdir(parents=True, exist_ok=True)
+                if command == 'setup':
+                    runtime_properties = setup(args, installation, self.cf)
+                    write_properties(runtime_properties, properties_path)
+                    return runtime_properties
+                clean(args, installation, self.cf)
+                return None
+            finally:
+                self.cf.work_dir = daemon_work_dir
+                os.chdir(daemon_cwd)
+                logging.getLogger().removeHandler(handler)
+
+    def close(self):
+        self.cf.close()
+
+    def status(self):
+        return {
+            'pid': os.getpid(),
+            'uptime_sec': round(time.time() - self.started),
+            'requests': self.requests,
+            'target': self.cf.current_target(),
+            'services': [service.name for service in self.cf.services() if service],
+            'apps': self.cf.apps()
+        }
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    def send(self, message):
+        self.wfile.write((json.dumps(message) + '\n').encode())
+        self.wfile.flush()
+
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline())
+            command = request.get('command')
+            if command == 'shutdown':
+                self.send({'ok': True, 'result': None})
+                threading.Thread(target=self.server.shutdown, daemon=True).start()
+                return
+            result = self.server.installer_daemon.handle(command, request.get('args', []), self.send,
+                                                         request.get('properties_path', 'cf_scdf.properties'),
+                                                         env=request.get('env'), cwd=request.get('cwd'))
+            self.send({'ok': True, 'result': result})
+        except (Exception, SystemExit) as e:
+            logger.error(get_traceback(e))
+            self.send({'ok': False, 'error': str(e)})
+
+
+class DaemonServer(socketserver.UnixStreamServer):
+    """
+    Handles one request at a time. A request changes the current directory of the whole process to the client's,
+    so requests must not overlap. Clients wait in the listen queue.
+    """
+    request_queue_size = 64
+
+    def __init__(self, socket_path, installer_daemon):
+        self.installer_daemon = installer_daemon
+        super().__init__(socket_path, RequestHandler)
+
+
+def serve(socket_path, installer_daemon):
+    Path(socket_path).parent.mkdir(parents=True, exist_ok=True)
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    # Only the owner may send requests
+    umask = os.umask(0o177)
+    try:
+        server = DaemonServer(socket_path, installer_daemon)
+    finally:
+        os.umask(umask)
+    logger.info("installer daemon listening on %s" % socket_path)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        os.remove(socket_path)
+        installer_daemon.close()
+
+
+def daemon(args, env=os.environ):
+    parser = OptionParser()
+    parser.usage = "%prog [options]"
+    parser.add_option('-v', '--debug',
+                      help='debug level logging',
+                      dest='debug', action='store_true')
+    parser.add_option('--socket',
+                      help='the Unix socket to listen on',
+                      dest='socket_path', default=default_socket_path(env))
+    try:
+        options, arguments = parser.parse_args(args)
+        if options.debug:
+            enable_debug_logging()
+        serve(options.socket_path, InstallerDaemon(env))
+    except SystemExit:
+        parser.print_help()
+        exit(1)
+
+
+if __name__ == '__main__':
+    daemon(sys.argv[1:])
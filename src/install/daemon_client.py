@@ -0,0 +1,76 @@
+__copyright__ = '''
+Copyright 2022 the original author or authors.
+  Licensed under the Apache License, Version 2.0 (the "License");
+  you may not use this file except in compliance with the License.
+  You may obtain a copy of the License at
+      http://www.apache.org/licenses/LICENSE-2.0
+  Unless required by applicable law or agreed to in writing, software
+  distributed under the License is distributed on an "AS IS" BASIS,
+  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+  See the License for the specific language governing permissions and
+  limitations under the License.
+'''
+
+__author__ = 'David Turanski'
+
+import json
+import os
+import socket
+import sys
+
+'''
+The thin client for install.daemon. It only uses the standard library, so it starts fast. Usage:
+
+    python -m install.daemon_client setup|clean|status|shutdown [setup or clean options]
+'''
+
+
+def default_socket_path(env=os.environ):
+    if env.get('SCDF_CF_SETUP_SOCKET'):
+        return env.get('SCDF_CF_SETUP_SOCKET')
+    # Same default as ConfigurationProperties.cache_dir, without importing it
+    return os.path.join(os.path.expanduser(env.get('CACHE_DIR', '~/.scdf_cf_setup')), 'daemon.sock')
+
+
+def request(socket_path, command, args=[], out=sys.stdout, env=os.environ):
+    """
+    Sends a request to the daemon, printing its log messages to out, and returns the final response. The request
+    runs with the client's environment and current directory. setup writes the runtime properties to
+    cf_scdf.properties in the client's WORK_DIR.
+    """
+    properties_path = os.path.join(os.path.expanduser(env.get('WORK_DIR', '.')), 'cf_scdf.properties')
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(socket_path)
+        message = {'command': command, 'args': args, 'properties_path': os.path.abspath(properties_path),
+                   'env': dict(env), 'cwd': os.getcwd()}
+        sock.sendall((json.dumps(message) + '\n').encode())
+        with sock.makefile('r') as lines:
+            for line in lines:
+                message = json.loads(line)
+                if 'log' in message:
+                    print(message['log'], file=out)
+                else:
+                    return message
+    return {'ok': False, 'error': 'the daemon closed the connection'}
+
+
+def main(args, env=os.environ):
+    if not args or args[0] not in ['setup', 'clean', 'status', 'shutdown']:
+        print("usage: daemon_client setup|clean|status|shutdown [options]", file=sys.stderr)
+        return 2
+    socket_path = default_socket_path(env)
+    try:
+        response = request(socket_path, args[0], args[1:], env=env)
+    except OSError as e:
+        print("installer daemon is not running on %s: %s" % (socket_path, str(e)), file=sys.stderr)
+        return 1
+    if not response.get('ok'):
+        print("%s failed: %s" % (args[0], response.get('error')), file=sys.stderr)
+        return 1
+    if args[0] == 'status':
+        print(json.dumps(response['result'], indent=4))
+    return 0
+
+
+if __name__ == '__main__':
+    exit(main(sys.argv[1:]))
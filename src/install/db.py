@@ -13,104 +13,226 @@ Copyright 2022 the original author or authors.
 
 __author__ = 'David Turanski'
 
-import os
-import psycopg2
-import time
-import cx_Oracle
+import hashlib
+import importlib
 import logging
+import re
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 
-from cloudfoundry.platform.config.db import DatasourceConfig
+from cloudfoundry.platform.config.db import DatasourceConfig, Provider
 
 logger = logging.getLogger(__name__)
 
+RESET_DROP = 'drop'
+RESET_TEMPLATE = 'template'
+RESET_TRUNCATE = 'truncate'
+reset_modes = [RESET_DROP, RESET_TEMPLATE, RESET_TRUNCATE]
+
+# Created by the servers' Flyway migrations. Its comment records the server versions that migrated the schema.
+SCHEMA_HISTORY_TABLE = 'flyway_schema_history'
+
+# Waiting for terminated connections to go away
+TERMINATE_MAX_WAIT_SEC = 10
+
+DBInitResult = namedtuple('DBInitResult', ['dbname', 'outcome', 'elapsed', 'error'])
+DBProbeResult = namedtuple('DBProbeResult', ['name', 'connect_sec', 'query_sec', 'can_create_tables'])
+
+
+def postgresql_datasources(db_config):
+    driver_class_name = 'org.postgresql.Driver'
+    logger.debug("Building postgres url with dataflow_db_name=%s and skipper_db_name=%s" % (
+        db_config.dataflow_db_name, db_config.skipper_db_name))
+    skipper_url = "jdbc:postgresql://%s:%d/%s?user=%s&password=%s" % (
+        db_config.host, int(db_config.port), db_config.skipper_db_name, db_config.username, db_config.password)
+    dataflow_url = "jdbc:postgresql://%s:%d/%s?user=%s&password=%s" % \
+                   (db_config.host, int(db_config.port), db_config.dataflow_db_name, db_config.username,
+                    db_config.password)
+    return {
+        "dataflow": DatasourceConfig(url=dataflow_url,
+                                     name=db_config.dataflow_db_name,
+                                     username=db_config.username,
+                                     password=db_config.password,
+                                     driver_class_name=driver_class_name),
+        "skipper": DatasourceConfig(url=skipper_url,
+                                    name=db_config.skipper_db_name,
+                                    username=db_config.username,
+                                    password=db_config.password,
+                                    driver_class_name=driver_class_name)
+    }
+
+
+def oracle_datasources(db_config):
+    skipper_url = dataflow_url = "jdbc:oracle:thin:@%s:%d:%s" % (
+        db_config.host, int(db_config.port), db_config.service_name)
+    driver_class_name = 'oracle.jdbc.OracleDriver'
+    return {
+        "dataflow": DatasourceConfig(url=dataflow_url,
+                                     name=db_config.dataflow_db_name,
+                                     username=db_config.dataflow_db_name,
+                                     password=db_config.password,
+                                     driver_class_name=driver_class_name),
+        "skipper": DatasourceConfig(url=skipper_url,
+                                    name=db_config.skipper_db_name,
+                                    username=db_config.skipper_db_name,
+                                    password=db_config.password,
+                                    driver_class_name=driver_class_name)
+    }
+
+
+class DBProviders:
+    """
+    The supported SQL providers. Each one maps to a function that builds the Spring datasources and the name of the
+    module that initializes the DB. The module, and the DB driver it imports, is only loaded if the DB is initialized.
+    An initialization module implements initialize(db_config, reset_mode, server_versions) and
+    probe(db_config, datasource_config, queries).
+    """
+    registry = {}
+
+    @classmethod
+    def register(cls, name, datasources, module, aliases=[]):
+        Provider.register(name, aliases)
+        cls.registry[name] = (datasources, module)
+
+    @classmethod
+    def datasources(cls, provider):
+        return cls.registry[provider.name][0]
+
+    @classmethod
+    def module(cls, provider):
+        module_name = cls.registry[provider.name][1]
+        logger.debug("loading DB provider %s from %s" % (provider.name, module_name))
+        return importlib.import_module(module_name)
+
+
+DBProviders.register('postgresql', postgresql_datasources, 'install.postgresql', aliases=['postgres'])
+DBProviders.register('oracle', oracle_datasources, 'install.oracle')
+
+
+def template_db_name(dbname, versions):
+    """
+    The name of the template database holding the migrated schema of dbname for the given server versions.
+    """
+    suffix = re.sub('[^a-z0-9]+', '_', '_'.join(versions).lower())
+    name = '%s_tpl_%s' % (dbname, suffix)
+    # Postgres truncates identifiers to 63 bytes
+    if len(name) > 63:
+        name = '%s_tpl_%s' % (dbname[:40], hashlib.sha1(suffix.encode()).hexdigest()[:16])
+    return name
+
+
+def db_server_versions(db_config, server_versions):
+    """
+    Map each database to the versions of the servers using it.
+    Args:
+        db_config: the DBConfig
+        server_versions: {'dataflow': dataflow_version, 'skipper': skipper_version}
+    """
+    if db_config.skipper_db_name == db_config.dataflow_db_name:
+        return {db_config.dataflow_db_name: [server_versions.get('dataflow'), server_versions.get('skipper')]}
+    return {db_config.dataflow_db_name: [server_versions.get('dataflow')],
+            db_config.skipper_db_name: [server_versions.get('skipper')]}
+
+
+def db_templates(db_config, server_versions):
+    """
+    Map each database to the name of its template, keyed by the versions of the servers using it.
+    """
+    return {dbname: template_db_name(dbname, versions)
+            for dbname, versions in db_server_versions(db_config, server_versions).items()}
+
 
-def init_postgres_db(db_config, dbname):
-    logger.info("initializing postgresql DB %s..." % dbname)
-    conn = None
-    try:
-        # Connect to the postgres (system) database to drop/create target schema
-        conn = psycopg2.connect(
-            host=db_config.host,
-            port=db_config.port,
-            user=db_config.username,
-            password=db_config.password,
-            # TODO: This may not be optimal. See https://stackoverflow.com/questions/2370525/default-database-named-postgres-on-postgresql-server
-            dbname='postgres',
-            connect_timeout=5)
-        conn.autocommit = True
-        with conn.cursor() as cur:
-            cur.execute("SELECT count(*) FROM pg_stat_activity WHERE datname = '%s';" % dbname)
-            live_connections = cur.fetchone()[0]
-            logger.debug("DB %s has %d live connections" % (dbname, live_connections))
-            while live_connections > 0:
-                # Terminate any existing connections to the database
-                cur.execute("SELECT pg_terminate_backend(pid) FROM pg_stat_activity WHERE datname = '%s';" % dbname)
-                time.sleep(1.0)
-                cur.execute("SELECT count(*) FROM pg_stat_activity WHERE datname = '%s';" % dbname)
-                live_connections = cur.fetchone()[0]
-                logger.debug("DB %s has %d live connections" % (dbname, live_connections))
-
-            cur.execute("DROP DATABASE IF EXISTS '%s';" % dbname)
-            cur.execute("CREATE DATABASE %s;" % dbname)
-            logger.info("completed initialization of postgresql DB %s" % dbname)
-    except (psycopg2.DatabaseError, psycopg2.OperationalError) as e:
-        # If we fail, continue anyway
-        logger.error(f'Error {e}')
-    finally:
-        if conn:
-            conn.close()
-
-
-def init_oracle_client():
-    lib_dir = os.getenv('LD_LIBRARY_PATH')
-    if lib_dir:
-        logger.debug("Initializing oracle client in %s" % lib_dir)
-    else:
-        raise ValueError("Error initializing Oracle. 'LD_LIBRARY_PATH' is not defined. \n" +
-                         "Should be where the oracle client libs are installed")
-    cx_Oracle.init_oracle_client(lib_dir=lib_dir)
-
-
-def init_oracle_db(db_config, username):
-    logger.info("initializing Oracle user %s in service %s" % (username, db_config.service_name))
-    conn = None
-    # Connect as the system user to drop/create the server accounts
-    try:
-        conn_info = {
-            'host': db_config.host,
-            'port': db_config.port,
-            'user': db_config.system_username,
-            'psw': db_config.system_password,
-            'service': db_config.service_name
-        }
-        conn_str = '{user}/{psw}@{host}:{port}/{service}'.format(**conn_info)
-        conn = cx_Oracle.connect(conn_str)
-        # TODO: How to set a connect_timeout?
-        with conn.cursor() as cur:
-            cur.execute('ALTER SESSION SET "_ORACLE_SCRIPT"=TRUE')
-            cur.execute("SELECT sid,serial# FROM v$session where username='%s'" % (username.upper()))
-            for row in cur.fetchall():
-                logger.debug("killing session " + str(row))
-                cur.execute("ALTER SYSTEM kill session '%s,%s' immediate" % row)
-            # TODO: check if user exists
-
-            cur.execute("SELECT COUNT(*) FROM dba_users WHERE username='%s'" % username.upper())
-            count = cur.fetchone()[0]
-            if count:
-                logger.debug("Dropping user %s" % username)
-                cur.execute("DROP USER %s CASCADE" % username)
-            logger.debug("Creating user %s" % username)
-            cur.execute("CREATE USER %s IDENTIFIED BY %s" % (username, db_config.password))
-            cur.execute("GRANT ALL PRIVILEGES TO %s" % username)
-            conn.commit()
-            logger.info(
-                "completed initialization of Oracle user %s in service %s" % (username, db_config.service_name))
-    finally:
-        if conn:
-            conn.close()
-
-
-def init_db(db_config, initialize_db=False):
+def missing_db_templates(db_config, server_versions):
+    return DBProviders.module(db_config.provider).missing_db_templates(db_config, server_versions)
+
+
+def create_db_templates(db_config, templates):
+    return DBProviders.module(db_config.provider).create_db_templates(db_config, templates)
+
+
+def record_schema_versions(db_config, server_versions):
+    return DBProviders.module(db_config.provider).record_schema_versions(db_config, server_versions)
+
+
+def schema_versions_comment(versions):
+    return 'scdf_cf_setup:%s' % ','.join(versions)
+
+
+def init_concurrently(inits):
+    """
+    Run the DB initializations concurrently and report the outcome for each.
+    Args:
+        inits: {dbname: function returning the outcome}
+    Returns:
+        {dbname: DBInitResult}
+    Raises:
+        RuntimeError if any of them failed, after all have completed.
+    """
+
+    def timed(init):
+        start = time.time()
+        outcome = init()
+        return outcome, time.time() - start
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=len(inits)) as executor:
+        futures = {dbname: executor.submit(timed, init) for dbname, init in inits.items()}
+        for dbname, future in futures.items():
+            try:
+                outcome, elapsed = future.result()
+                results[dbname] = DBInitResult(dbname=dbname, outcome=outcome, elapsed=elapsed, error=None)
+                logger.info("DB %s %s in %.2f sec" % (dbname, outcome, elapsed))
+            except Exception as e:
+                results[dbname] = DBInitResult(dbname=dbname, outcome='failed', elapsed=None, error=e)
+                logger.error("DB %s initialization failed: %s" % (dbname, str(e)))
+    failed = [result for result in results.values() if result.error]
+    if failed:
+        raise RuntimeError("FATAL: failed to initialize DB(s) %s" % ', '.join(
+            ["%s: %s" % (result.dbname, str(result.error)) for result in failed]))
+    return results
+
+
+def probe_db(db_config, datasources_config, queries=3):
+    """
+    Connect to each datasource with the credentials the servers will use. Measure the connect time and the average
+    round trip of a simple query, and check the user can create tables.
+    Raises a RuntimeError if a DB is unreachable, the user cannot create tables, or the query latency exceeds
+    probe_max_latency_ms. Latency over probe_warn_latency_ms is logged as a warning.
+    """
+    module = DBProviders.module(db_config.provider)
+    results = []
+    probed = set()
+    for datasource in datasources_config.values():
+        if (datasource.url, datasource.username) in probed:
+            continue
+        probed.add((datasource.url, datasource.username))
+        logger.info("probing DB %s as user %s" % (datasource.name, datasource.username))
+        try:
+            result = module.probe(db_config, datasource, queries)
+        except Exception as e:
+            raise RuntimeError("FATAL: unable to connect to DB %s as user %s: %s" % (
+                datasource.name, datasource.username, str(e)))
+        check_probe(db_config, result)
+        results.append(result)
+    return results
+
+
+def check_probe(db_config, result):
+    latency_ms = result.query_sec * 1000
+    logger.info("DB %s connect time %d ms, query round trip %.1f ms" % (
+        result.name, result.connect_sec * 1000, latency_ms))
+    if not result.can_create_tables:
+        raise RuntimeError("FATAL: the user for DB %s does not have privileges to create tables" % result.name)
+    if latency_ms > db_config.probe_max_latency_ms:
+        raise RuntimeError("FATAL: DB %s query round trip %.1f ms exceeds %d ms. The servers are likely to time out" % (
+            result.name, latency_ms, db_config.probe_max_latency_ms))
+    if latency_ms > db_config.probe_warn_latency_ms:
+        logger.warning("DB %s query round trip %.1f ms exceeds %d ms. The servers may be slow to start" % (
+            result.name, latency_ms, db_config.probe_warn_latency_ms))
+
+
+def init_db(db_config, initialize_db=False, reset_mode=RESET_DROP, server_versions={}):
     """
     Generate Spring Datasource properties for an external DB configuration (currently postgresql or oracle).
     Args:
@@ -120,6 +242,13 @@ def init_db(db_config, initialize_db=False):
                     the apps that access the DB (Dataflow, Composed Task Runner, and any Task apps).
 
                     If False, the SQL database must exist. The credentials must have privileges to create tables, etc.
+        reset_mode : how to initialize the DB. 'drop' drops and recreates it. 'template' (postgresql only) clones it
+                    from a template of the schema already migrated by the same server versions, so the servers skip
+                    the migrations. If there is no template yet, the DB is recreated and the template must be created
+                    with create_db_templates() once the servers are up. 'truncate' (postgresql only) empties the
+                    tables, keeping the schema, if record_schema_versions() recorded the same server versions.
+                    Otherwise, the DB is recreated.
+        server_versions : {'dataflow': dataflow_version, 'skipper': skipper_version}, to key the templates.
 
     Returns:
         Spring datasource properties for the Skipper and Dataflow instances. They can be the same or different.
@@ -130,57 +259,25 @@ def init_db(db_config, initialize_db=False):
         logging.info("'database provider' is not defined. Skipping external DB initialization.")
         return
 
-    if db_config.provider.is_postrgesql():
-        if initialize_db:
-            init_postgres_db(db_config, db_config.dataflow_db_name)
-            if db_config.skipper_db_name != db_config.dataflow_db_name:
-                init_postgres_db(db_config, db_config.skipper_db_name)
-
-        driver_class_name = 'org.postgresql.Driver'
-        logger.debug("Building postgres url with dataflow_db_name=%s and skipper_db_name=%s" % (
-            db_config.dataflow_db_name, db_config.skipper_db_name))
-        skipper_url = "jdbc:postgresql://%s:%d/%s?user=%s&password=%s" % (
-            db_config.host, int(db_config.port), db_config.skipper_db_name, db_config.username, db_config.password)
-        dataflow_url = "jdbc:postgresql://%s:%d/%s?user=%s&password=%s" % \
-                       (db_config.host, int(db_config.port), db_config.dataflow_db_name, db_config.username,
-                        db_config.password)
-        return {
-            "dataflow": DatasourceConfig(url=dataflow_url,
-                                         name=db_config.dataflow_db_name,
-                                         username=db_config.username,
-                                         password=db_config.password,
-                                         driver_class_name=driver_class_name),
-            "skipper": DatasourceConfig(url=skipper_url,
-                                        name=db_config.skipper_db_name,
-                                        username=db_config.username,
-                                        password=db_config.password,
-                                        driver_class_name=driver_class_name)
-        }
-
-    elif db_config.provider.is_oracle():
-        if initialize_db:
-            init_oracle_client()
-            '''Oracle creates different user for each. Using the same DB service'''
-            init_oracle_db(db_config, db_config.dataflow_db_name)
-            if db_config.skipper_db_name != db_config.dataflow_db_name:
-                init_oracle_db(db_config, db_config.skipper_db_name)
-
-        skipper_url = dataflow_url = "jdbc:oracle:thin:@%s:%d:%s" % (
-            db_config.host, int(db_config.port), db_config.service_name)
-        driver_class_name = 'oracle.jdbc.OracleDriver'
-        return {
-            "dataflow": DatasourceConfig(url=dataflow_url,
-                                         name=db_config.dataflow_db_name,
-                                         username=db_config.dataflow_db_name,
-                                         password=db_config.password,
-                                         driver_class_name=driver_class_name),
-            "skipper": DatasourceConfig(url=skipper_url,
-                                        name=db_config.skipper_db_name,
-                                        username=db_config.skipper_db_name,
-                                        password=db_config.password,
-                                        driver_class_name=driver_class_name)
-        }
-
-    # Impossible. DbConfig does the validation
-    # else:
-    #     raise ValueError("Sorry, SQL provider %s is invalid or unsupported." % db.provider)
+    if initialize_db:
+        reset_db(db_config, reset_mode, server_versions)
+
+    return DBProviders.datasources(db_config.provider)(db_config)
+
+
+def reset_db(db_config, reset_mode=RESET_DROP, server_versions={}):
+    """
+    Initialize the Skipper and Dataflow databases, see init_db().
+    Returns:
+        {dbname: DBInitResult}
+    """
+    return DBProviders.module(db_config.provider).initialize(db_config, reset_mode, server_versions)
+
+
+def reset_servers(db_config, db_init_results):
+    """
+    Maps each server app whose database was reset to the outcome, e.g., {'skipper-server': 'created'}. A running server
+    does not see the reset, so it must be pushed again to migrate and use the new schema.
+    """
+    dbnames = {'dataflow-server': db_config.dataflow_db_name, 'skipper-server': db_config.skipper_db_name}
+    return {app: db_init_results[dbname].outcome for app, dbname in dbnames.items() if dbname in db_init_results}
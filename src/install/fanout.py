@@ -0,0 +1,246 @@
+__copyright__ = '''
+Copyright 2022 the original author or authors.
+  Licensed under the Apache License, Version 2.0 (the "License");
+  you may not use this file except in compliance with the License.
+  You may obtain a copy of the License at
+      http://www.apache.org/licenses/LICENSE-2.0
+  Unless required by applicable law or agreed to in writing, software
+  distributed under the License is distributed on an "AS IS" BASIS,
+  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+  See the License for the specific language governing permissions and
+  limitations under the License.
+'''
+
+__author__ = 'David Turanski'
+
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from optparse import OptionParser
+from pathlib import Path
+
+from cloudfoundry.platform import standalone
+from cloudfoundry.platform.config.configuration import ConfigurationProperties
+from cloudfoundry.platform.config.db import DBConfig
+from cloudfoundry.platform.config.deployer import CloudFoundryDeployerConfig
+from cloudfoundry.platform.config.installation import InstallationContext
+from install import enable_debug_logging
+from install.setup import setup, write_properties
+from install.shell import Shell
+from install.util import get_traceback
+
+logger = logging.getLogger(__name__)
+
+'''
+Runs the setup for several targets, e.g., one SCDF installation per acceptance test shard, concurrently. Each target
+is the current environment with some overrides, typically the space, and its own WORK_DIR. Usage:
+
+    python -m install.fanout --spacePattern scdf-at-%d --count 4
+
+With an external DB, each space from '--spacePattern' gets its own SQL_DATAFLOW_DB_NAME and SQL_SKIPPER_DB_NAME,
+suffixed with the space name, so the servers don't share a schema. Targets listed in a '--targets' file sharing an
+external DB can't use '--initializeDB', since they would drop each other's databases.
+'''
+
+FanoutResult = namedtuple('FanoutResult', ['name', 'api_endpoint', 'org', 'space', 'status', 'elapsed_sec',
+                                           'properties_path', 'error'])
+
+
+def space_db_names(env, space):
+    """
+    The external DB names for a generated space, the configured ones suffixed with the space name, e.g.,
+    scdf_scdf_at_1. Returns no overrides if there is no external DB.
+    """
+    dataflow_db_name = env.get(DBConfig.dataflow_db_name_key)
+    if not (env.get(DBConfig.provider_key) and dataflow_db_name):
+        return {}
+    suffix = re.sub('[^a-z0-9]+', '_', space.lower())
+    skipper_db_name = env.get(DBConfig.skipper_db_name_key) or dataflow_db_name
+    return {DBConfig.dataflow_db_name_key: '%s_%s' % (dataflow_db_name, suffix),
+            DBConfig.skipper_db_name_key: '%s_%s' % (skipper_db_name, suffix)}
+
+
+def space_overrides(env, space):
+    overrides = {CloudFoundryDeployerConfig.space_key: space}
+    overrides.update(space_db_names(env, space))
+    return overrides
+
+
+def fanout_targets(options, env=os.environ):
+    """
+    Returns the env var overrides for each target, from a JSON file containing a list of objects, e.g.,
+    [{"SPRING_CLOUD_DEPLOYER_CLOUDFOUNDRY_SPACE": "at-1"}, {"NAME": "other", "SPRING_CLOUD_DEPLOYER_CLOUDFOUNDRY_URL":
+    "https://api.other.cf", ...}], or a space name pattern.
+    """
+    if options.targets_path:
+        with open(options.targets_path) as file:
+            targets = json.load(file)
+        if type(targets) is not list or not all(type(target) is dict for target in targets):
+            raise ValueError("%s must contain a list of objects" % options.targets_path)
+        return targets
+    if options.space_pattern:
+        if not options.count:
+            raise ValueError("'--count' is required with '--spacePattern'")
+        return [space_overrides(env, options.space_pattern % i) for i in range(1, options.count + 1)]
+    raise ValueError("either '--targets' or '--spacePattern' is required")
+
+
+def target_name(overrides, index):
+    return overrides.get('NAME', overrides.get(CloudFoundryDeployerConfig.space_key, 'target-%d' % index))
+
+
+def target_env(env, overrides, work_dir):
+    target = dict(env)
+    target.update({k: str(v) for k, v in overrides.items() if k != 'NAME'})
+    target['WORK_DIR'] = work_dir
+    # Concurrent targets must not share the cf cli target
+    target.setdefault('CF_HOME_ISOLATED', 'true')
+    return target
+
+
+def install_target(name, env, setup_args):
+    threading.current_thread().name = name
+    start = time.monotonic()
+    installation = None
+    try:
+        installation = InstallationContext.from_env_vars(env)
+        runtime_properties = setup(setup_args, installation)
+        properties_path = os.path.join(installation.config_props.work_dir, 'cf_scdf.properties')
+        write_properties(runtime_properties, properties_path)
+        return fanout_result(name, installation, 'succeeded', start, properties_path=properties_path)
+    except (Exception, SystemExit) as e:
+        logger.error("setup failed for %s:\n%s" % (name, get_traceback(e)))
+        return fanout_result(name, installation, 'failed', start, error=str(e))
+
+
+def fanout_result(name, installation, status, start, properties_path=None, error=None):
+    deployer_config = installation.deployer_config if installation else None
+    return FanoutResult(name=name,
+                        api_endpoint=deployer_config.api_endpoint if deployer_config else None,
+                        org=deployer_config.org if deployer_config else None,
+                        space=deployer_config.space if deployer_config else None,
+                        status=status,
+                        elapsed_sec=round(time.monotonic() - start, 1),
+                        properties_path=properties_path,
+                        error=error)
+
+
+def shared_databases(target_envs):
+    """
+    Returns the external databases used by more than one target, as a database -> target names map.
+    """
+    databases = {}
+    for name, env in target_envs.items():
+        if not env.get(DBConfig.provider_key):
+            continue
+        dataflow_db_name = env.get(DBConfig.dataflow_db_name_key)
+        for db_name in {dataflow_db_name, env.get(DBConfig.skipper_db_name_key, dataflow_db_name)}:
+            database = '%s:%s/%s' % (env.get(DBConfig.host_key), env.get(DBConfig.port_key), db_name)
+            databases.setdefault(database, []).append(name)
+    return {database: names for database, names in databases.items() if len(names) > 1}
+
+
+def assert_no_shared_db_initialization(target_envs, setup_args):
+    if '--initializeDB' not in setup_args:
+        return
+    shared = shared_databases(target_envs)
+    if shared:
+        raise ValueError("'--initializeDB' would initialize the same database for several targets: %s. Set "
+                         "SQL_DATAFLOW_DB_NAME and SQL_SKIPPER_DB_NAME for each target." % ', '.join(
+                             ["%s %s" % (database, str(names)) for database, names in sorted(shared.items())]))
+
+
+def download_shared_jars(setup_args, target_envs):
+    """
+    Download the server jars once for all the targets, rather than once per target. Targets may use different
+    versions or maven repos, as long as they don't download them to the same jar path.
+    """
+    if '--doNotDownload' in setup_args or '-d' in setup_args:
+        return setup_args
+    downloads = {}
+    jar_paths = {}
+    for env in target_envs:
+        config_props = ConfigurationProperties.from_env_vars(env)
+        if config_props.platform != 'cloudfoundry':
+            return setup_args
+        download = (config_props.dataflow_version, config_props.dataflow_jar_path, config_props.skipper_version,
+                    config_props.skipper_jar_path, json.dumps(config_props.maven_repos, sort_keys=True))
+        for jar_path, version in [(config_props.dataflow_jar_path, download[0]),
+                                  (config_props.skipper_jar_path, download[2])]:
+            artifact = (version, download[4])
+            if jar_paths.setdefault(os.path.abspath(jar_path), artifact) != artifact:
+                raise ValueError("targets download different versions or repos to %s. Set DATAFLOW_JAR_PATH and "
+                                 "SKIPPER_JAR_PATH for each version." % jar_path)
+        downloads[download] = config_props
+    for config_props in downloads.values():
+        logger.info("downloading server jars %s, %s shared by the targets" % (config_props.dataflow_version,
+                                                                                config_props.skipper_version))
+        standalone.download_server_jars(config_props, Shell())
+    return setup_args + ['--doNotDownload']
+
+
+def fanout(args, env=os.environ):
+    parser = OptionParser()
+    parser.usage = "%prog [options] -- [setup options]"
+    parser.add_option('-v', '--debug',
+                      help='debug level logging',
+                      dest='debug', action='store_true')
+    parser.add_option('--targets',
+                      help='a JSON file containing a list of objects, the env var overrides for each target',
+                      dest='targets_path')
+    parser.add_option('--spacePattern',
+                      help="create a target for each space name, e.g., 'scdf-at-%d', numbered from 1 to count",
+                      dest='space_pattern')
+    parser.add_option('--count',
+                      help='the number of targets for the space pattern',
+                      dest='count', type='int')
+    parser.add_option('--maxParallel',
+                      help='the maximum number of concurrent installations',
+                      dest='max_parallel', type='int', default=4)
+    try:
+        options, arguments = parser.parse_args(args)
+        if options.debug:
+            enable_debug_logging()
+        # The log messages of the targets are interleaved, so tag them with the target name
+        for handler in logging.getLogger().handlers:
+            handler.setFormatter(
+                logging.Formatter('%(threadName)s - %(name)s - %(asctime)s - %(levelname)s:  %(message)s'))
+
+        targets = fanout_targets(options, env)
+        names = [target_name(targets[i], i + 1) for i in range(len(targets))]
+        if len(set(names)) < len(names):
+            raise ValueError("target names must be unique: %s" % str(names))
+        base_work_dir = os.path.abspath(env.get('WORK_DIR', '.'))
+        target_envs = {name: target_env(env, target, os.path.join(base_work_dir, name))
+                       for name, target in zip(names, targets)}
+        assert_no_shared_db_initialization(target_envs, arguments)
+        setup_args = download_shared_jars(arguments, target_envs.values())
+
+        logger.info("installing %d targets, %d at a time" % (len(targets), options.max_parallel))
+        with ThreadPoolExecutor(max_workers=options.max_parallel) as executor:
+            futures = [executor.submit(install_target, name, target_envs[name], setup_args) for name in names]
+            results = [future.result() for future in futures]
+
+        report_path = os.path.join(base_work_dir, 'fanout-report.json')
+        Path(base_work_dir).mkdir(parents=True, exist_ok=True)
+        with open(report_path, 'w') as report:
+            json.dump([result._asdict() for result in results], report, indent=4)
+        for result in results:
+            logger.info("%s %s in %.1f sec %s" % (result.name, result.status, result.elapsed_sec,
+                                                  result.properties_path if result.properties_path else result.error))
+        logger.info("fan-out report: %s" % report_path)
+        return results
+    except SystemExit:
+        parser.print_help()
+        exit(1)
+
+
+if __name__ == '__main__':
+    if [result for result in fanout(sys.argv[1:]) if result.status != 'succeeded']:
+        exit(1)
@@ -0,0 +1,83 @@
+__copyright__ = '''
+Copyright 2022 the original author or authors.
+  Licensed under the Apache License, Version 2.0 (the "License");
+  you may not use this file except in compliance with the License.
+  You may obtain a copy of the License at
+      http://www.apache.org/licenses/LICENSE-2.0
+  Unless required by applicable law or agreed to in writing, software
+  distributed under the License is distributed on an "AS IS" BASIS,
+  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+  See the License for the specific language governing permissions and
+  limitations under the License.
+'''
+
+__author__ = 'David Turanski'
+
+import logging
+import threading
+import time
+from collections import namedtuple
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+LatencyStats = namedtuple('LatencyStats', ['count', 'errors', 'total_sec', 'max_sec'])
+
+
+class HttpClient(requests.Session):
+    """
+    The requests Session used for all HTTP calls. Connections are pooled and kept alive, every request has a timeout
+    unless one is given (timeout=None waits indefinitely), and idempotent requests are retried with exponential
+    backoff on connection errors and 502, 503 and 504 responses. 'verify' is passed to requests, i.e., False or the
+    path to a PEM CA bundle. Request latency is recorded per method and host.
+    """
+
+    def __init__(self, pool_size=10, timeout=10, retries=3, backoff_factor=0.5, verify=True):
+        super().__init__()
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.verify = verify
+        retry = Retry(total=retries, backoff_factor=backoff_factor, status_forcelist=[502, 503, 504],
+                      raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.mount('http://', adapter)
+        self.mount('https://', adapter)
+        self.metrics_lock = threading.Lock()
+        self.metrics = {}
+
+    def without_retries(self):
+        """
+        A client with the same settings, sharing the latency metrics, that sends each request once. Callers that poll
+        retry themselves, so retrying each poll as well would multiply the wait.
+        """
+        client = HttpClient(pool_size=self.pool_size, timeout=self.timeout, retries=0, verify=self.verify)
+        client.metrics_lock = self.metrics_lock
+        client.metrics = self.metrics
+        return client
+
+    def request(self, method, url, *args, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        start = time.monotonic()
+        failed = True
+        try:
+            response = super().request(method, url, *args, **kwargs)
+            failed = response.status_code >= 500
+            return response
+        finally:
+            self.record('%s %s' % (method.upper(), urlparse(url).netloc), time.monotonic() - start, failed)
+
+    def record(self, key, elapsed_sec, failed=False):
+        with self.metrics_lock:
+            stats = self.metrics.get(key, LatencyStats(0, 0, 0.0, 0.0))
+            self.metrics[key] = LatencyStats(stats.count + 1, stats.errors + (1 if failed else 0),
+                                             stats.total_sec + elapsed_sec, max(stats.max_sec, elapsed_sec))
+
+    def log_metrics(self):
+        with self.metrics_lock:
+            for key, stats in sorted(self.metrics.items()):
+                logger.info("%s: %d requests, %d errors, mean %.0f ms, max %.0f ms" % (
+                    key, stats.count, stats.errors, stats.total_sec * 1000 / stats.count, stats.max_sec * 1000))
@@ -0,0 +1,139 @@
+__copyright__ = '''
+Copyright 2022 the original author or authors.
+  Licensed under the Apache License, Version 2.0 (the "License");
+  you may not use this file except in compliance with the License.
+  You may obtain a copy of the License at
+      http://www.apache.org/licenses/LICENSE-2.0
+  Unless required by applicable law or agreed to in writing, software
+  distributed under the License is distributed on an "AS IS" BASIS,
+  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+  See the License for the specific language governing permissions and
+  limitations under the License.
+'''
+
+__author__ = 'David Turanski'
+
+import logging
+import os
+import time
+from functools import partial
+
+import cx_Oracle
+
+from install.db import RESET_DROP, TERMINATE_MAX_WAIT_SEC, DBProbeResult, init_concurrently
+
+logger = logging.getLogger(__name__)
+
+'''
+Oracle DB initialization. Imported only if an Oracle DB is initialized, so the Oracle client libs are not required
+otherwise.
+'''
+
+
+def initialize(db_config, reset_mode, server_versions):
+    if reset_mode != RESET_DROP:
+        logger.warning("reset mode '%s' is not supported for Oracle. Dropping the users instead" % reset_mode)
+    init_oracle_client()
+    '''Oracle creates different user for each. Using the same DB service'''
+    usernames = list(dict.fromkeys([db_config.dataflow_db_name, db_config.skipper_db_name]))
+    pool = oracle_admin_pool(db_config, len(usernames))
+    try:
+        return init_concurrently({username: partial(init_oracle_db, db_config, username, pool)
+                                  for username in usernames})
+    finally:
+        pool.close()
+
+
+# The client libs can only be initialized once per process
+oracle_client_initialized = False
+
+
+def init_oracle_client():
+    global oracle_client_initialized
+    if oracle_client_initialized:
+        return
+    lib_dir = os.getenv('LD_LIBRARY_PATH')
+    if lib_dir:
+        logger.debug("Initializing oracle client in %s" % lib_dir)
+    else:
+        raise ValueError("Error initializing Oracle. 'LD_LIBRARY_PATH' is not defined. \n" +
+                         "Should be where the oracle client libs are installed")
+    cx_Oracle.init_oracle_client(lib_dir=lib_dir)
+    oracle_client_initialized = True
+
+
+def oracle_admin_pool(db_config, size):
+    """
+    A pool of system user sessions, shared by the concurrent DB initializations.
+    """
+    # TODO: How to set a connect_timeout?
+    return cx_Oracle.SessionPool(user=db_config.system_username,
+                                 password=db_config.system_password,
+                                 dsn='%s:%s/%s' % (db_config.host, db_config.port, db_config.service_name),
+                                 min=1, max=size, increment=1, threaded=True)
+
+
+def init_oracle_db(db_config, username, pool):
+    logger.info("initializing Oracle user %s in service %s" % (username, db_config.service_name))
+    # Connect as the system user to drop/create the server accounts
+    conn = pool.acquire()
+    try:
+        with conn.cursor() as cur:
+            cur.execute('ALTER SESSION SET "_ORACLE_SCRIPT"=TRUE')
+            cur.execute("SELECT sid,serial# FROM v$session where username='%s'" % (username.upper()))
+            for row in cur.fetchall():
+                logger.debug("killing session " + str(row))
+                cur.execute("ALTER SYSTEM kill session '%s,%s' immediate" % row)
+
+            cur.execute("SELECT COUNT(*) FROM dba_users WHERE username='%s'" % username.upper())
+            count = cur.fetchone()[0]
+            if count:
+                logger.debug("Dropping user %s" % username)
+                drop_oracle_user(cur, username)
+            logger.debug("Creating user %s" % username)
+            cur.execute("CREATE USER %s IDENTIFIED BY %s" % (username, db_config.password))
+            cur.execute("GRANT ALL PRIVILEGES TO %s" % username)
+            conn.commit()
+            logger.info(
+                "completed initialization of Oracle user %s in service %s" % (username, db_config.service_name))
+    finally:
+        pool.release(conn)
+    return 'created'
+
+
+def drop_oracle_user(cur, username, max_wait_sec=TERMINATE_MAX_WAIT_SEC):
+    # Killed sessions may take a moment to go away
+    wait_sec = 0.05
+    waited_sec = 0
+    while True:
+        try:
+            cur.execute("DROP USER %s CASCADE" % username)
+            return
+        except cx_Oracle.DatabaseError as e:
+            # ORA-01940: cannot drop a user that is currently connected
+            if 'ORA-01940' not in str(e) or waited_sec > max_wait_sec:
+                raise e
+            time.sleep(wait_sec)
+            waited_sec = waited_sec + wait_sec
+            wait_sec = min(wait_sec * 2, 1.0)
+
+
+def probe(db_config, datasource_config, queries=3):
+    init_oracle_client()
+    start = time.time()
+    conn = cx_Oracle.connect(user=datasource_config.username, password=datasource_config.password,
+                             dsn='%s:%s/%s' % (db_config.host, db_config.port, db_config.service_name))
+    connect_sec = time.time() - start
+    try:
+        with conn.cursor() as cur:
+            start = time.time()
+            for i in range(queries):
+                cur.execute("SELECT 1 FROM DUAL")
+                cur.fetchone()
+            query_sec = (time.time() - start) / queries
+            cur.execute("SELECT COUNT(*) FROM session_privs WHERE privilege IN ('CREATE TABLE', 'CREATE ANY TABLE')")
+            can_create_tables = cur.fetchone()[0] > 0
+    finally:
+        conn.close()
+    return DBProbeResult(name=datasource_config.name, connect_sec=connect_sec, query_sec=query_sec,
+                         can_create_tables=can_create_tables)
@@ -0,0 +1,251 @@
+__copyright__ = '''
+Copyright 2022 the original author or authors.
+  Licensed under the Apache License, Version 2.0 (the "License");
+  you may not use this file except in compliance with the License.
+  You may obtain a copy of the License at
+      http://www.apache.org/licenses/LICENSE-2.0
+  Unless required by applicable law or agreed to in writing, software
+  distributed under the License is distributed on an "AS IS" BASIS,
+  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+  See the License for the specific language governing permissions and
+  limitations under the License.
+'''
+
+__author__ = 'David Turanski'
+
+import hashlib
+import logging
+import os
+import re
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from cloudfoundry.domain import Service
+from install.util import get_traceback
+
+logger = logging.getLogger(__name__)
+
+'''
+Computes the changes needed to bring the space to the state described by the InstallationContext, from the current
+state read in bulk, so setup only applies what is missing or different. With 'setup --plan' the changes are only logged.
+'''
+
+CREATE = 'create'
+DELETE_AND_CREATE = 'delete and create'
+# The name is taken by a service of another offering or plan. Deleting it destroys its data.
+REPLACE = 'replace'
+WAIT_FOR_CREATE = 'wait for create'
+WAIT_FOR_DELETE_AND_CREATE = 'wait for delete and create'
+PUSH = 'push'
+REGISTER = 'register'
+NONE = 'none'
+
+Change = namedtuple('Change', ['action', 'kind', 'name', 'reason', 'target'])
+SpaceState = namedtuple('SpaceState', ['services', 'apps'])
+AppState = namedtuple('AppState', ['name', 'state', 'routes'])
+
+
+def v3_resources(cf, path):
+    """
+    Returns all the resources of a CF v3 API list, following the pagination.
+    """
+    resources = []
+    included = {}
+    while path:
+        page = cf.curl(path)
+        resources.extend(page.get('resources', []))
+        for kind, items in page.get('included', {}).items():
+            included.setdefault(kind, []).extend(items)
+        next_page = (page.get('pagination') or {}).get('next')
+        path = re.sub('^https?://[^/]+', '', next_page['href']) if next_page else None
+    return resources, included
+
+
+def read_services(cf, space_guid):
+    instances, included = v3_resources(
+        cf, '/v3/service_instances?per_page=5000&space_guids=%s'
+            '&fields[service_plan]=guid,name,relationships.service_offering'
+            '&fields[service_plan.service_offering]=guid,name' % space_guid)
+    plans = {plan['guid']: plan for plan in included.get('service_plans', [])}
+    offerings = {offering['guid']: offering['name'] for offering in included.get('service_offerings', [])}
+    services = {}
+    for instance in instances:
+        plan = plans.get(((instance.get('relationships', {}).get('service_plan') or {}).get('data') or {})
+                         .get('guid'), {})
+        offering_guid = ((plan.get('relationships', {}).get('service_offering') or {}).get('data') or {}).get('guid')
+        last_operation = instance.get('last_operation') or {}
+        status = "%s %s" % (last_operation.get('type'), last_operation.get('state')) if last_operation else None
+        services[instance['name']] = Service(
+            name=instance['name'],
+            service=offerings.get(offering_guid, 'user-provided' if instance.get('type') == 'user-provided' else None),
+            plan=plan.get('name'),
+            status=status,
+            message=last_operation.get('description'))
+    return services
+
+
+def read_apps(cf, space_guid):
+    apps, included = v3_resources(cf, '/v3/apps?per_page=5000&space_guids=%s' % space_guid)
+    routes, included = v3_resources(cf, '/v3/routes?per_page=5000&space_guids=%s' % space_guid)
+    app_routes = {}
+    for route in routes:
+        for destination in route.get('destinations', []):
+            app_routes.setdefault(destination['app']['guid'], []).append(route['url'])
+    return {app['name']: AppState(name=app['name'], state=app.get('state'), routes=app_routes.get(app['guid'], []))
+            for app in apps}
+
+
+def read_service_states(cf):
+    """
+    Reads the services in the space with a few CF API calls, rather than one cf cli command per service. Falls back
+    to the cf cli commands if the API can't be used.
+    """
+    try:
+        return read_services(cf, cf.space_guid())
+    except (RuntimeError, ValueError, KeyError, TypeError) as e:
+        logger.debug("unable to read the services from the CF API, using the cf cli: %s" % str(e))
+        return {service.name: service for service in cf.services() if service}
+
+
+def read_app_states(cf):
+    try:
+        return read_apps(cf, cf.space_guid())
+    except (RuntimeError, ValueError, KeyError, TypeError) as e:
+        logger.debug("unable to read the apps from the CF API, using the cf cli: %s" % str(e))
+        return {name: AppState(name, None, []) for name in cf.apps()}
+
+
+def read_space_state(cf):
+    return SpaceState(services=read_service_states(cf), apps=read_app_states(cf))
+
+
+def plan_services(services_config, services):
+    changes = []
+    for required_service in services_config.values():
+        # ServiceConfig equality includes the config, which a parsed service doesn't have
+        matches = [service for service in services.values() if service.name == required_service.name and
+                   service.service == required_service.service and service.plan == required_service.plan]
+        if not matches:
+            if required_service.name in services:
+                # The name is taken, so it must be deleted first
+                existing = services[required_service.name]
+                changes.append(Change(REPLACE, 'service', required_service.name, 'is %s %s' % (
+                    existing.service, existing.plan), required_service))
+            else:
+                changes.append(Change(CREATE, 'service', required_service.name, 'does not exist', required_service))
+            continue
+        service = matches[0]
+        if service.status in ['create succeeded', 'update succeeded']:
+            changes.append(Change(NONE, 'service', service.name, service.status, required_service))
+        elif service.status == 'create in progress':
+            changes.append(Change(WAIT_FOR_CREATE, 'service', service.name, service.status, required_service))
+        elif service.status == 'delete in progress':
+            changes.append(Change(WAIT_FOR_DELETE_AND_CREATE, 'service', service.name, service.status,
+                                  required_service))
+        elif service.status in ['create failed', 'delete failed']:
+            changes.append(Change(DELETE_AND_CREATE, 'service', service.name, service.status, required_service))
+        else:
+            logger.warning("status of required service %s is %s" % (service.name, service.status))
+            changes.append(Change(NONE, 'service', service.name, 'unknown status %s' % service.status,
+                                  required_service))
+    return changes
+
+
+def jar_sha1(manifest):
+    """
+    The sha1 of the jar at the manifest's path. The path is the same for every server version, so the jar contents
+    tell a new version or SNAPSHOT build apart.
+    """
+    match = re.search('(?m)^\\s*path:\\s*(.*?)\\s*$', manifest)
+    if not match or not os.path.isfile(match.group(1)):
+        return None
+    sha1 = hashlib.sha1()
+    with open(match.group(1), 'rb') as jar:
+        for chunk in iter(lambda: jar.read(1024 * 1024), b''):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+def manifest_digest(manifest):
+    # The host name is random for each manifest, so it is not part of the desired state
+    digest = hashlib.sha256(re.sub('(?m)^\\s*host:.*$', '', manifest).encode())
+    digest.update(str(jar_sha1(manifest)).encode())
+    return digest.hexdigest()
+
+
+def deployed_manifest_path(cf, application_name):
+    return cf.work_path('%s.deployed' % application_name)
+
+
+def plan_app(cf, application_name, manifest, apps, db_reset=None):
+    """
+    An app is pushed unless it is started and was last pushed, from this work dir, with the same manifest and jar.
+    db_reset is the outcome of resetting the app's DB, if it was. The running app still uses the old schema, so it is
+    pushed again.
+    """
+    app = apps.get(application_name)
+    if not app:
+        return Change(PUSH, 'app', application_name, 'does not exist', manifest)
+    if db_reset:
+        return Change(PUSH, 'app', application_name, 'DB was %s' % db_reset, manifest)
+    if app.state and app.state != 'STARTED':
+        return Change(PUSH, 'app', application_name, 'is %s' % app.state, manifest)
+    path = deployed_manifest_path(cf, application_name)
+    if not os.path.exists(path):
+        return Change(PUSH, 'app', application_name, 'was not pushed from %s' % cf.work_dir, manifest)
+    with open(path) as deployed:
+        if deployed.read() != manifest_digest(manifest):
+            return Change(PUSH, 'app', application_name, 'manifest or jar changed', manifest)
+    return Change(NONE, 'app', application_name, 'manifest unchanged', manifest)
+
+
+def record_app(cf, application_name, manifest):
+    with open(deployed_manifest_path(cf, application_name), 'w') as deployed:
+        deployed.write(manifest_digest(manifest))
+
+
+def plan_registrations(app_imports, registered):
+    """
+    registered is the list of app registrations from the dataflow server /apps endpoint.
+    """
+    current = {(app['type'], app['name'], app.get('version')): app['uri'] for app in registered}
+    changes = []
+    for app in app_imports.apps:
+        key = (app.app_type, app.app_name, app.version)
+        name = '%s.%s:%s' % key
+        if key not in current:
+            changes.append(Change(REGISTER, 'app registration', name, 'not registered', app))
+        elif current[key] != app.uri:
+            changes.append(Change(REGISTER, 'app registration', name, 'registered as %s' % current[key], app))
+        else:
+            changes.append(Change(NONE, 'app registration', name, 'registered', app))
+    return changes
+
+
+def log_plan(changes):
+    pending = [change for change in changes if change.action != NONE]
+    for change in changes:
+        logger.info("%-26s %-16s %s (%s)" % (change.action, change.kind, change.name, change.reason))
+    logger.info("plan: %d changes, %d unchanged" % (len(pending), len(changes) - len(pending)))
+    return pending
+
+
+def apply_changes(changes, apply, max_workers=4):
+    """
+    Applies independent changes concurrently. apply(change) is called for each change with an action. Raises a
+    RuntimeError, once all the changes are done, if any failed.
+    """
+    pending = [change for change in changes if change.action != NONE]
+    if not pending:
+        return
+    failures = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(apply, change): change for change in pending}
+        for future, change in futures.items():
+            try:
+                future.result()
+            except Exception as e:
+                logger.error("failed to %s %s %s:\n%s" % (change.action, change.kind, change.name, get_traceback(e)))
+                failures.append(change)
+    if failures:
+        raise RuntimeError("FATAL: failed to %s" % ', '.join(["%s %s" % (c.action, c.name) for c in failures]))
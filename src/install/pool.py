@@ -0,0 +1,262 @@
+__copyright__ = '''
+Copyright 2022 the original author or authors.
+  Licensed under the Apache License, Version 2.0 (the "License");
+  you may not use this file except in compliance with the License.
+  You may obtain a copy of the License at
+      http://www.apache.org/licenses/LICENSE-2.0
+  Unless required by applicable law or agreed to in writing, software
+  distributed under the License is distributed on an "AS IS" BASIS,
+  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+  See the License for the specific language governing permissions and
+  limitations under the License.
+'''
+
+__author__ = 'David Turanski'
+
+import fcntl
+import json
+import logging
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from optparse import OptionParser
+from pathlib import Path
+
+from cloudfoundry.platform.config.configuration import ConfigurationProperties
+from cloudfoundry.platform.config.installation import InstallationContext
+from install import enable_debug_logging
+from install.clean import clean
+from install.fanout import download_shared_jars, install_target, space_overrides, target_env
+from install.util import get_traceback
+
+logger = logging.getLogger(__name__)
+
+'''
+A pool of spaces with SCDF already installed, so a test job can claim one in seconds instead of waiting for the
+services and servers to be created. Usage:
+
+    python -m install.pool fill --size 3 --spacePattern scdf-pool-%d [--interval 300] [-- setup options]
+    python -m install.pool claim --owner $CI_JOB_ID [--properties cf_scdf.properties]
+    python -m install.pool release --space scdf-pool-1
+    python -m install.pool status
+'''
+
+PROVISIONING = 'provisioning'
+READY = 'ready'
+CLAIMED = 'claimed'
+RELEASING = 'releasing'
+RELEASED = 'released'
+FAILED = 'failed'
+
+
+class WarmPool:
+    """
+    The pool state, a space name -> entry map, is kept in a JSON file. Every change is made holding an exclusive lock,
+    so any number of processes can fill, claim and release at the same time.
+    """
+
+    def __init__(self, pool_dir, env=os.environ, provisioning_timeout_sec=3600, clock=time.time):
+        self.pool_dir = pool_dir
+        self.env = env
+        # A fill that was killed leaves its spaces provisioning. They are failed after this time.
+        self.provisioning_timeout_sec = provisioning_timeout_sec
+        self.clock = clock
+        self.state_path = os.path.join(pool_dir, 'pool.json')
+        Path(pool_dir).mkdir(parents=True, exist_ok=True)
+
+    @contextmanager
+    def locked(self):
+        with open(self.state_path + '.lock', 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                entries = self.load()
+                yield entries
+                self.save(entries)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def load(self):
+        if not os.path.exists(self.state_path):
+            return {}
+        with open(self.state_path) as file:
+            return json.load(file)
+
+    def save(self, entries):
+        partial = self.state_path + '.partial'
+        with open(partial, 'w') as file:
+            json.dump(entries, file, indent=4)
+        os.replace(partial, self.state_path)
+
+    def work_dir(self, space):
+        return os.path.join(self.pool_dir, space)
+
+    def target_env(self, space):
+        return target_env(self.env, space_overrides(self.env, space), self.work_dir(space))
+
+    def set_state(self, entries, space, state, **kwargs):
+        entry = entries.get(space, {'space': space})
+        entry.update(kwargs)
+        entry['state'] = state
+        entry['updated'] = self.clock()
+        entries[space] = entry
+        return entry
+
+    def fail_stale_provisioning(self, entries):
+        for entry in list(entries.values()):
+            if entry['state'] == PROVISIONING and self.clock() - entry['updated'] > self.provisioning_timeout_sec:
+                logger.warning("space %s has been provisioning for more than %d sec" %
+                               (entry['space'], self.provisioning_timeout_sec))
+                self.set_state(entries, entry['space'], FAILED, error='provisioning timed out')
+
+    def claim(self, owner):
+        """
+        Returns the entry of a ready space, now claimed by owner, e.g., the CI job id, or None if none is ready.
+        """
+        with self.locked() as entries:
+            ready = sorted([entry for entry in entries.values() if entry['state'] == READY],
+                           key=lambda entry: entry['updated'])
+            if not ready:
+                return None
+            return self.set_state(entries, ready[0]['space'], CLAIMED, claimed_by=owner)
+
+    def release(self, space):
+        """
+        Deletes the apps in a claimed space, keeping the services, and returns it to the pool to be set up again.
+        """
+        with self.locked() as entries:
+            if entries.get(space, {}).get('state') != CLAIMED:
+                raise ValueError("space %s is not claimed" % space)
+            self.set_state(entries, space, RELEASING, claimed_by=None)
+        try:
+            clean(['--appsOnly'], InstallationContext.from_env_vars(self.target_env(space)))
+            state = RELEASED
+        except (Exception, SystemExit) as e:
+            logger.error("failed to clean space %s:\n%s" % (space, get_traceback(e)))
+            state = FAILED
+        with self.locked() as entries:
+            return self.set_state(entries, space, state)
+
+    def fill(self, size, space_pattern, setup_args=[], max_parallel=4):
+        """
+        Sets up spaces until 'size' are ready or being set up. Released spaces are set up first, since their services
+        already exist, then failed ones, then new spaces named by space_pattern.
+        """
+        with self.locked() as entries:
+            self.fail_stale_provisioning(entries)
+            available = len([entry for entry in entries.values() if entry['state'] in [READY, PROVISIONING]])
+            reusable = sorted([entry['space'] for entry in entries.values() if entry['state'] == RELEASED]) + \
+                sorted([entry['space'] for entry in entries.values() if entry['state'] == FAILED])
+            spaces = []
+            i = 1
+            while available + len(spaces) < size:
+                if reusable:
+                    space = reusable.pop(0)
+                else:
+                    space = space_pattern % i
+                    i = i + 1
+                    if space in entries:
+                        continue
+                spaces.append(space)
+                self.set_state(entries, space, PROVISIONING)
+        if not spaces:
+            logger.info("pool has %d ready or provisioning spaces" % available)
+            return []
+
+        logger.info("setting up %s" % str(spaces))
+        with ThreadPoolExecutor(max_workers=max_parallel) as executor:
+            futures = [executor.submit(install_target, space, self.target_env(space), setup_args) for space in spaces]
+            results = [future.result() for future in futures]
+
+        with self.locked() as entries:
+            for result in results:
+                if result.status == 'succeeded':
+                    self.set_state(entries, result.name, READY, properties_path=result.properties_path,
+                                   setup_sec=result.elapsed_sec)
+                else:
+                    self.set_state(entries, result.name, FAILED, error=result.error)
+        return results
+
+
+def pool(args, env=os.environ):
+    parser = OptionParser()
+    parser.usage = "%prog fill|claim|release|status [options] [-- setup options]"
+    parser.add_option('-v', '--debug',
+                      help='debug level logging',
+                      dest='debug', action='store_true')
+    parser.add_option('--size',
+                      help='fill: the number of spaces to keep ready',
+                      dest='size', type='int', default=2)
+    parser.add_option('--spacePattern',
+                      help="fill: the name of new spaces, e.g., 'scdf-pool-%d'",
+                      dest='space_pattern', default='scdf-pool-%d')
+    parser.add_option('--maxParallel',
+                      help='fill: the maximum number of concurrent installations',
+                      dest='max_parallel', type='int', default=4)
+    parser.add_option('--provisioningTimeout',
+                      help='fill: fail spaces that are provisioning for longer than this many seconds',
+                      dest='provisioning_timeout', type='int', default=3600)
+    parser.add_option('--interval',
+                      help='fill: keep filling the pool, every interval seconds',
+                      dest='interval', type='int')
+    parser.add_option('--properties',
+                      help='claim: where to copy the runtime properties of the claimed space',
+                      dest='properties_path', default='cf_scdf.properties')
+    parser.add_option('--owner',
+                      help='claim: who claims the space, e.g., the CI job id, recorded in the pool state',
+                      dest='owner')
+    parser.add_option('--space',
+                      help='release: the space to release',
+                      dest='space')
+    try:
+        options, arguments = parser.parse_args(args)
+        if options.debug:
+            enable_debug_logging()
+        if not arguments:
+            raise SystemExit()
+        command, setup_args = arguments[0], arguments[1:]
+        warm_pool = WarmPool(ConfigurationProperties.from_env_vars(env).cache_path('pool'), env,
+                             provisioning_timeout_sec=options.provisioning_timeout)
+
+        if command == 'fill':
+            setup_args = download_shared_jars(setup_args, [env])
+            while True:
+                results = warm_pool.fill(options.size, options.space_pattern, setup_args, options.max_parallel)
+                if not options.interval:
+                    return results
+                time.sleep(options.interval)
+        elif command == 'claim':
+            if not options.owner:
+                raise SystemExit()
+            entry = warm_pool.claim(options.owner)
+            if not entry:
+                logger.error("no ready space in the pool")
+                return None
+            shutil.copyfile(entry['properties_path'], options.properties_path)
+            logger.info("claimed space %s, runtime properties in %s" % (entry['space'], options.properties_path))
+            return entry
+        elif command == 'release':
+            if not options.space:
+                raise SystemExit()
+            entry = warm_pool.release(options.space)
+            if entry['state'] == FAILED:
+                logger.error("failed to release space %s" % options.space)
+                return None
+            return entry
+        elif command == 'status':
+            entries = warm_pool.load()
+            for entry in sorted(entries.values(), key=lambda entry: entry['space']):
+                logger.info("%s: %s" % (entry['space'], entry['state']))
+            return entries
+        else:
+            raise SystemExit()
+    except SystemExit:
+        parser.print_help()
+        exit(1)
+
+
+if __name__ == '__main__':
+    if pool(sys.argv[1:]) is None:
+        exit(1)
@@ -0,0 +1,278 @@
+__copyright__ = '''
+Copyright 2022 the original author or authors.
+  Licensed under the Apache License, Version 2.0 (the "License");
+  you may not use this file except in compliance with the License.
+  You may obtain a copy of the License at
+      http://www.apache.org/licenses/LICENSE-2.0
+  Unless required by applicable law or agreed to in writing, software
+  distributed under the License is distributed on an "AS IS" BASIS,
+  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+  See the License for the specific language governing permissions and
+  limitations under the License.
+'''
+
+__author__ = 'David Turanski'
+
+import logging
+import time
+from contextlib import contextmanager
+from functools import partial
+
+import psycopg2
+import psycopg2.pool
+
+from install.db import RESET_TEMPLATE, RESET_TRUNCATE, SCHEMA_HISTORY_TABLE, TERMINATE_MAX_WAIT_SEC, \
+    DBProbeResult, db_server_versions, db_templates, schema_versions_comment, init_concurrently
+
+logger = logging.getLogger(__name__)
+
+'''
+PostgreSQL DB initialization. Imported only if a postgresql DB is initialized.
+'''
+
+
+def initialize(db_config, reset_mode, server_versions):
+    templates = db_templates(db_config, server_versions) if reset_mode == RESET_TEMPLATE else {}
+    targets = db_server_versions(db_config, server_versions)
+    pool = postgres_admin_pool(db_config, len(targets))
+    try:
+        return init_concurrently({dbname: partial(reset_postgres_db, db_config, dbname, versions, reset_mode,
+                                                  templates.get(dbname), pool)
+                                  for dbname, versions in targets.items()})
+    finally:
+        pool.closeall()
+
+
+def postgres_connect(db_config, dbname='postgres'):
+    # TODO: This may not be optimal. See https://stackoverflow.com/questions/2370525/default-database-named-postgres-on-postgresql-server
+    conn = psycopg2.connect(
+        host=db_config.host,
+        port=db_config.port,
+        user=db_config.username,
+        password=db_config.password,
+        dbname=dbname,
+        connect_timeout=5)
+    conn.autocommit = True
+    return conn
+
+
+def postgres_admin_pool(db_config, size):
+    """
+    A pool of connections to the postgres (system) database, shared by the concurrent DB initializations.
+    """
+    return psycopg2.pool.ThreadedConnectionPool(1, size,
+                                                host=db_config.host,
+                                                port=db_config.port,
+                                                user=db_config.username,
+                                                password=db_config.password,
+                                                dbname='postgres',
+                                                connect_timeout=5)
+
+
+@contextmanager
+def admin_connection(db_config, pool=None):
+    conn = pool.getconn() if pool else postgres_connect(db_config)
+    conn.autocommit = True
+    try:
+        yield conn
+    finally:
+        if pool:
+            pool.putconn(conn)
+        else:
+            conn.close()
+
+
+def terminate_postgres_connections(cur, dbname, max_wait_sec=TERMINATE_MAX_WAIT_SEC):
+    wait_sec = 0.05
+    waited_sec = 0
+    cur.execute("SELECT count(*) FROM pg_stat_activity WHERE datname = '%s';" % dbname)
+    live_connections = cur.fetchone()[0]
+    logger.debug("DB %s has %d live connections" % (dbname, live_connections))
+    while live_connections > 0:
+        if waited_sec > max_wait_sec:
+            raise RuntimeError("DB %s still has %d live connections after %d sec" % (
+                dbname, live_connections, max_wait_sec))
+        # Terminate any existing connections to the database
+        cur.execute("SELECT pg_terminate_backend(pid) FROM pg_stat_activity WHERE datname = '%s';" % dbname)
+        time.sleep(wait_sec)
+        waited_sec = waited_sec + wait_sec
+        wait_sec = min(wait_sec * 2, 1.0)
+        cur.execute("SELECT count(*) FROM pg_stat_activity WHERE datname = '%s';" % dbname)
+        live_connections = cur.fetchone()[0]
+        logger.debug("DB %s has %d live connections" % (dbname, live_connections))
+
+
+def drop_postgres_db(conn, dbname):
+    with conn.cursor() as cur:
+        # Postgresql 13+ terminates the connections itself
+        if conn.server_version >= 130000:
+            cur.execute("DROP DATABASE IF EXISTS %s WITH (FORCE);" % dbname)
+        else:
+            terminate_postgres_connections(cur, dbname)
+            cur.execute("DROP DATABASE IF EXISTS %s;" % dbname)
+
+
+def postgres_db_exists(cur, dbname):
+    cur.execute("SELECT count(*) FROM pg_database WHERE datname = '%s';" % dbname)
+    return cur.fetchone()[0] > 0
+
+
+def init_postgres_db(db_config, dbname, template=None, pool=None):
+    """
+    Drop and recreate the database. If a template is given and exists, the database is cloned from it.
+    Returns the outcome, 'cloned' or 'created'.
+    """
+    logger.info("initializing postgresql DB %s..." % dbname)
+    # Connect to the postgres (system) database to drop/create target schema
+    with admin_connection(db_config, pool) as conn:
+        drop_postgres_db(conn, dbname)
+        with conn.cursor() as cur:
+            outcome = None
+            if template and postgres_db_exists(cur, template):
+                logger.info("creating postgresql DB %s from template %s" % (dbname, template))
+                outcome = clone_postgres_db(cur, dbname, template)
+            elif template:
+                logger.info("template %s does not exist. It will be created after the servers start" % template)
+            if not outcome:
+                cur.execute("CREATE DATABASE %s;" % dbname)
+                outcome = 'created'
+    logger.info("completed initialization of postgresql DB %s" % dbname)
+    return outcome
+
+
+def clone_postgres_db(cur, dbname, template):
+    """
+    Returns 'cloned', or None if the clone failed, e.g., because a session connected to the template in the meantime.
+    The database has already been dropped, so it must then be created empty.
+    """
+    try:
+        terminate_postgres_connections(cur, template)
+        cur.execute("CREATE DATABASE %s TEMPLATE %s;" % (dbname, template))
+        return 'cloned'
+    except (psycopg2.Error, RuntimeError) as e:
+        logger.warning("unable to create postgresql DB %s from template %s, creating it empty instead: %s" % (
+            dbname, template, str(e).strip()))
+        return None
+
+
+def reset_postgres_db(db_config, dbname, versions, reset_mode, template=None, pool=None):
+    if reset_mode == RESET_TRUNCATE and truncate_postgres_db(db_config, dbname, versions, pool):
+        return 'truncated'
+    return init_postgres_db(db_config, dbname, template, pool)
+
+
+def missing_db_templates(db_config, server_versions):
+    """
+    Returns the databases whose template does not exist yet, mapped to the template name.
+    """
+    templates = db_templates(db_config, server_versions)
+    conn = postgres_connect(db_config)
+    try:
+        with conn.cursor() as cur:
+            return {dbname: template for dbname, template in templates.items()
+                    if not postgres_db_exists(cur, template)}
+    finally:
+        conn.close()
+
+
+def create_db_templates(db_config, templates):
+    """
+    Copies each freshly migrated database to its template. Nothing may be connected to the databases, so
+    the servers must be stopped first.
+    """
+    conn = postgres_connect(db_config)
+    try:
+        with conn.cursor() as cur:
+            for dbname, template in templates.items():
+                logger.info("creating template %s from postgresql DB %s" % (template, dbname))
+                terminate_postgres_connections(cur, dbname)
+                cur.execute("CREATE DATABASE %s TEMPLATE %s;" % (template, dbname))
+    finally:
+        conn.close()
+
+
+def truncate_postgres_db(db_config, dbname, versions, pool=None):
+    """
+    Empty all the tables in the database and restart its sequences, in a single transaction, keeping the schema.
+    This is only done if the schema was migrated by the same server versions.
+    Returns False if the database must be dropped and recreated instead.
+    """
+    logger.info("truncating postgresql DB %s..." % dbname)
+    conn = None
+    try:
+        with admin_connection(db_config, pool) as admin_conn:
+            with admin_conn.cursor() as cur:
+                if not postgres_db_exists(cur, dbname):
+                    logger.info("postgresql DB %s does not exist" % dbname)
+                    return False
+                terminate_postgres_connections(cur, dbname)
+
+        conn = postgres_connect(db_config, dbname)
+        conn.autocommit = False
+        with conn.cursor() as cur:
+            cur.execute("SELECT obj_description(to_regclass('%s'), 'pg_class');" % SCHEMA_HISTORY_TABLE)
+            comment = cur.fetchone()[0]
+            if comment != schema_versions_comment(versions):
+                logger.info("postgresql DB %s schema version %s does not match %s" % (
+                    dbname, str(comment), schema_versions_comment(versions)))
+                return False
+            cur.execute("SET LOCAL lock_timeout = '10s';")
+            cur.execute("SELECT tablename FROM pg_tables WHERE schemaname = current_schema() AND tablename <> '%s';"
+                        % SCHEMA_HISTORY_TABLE)
+            tables = [row[0] for row in cur.fetchall()]
+            if tables:
+                cur.execute("TRUNCATE TABLE %s RESTART IDENTITY CASCADE;" % ', '.join(tables))
+            cur.execute("SELECT sequencename FROM pg_sequences WHERE schemaname = current_schema();")
+            for row in cur.fetchall():
+                cur.execute("ALTER SEQUENCE %s RESTART;" % row[0])
+        conn.commit()
+        logger.info("truncated %d tables in postgresql DB %s" % (len(tables), dbname))
+        return True
+    except (psycopg2.DatabaseError, psycopg2.OperationalError) as e:
+        logger.warning("unable to truncate postgresql DB %s: %s" % (dbname, str(e)))
+        if conn and not conn.closed:
+            conn.rollback()
+        return False
+    finally:
+        if conn:
+            conn.close()
+
+
+def record_schema_versions(db_config, server_versions):
+    """
+    Record the server versions that migrated each database, once the servers are up, to enable truncating it.
+    """
+    for dbname, versions in db_server_versions(db_config, server_versions).items():
+        conn = postgres_connect(db_config, dbname)
+        try:
+            with conn.cursor() as cur:
+                cur.execute("COMMENT ON TABLE %s IS '%s';" % (SCHEMA_HISTORY_TABLE, schema_versions_comment(versions)))
+            logger.debug("recorded schema versions %s for postgresql DB %s" % (str(versions), dbname))
+        finally:
+            conn.close()
+
+
+def probe(db_config, datasource_config, queries=3):
+    start = time.time()
+    conn = psycopg2.connect(
+        host=db_config.host,
+        port=db_config.port,
+        user=datasource_config.username,
+        password=datasource_config.password,
+        dbname=datasource_config.name,
+        connect_timeout=5)
+    connect_sec = time.time() - start
+    try:
+        with conn.cursor() as cur:
+            start = time.time()
+            for i in range(queries):
+                cur.execute("SELECT 1;")
+                cur.fetchone()
+            query_sec = (time.time() - start) / queries
+            cur.execute("SELECT has_schema_privilege(current_schema(), 'CREATE');")
+            can_create_tables = bool(cur.fetchone()[0])
+        conn.rollback()
+    finally:
+        conn.close()
+    return DBProbeResult(name=datasource_config.name, connect_sec=connect_sec, query_sec=query_sec,
+                         can_create_tables=can_create_tables)
@@ -14,17 +14,22 @@ Copyright 2022 the original author or authors.
 __author__ = 'David Turanski'
 
 import logging
+import os
 import sys
 import json
+from urllib.parse import urlparse
 
 from cloudfoundry.cli import CloudFoundry
 from optparse import OptionParser
 from cloudfoundry.platform import standalone, tile
+from cloudfoundry.platform.config.configuration import ConfigurationProperties
 from cloudfoundry.platform.config.installation import InstallationContext
-from cloudfoundry.platform.config.service import ServiceConfig
 from install import enable_debug_logging
-from install.db import init_db
-from cloudfoundry.platform.registration import register_apps
+from install.db import init_db, probe_db, reset_modes, RESET_DROP, RESET_TEMPLATE, RESET_TRUNCATE, missing_db_templates, \
+    create_db_templates, record_schema_versions, reset_db, reset_servers
+from cloudfoundry.platform.registration import AppRegistrations, register_apps, validate_app_imports
+from install.plan import plan_services, log_plan, apply_changes, read_service_states, read_space_state, \
+    WAIT_FOR_CREATE, WAIT_FOR_DELETE_AND_CREATE, DELETE_AND_CREATE, REPLACE
 from install.util import masked, setup_certs
 
 logger = logging.getLogger(__name__)
@@ -38,19 +43,39 @@ def add_options_for_platform(parser, platform):
     parser.add_option('--initializeDB',
                       help='enable external DB initialization',
                       dest='initialize_db', action='store_true')
+    parser.add_option('--dbResetMode',
+                      help='how to initialize the external DB %s: ' % str(reset_modes) +
+                           "'template' (postgresql only) clones a template of the migrated schema, " +
+                           "'truncate' (postgresql only) empties the tables if the schema version matches",
+                      dest='db_reset_mode', type='choice', choices=reset_modes, default=RESET_DROP)
+    parser.add_option('--probeDB',
+                      help='verify the external DB is reachable and responsive, with the server credentials, ' +
+                           'before deploying',
+                      dest='probe_db', action='store_true')
+    parser.add_option('--recreateServices',
+                      help='delete and recreate a required service whose name is taken by another service or plan, '
+                           'destroying its data',
+                      dest='recreate_services', action='store_true')
+    parser.add_option('--plan',
+                      help='log the changes setup would make, services, server apps and app registrations, '
+                           'and exit without making them',
+                      dest='plan', action='store_true')
+    parser.add_option('--validateAppImports',
+                      help='verify the maven artifacts in app-imports.properties exist before installing',
+                      dest='validate_app_imports', action='store_true')
     if platform == 'cloudfoundry':
         parser.add_option('-d', '--doNotDownload',
                           help='skip the downloading of the SCDF/Skipper servers',
                           dest='do_not_download', action='store_true')
 
 
-def setup(args):
+def setup(args, installation=None, cf=None):
     parser = OptionParser()
     parser.usage = "%prog setup options"
 
     try:
 
-        installation = InstallationContext.from_env_vars()
+        installation = installation if installation else InstallationContext.from_env_vars()
         add_options_for_platform(parser, installation.config_props.platform)
         options, arguments = parser.parse_args(args)
         if options.debug:
@@ -58,95 +83,165 @@ def setup(args):
 
         logger.debug("Setup using config:\n%s" % masked(installation))
 
-        cf = CloudFoundry.connect(deployer_config=installation.deployer_config,
-                                  config_props=installation.config_props)
-
-        # Initialize database
-        if installation.db_config:
-            installation.datasources_config = init_db(installation.db_config, options.initialize_db)
-
-        # Schreduler applies to any platform
-        if installation.services_config.get('scheduler'):
-            ensure_required_services(cf, dict(
-                filter(lambda entry: entry[0] == 'scheduler', installation.services_config.items())))
-            logger.debug("getting scheduler_url from service_key")
-            service_name = installation.services_config['scheduler'].name
-            key_name = installation.config_props.service_key_name
-            service_key = cf.create_service_key(service_name, key_name)
-            installation.deployer_config.scheduler_url = service_key['url']
-            cf.delete_service_key(service_key, key_name)
-
-        if installation.config_props.platform == "tile":
-            installation.services_config['dataflow'].config = tile.configure_dataflow_service(installation)
-
-        ensure_required_services(cf, installation.services_config)
-
-        if installation.config_props.platform == "tile":
-            runtime_properties = tile.setup(cf, installation)
-        elif installation.config_props.platform == "cloudfoundry":
-            runtime_properties = standalone.setup(cf, installation, options.do_not_download)
-        else:
-            logger.error(
-                "invalid platform type %s should be in [cloudfoundry,tile]" % installation.config_props.platform)
-
-        dataflow_uri = runtime_properties['SPRING_CLOUD_DATAFLOW_CLIENT_SERVER_URI']
-        setup_certs(installation.config_props.cert_host)
-        register_apps(cf, installation, dataflow_uri)
-        return runtime_properties
-    except SystemExit:
-        parser.print_help()
-        exit(1)
-
-
-def ensure_required_services(cf, services_config):
+        if options.validate_app_imports:
+            validate_app_imports(installation)
+
+        # A connection made here is closed here, removing its isolated cf home
+        connected = not cf
+        cf = cf if cf else CloudFoundry.connect(deployer_config=installation.deployer_config,
+                                                config_props=installation.config_props)
+        try:
+            if options.plan:
+                installation.datasources_config = init_db(installation.db_config)
+                plan(cf, installation)
+                return None
+
+            # Initialize database
+            db_templates = {}
+            db_reset = {}
+            reset_mode = RESET_DROP
+            if installation.db_config:
+                server_versions = {'dataflow': installation.config_props.dataflow_version,
+                                   'skipper': installation.config_props.skipper_version}
+                reset_mode = db_reset_mode(installation, options)
+                if options.initialize_db and reset_mode == RESET_TEMPLATE:
+                    db_templates = missing_db_templates(installation.db_config, server_versions)
+                if options.initialize_db:
+                    db_reset = reset_servers(installation.db_config,
+                                             reset_db(installation.db_config, reset_mode, server_versions))
+                installation.datasources_config = init_db(installation.db_config)
+                if options.probe_db:
+                    probe_db(installation.db_config, installation.datasources_config)
+
+            # Schreduler applies to any platform
+            if installation.services_config.get('scheduler'):
+                ensure_required_services(cf, dict(
+                    filter(lambda entry: entry[0] == 'scheduler', installation.services_config.items())),
+                    options.recreate_services)
+                logger.debug("getting scheduler_url from service_key")
+                service_name = installation.services_config['scheduler'].name
+                key_name = installation.config_props.service_key_name
+                service_key = cf.create_service_key(service_name, key_name)
+                installation.deployer_config.scheduler_url = service_key['url']
+                cf.delete_service_key(service_key, key_name)
+
+            if installation.config_props.platform == "tile":
+                installation.services_config['dataflow'].config = tile.configure_dataflow_service(installation)
+
+            ensure_required_services(cf, installation.services_config, options.recreate_services)
+
+            if installation.config_props.platform == "tile":
+                runtime_properties = tile.setup(cf, installation)
+            elif installation.config_props.platform == "cloudfoundry":
+                runtime_properties = standalone.setup(cf, installation, options.do_not_download, db_reset=db_reset)
+            else:
+                logger.error(
+                    "invalid platform type %s should be in [cloudfoundry,tile]" % installation.config_props.platform)
+
+            if db_templates:
+                # The servers have migrated the schema. Save it for the next time.
+                standalone.stop_servers(cf, installation)
+                create_db_templates(installation.db_config, db_templates)
+                standalone.start_servers(cf, installation)
+            if options.initialize_db and reset_mode == RESET_TRUNCATE:
+                record_schema_versions(installation.db_config, server_versions)
+
+            dataflow_uri = runtime_properties['SPRING_CLOUD_DATAFLOW_CLIENT_SERVER_URI']
+            truststore = setup_certs(cert_hosts(installation, dataflow_uri),
+                                     cache_dir=installation.config_props.cache_path('truststores'),
+                                     truststore=cf.work_path('mycacerts'), ca_bundle=cf.work_path('mycacerts.pem'))
+            if truststore and not installation.deployer_config.skip_ssl_validation:
+                cf.http.verify = cf.work_path('mycacerts.pem')
+            register_apps(cf, installation, dataflow_uri)
+            cf.http.log_metrics()
+            return runtime_properties
+        finally:
+            if connected:
+                cf.close()
+    except SystemExit as e:
+        # --help exits cleanly
+        if e.code:
+            parser.print_help()
+            exit(1)
+        raise
+
+
+def cert_hosts(installation, dataflow_uri):
+    hosts = [installation.config_props.cert_host,
+             installation.deployer_config.trust_certs_host(),
+             urlparse(dataflow_uri).netloc]
+    return list(dict.fromkeys([host for host in hosts if host]))
+
+
+def db_reset_mode(installation, options):
+    # Only the standalone platform pins the server versions that migrate the schema
+    if options.db_reset_mode in [RESET_TEMPLATE, RESET_TRUNCATE]:
+        if not installation.db_config.provider.is_postrgesql():
+            logger.warning("DB reset mode '%s' requires postgresql" % options.db_reset_mode)
+            return RESET_DROP
+        if installation.config_props.platform != 'cloudfoundry':
+            logger.warning("DB reset mode '%s' requires the cloudfoundry platform" % options.db_reset_mode)
+            return RESET_DROP
+    return options.db_reset_mode
+
+
+def ensure_required_services(cf, services_config, recreate_services=False):
     logger.info("verifying availability of required services:" + str([str(s) for s in services_config]))
-
-    services = cf.services()
-    required_services = {'create': [], 'wait': [], 'failed': [], 'deleting': [], 'unknown': []}
-
-    for required_service in services_config.values():
-        if required_service not in [ServiceConfig.of_service(service) for service in services]:
-            logger.debug("Adding %s to required services" % masked(required_service))
-            required_services['create'].append(required_service)
-        else:
-            logger.debug("Checking health of required service %s" % masked(required_service))
-            for service in services:
-                if ServiceConfig.of_service(service) == required_service:
-                    if service.status not in ['create succeeded', 'update succeeded']:
-                        logger.warning(
-                            "status of required service %s is %s" % (service.name, service.status))
-                        if service.status == 'create in progress':
-                            required_services['wait'].append(service)
-                        elif service.status == 'delete in progress':
-                            required_services['deleting'].append(service)
-                        elif service.status == 'create failed':
-                            required_services['failed'].append(service)
-                        elif service.status == 'delete failed':
-                            required_services['failed'].append(service)
-                        else:
-                            required_services['unknown'].append(service)
-                else:
-                    logger.debug("required service is healthy %s" % masked(required_service))
-
-        for s in required_services['deleting']:
-            logger.info("waiting for required service %s to be deleted" % str(s))
-            cf.wait_for_delete_service(s.name)
-            required_services['create'].append(s)
-        for s in required_services['failed']:
-            logger.warning("required service %s ' in a failed state. Attempting delete..." % s.name)
-            cf.delete_service(s.name)
-
-        for s in required_services['wait']:
-            cf.wait_for_create_service(s)
-        for s in required_services['create']:
-            logger.debug("creating service:\n%s" + masked(s))
-            cf.create_service(s)
-
-
-if __name__ == '__main__':
-    shared_properties = setup(sys.argv)
+    changes = plan_services(services_config, read_service_states(cf))
+    log_plan(changes)
+    replaced = [change.name for change in changes if change.action == REPLACE]
+    if replaced and not recreate_services:
+        raise RuntimeError("FATAL: service(s) %s exist with a different service or plan. Deleting them destroys "
+                           "their data. Rerun with '--recreateServices' to replace them" % ', '.join(replaced))
+    # Brokers provision services independently of each other
+    apply_changes(changes, lambda change: apply_service_change(cf, change))
+
+
+def apply_service_change(cf, change):
+    if change.action == WAIT_FOR_CREATE:
+        cf.wait_for_create_service(change.target)
+        return
+    if change.action == WAIT_FOR_DELETE_AND_CREATE:
+        cf.wait_for_delete_service(change.name)
+    elif change.action in [DELETE_AND_CREATE, REPLACE]:
+        logger.warning("required service %s %s. Attempting delete..." % (change.name, change.reason))
+        cf.delete_service(change.name)
+    logger.debug("creating service:\n%s" % masked(change.target))
+    proc = cf.create_service(change.target)
+    if proc.returncode:
+        raise RuntimeError("FATAL: unable to create service %s" % change.name)
+
+
+def plan(cf, installation, app_import_path='app-imports.properties'):
+    """
+    Logs the changes setup would make, without making any.
+    """
+    state = read_space_state(cf)
+    changes = plan_services(installation.services_config, state.services)
+    if installation.config_props.platform == 'cloudfoundry':
+        changes.extend(standalone.plan(cf, installation, state.apps))
+        dataflow_app = state.apps.get('dataflow-server')
+        if dataflow_app and dataflow_app.routes:
+            app_registrations = AppRegistrations(cf, installation.config_props,
+                                                 server_uri='https://' + dataflow_app.routes[0],
+                                                 app_import_path=app_import_path)
+            changes.extend(app_registrations.plan())
+    for change in changes:
+        if change.action == REPLACE:
+            logger.warning("service %s %s. setup deletes it, and its data, only with '--recreateServices'" % (
+                change.name, change.reason))
+    return log_plan(changes)
+
+
+def write_properties(shared_properties, path='cf_scdf.properties'):
     # TODO not sure a better way to make this available to calling shell script
-    with open('cf_scdf.properties', 'w') as output:
+    with open(path, 'w') as output:
         for k, v in shared_properties.items():
             output.write('%s=%s\n' % (k, v))
-    output.close()
+
+
+if __name__ == '__main__':
+    runtime_properties = setup(sys.argv)
+    if runtime_properties is not None:
+        write_properties(runtime_properties,
+                         os.path.join(ConfigurationProperties.from_env_vars().work_dir, 'cf_scdf.properties'))
@@ -13,6 +13,7 @@ Copyright 2022 the original author or authors.
 
 __author__ = 'David Turanski'
 
+import os
 import subprocess
 import shlex
 import logging
@@ -21,8 +22,18 @@ logger = logging.getLogger(__name__)
 
 
 class Shell:
-    def __init__(self, dry_run=False):
+    def __init__(self, dry_run=False, env=None):
         self.dry_run = dry_run
+        # Environment variables added to the current environment for each command
+        self.env = env if env else {}
+
+    def with_env(self, env):
+        """
+        Returns a Shell that runs commands with the additional environment variables
+        """
+        merged = dict(self.env)
+        merged.update(env)
+        return Shell(self.dry_run, merged)
 
     def exec(self, cmd, capture_output=True):
         args = shlex.split(cmd)
@@ -31,7 +42,8 @@ class Shell:
             proc = subprocess.CompletedProcess(args, 0)
             return proc
         else:
-            return subprocess.run(args, capture_output=capture_output)
+            env = dict(os.environ, **self.env) if self.env else None
+            return subprocess.run(args, capture_output=capture_output, env=env)
 
     @classmethod
     def log_stdout(cls, completed_proc):
@@ -13,17 +13,24 @@ Copyright 2022 the original author or authors.
 
 __author__ = 'David Turanski'
 
+import hashlib
 import logging
 import os
 import shutil
+import socket
+import ssl
+import tempfile
 import time
 import traceback
+from concurrent.futures import ThreadPoolExecutor
 from os.path import exists
+from pathlib import Path
 
 import requests
 import json
 from urllib.parse import urlparse, urlunparse
 
+from install.http_client import HttpClient
 from install.shell import Shell
 
 logger = logging.getLogger(__name__)
@@ -61,8 +68,22 @@ class Poller:
         return predicate
 
 
-def wait_for_200(poller, url):
-    return poller.wait_for(success_condition=lambda url: requests.get(url).status_code == 200,
+def wait_for_200(poller, url, auth=None, http=None):
+    # The poller retries, so each poll is a single request
+    http = http.without_retries() if http else HttpClient(retries=0)
+    if auth and not url.startswith('https://'):
+        # Never send credentials in cleartext
+        logger.warning("not sending credentials to %s" % url)
+        auth = None
+
+    def is_up(url):
+        try:
+            return http.get(url, auth=auth).status_code == 200
+        except requests.RequestException as e:
+            logger.debug("%s is not reachable: %s" % (url, str(e)))
+            return False
+
+    return poller.wait_for(success_condition=is_up,
                            args=[url],
                            success_message=url + " is up!",
                            fail_message=url + " is down")
@@ -112,16 +133,24 @@ def mask(k, v):
     return v
 
 
-def setup_certs(cert_host, shell=Shell()):
-    import_certs = './import_uaa_certs.sh'
-    logger.debug("importing the cert_host certificate for %s to a JDK trust-store" % cert_host)
-    proc = shell.exec("%s %s" % (import_certs, cert_host), capture_output=False)
-    if proc.returncode > 0:
-        raise RuntimeError("%s failed")
-
-    java_home = os.getenv('JAVA_HOME')
-    if not java_home:
-        raise ValueError('JAVA_HOME is not set')
+def fetch_certificates(host, timeout=10):
+    """
+    Returns the DER encoded certificates presented by 'host[:port]'. The whole chain is returned if the Python
+    runtime supports it, otherwise only the peer certificate.
+    """
+    hostname, port = (host.split(':') + ['443'])[0:2]
+    context = ssl.create_default_context()
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    with socket.create_connection((hostname, int(port)), timeout=timeout) as sock:
+        with context.wrap_socket(sock, server_hostname=hostname) as tls:
+            chain = tls.get_unverified_chain() if hasattr(tls, 'get_unverified_chain') else None
+            if chain and all(type(cert) is bytes for cert in chain):
+                return chain
+            return [tls.getpeercert(binary_form=True)]
+
+
+def jdk_cacerts(java_home):
     # The cacerts location is different for Java 8 and 11.
     # Java 1.8
     jre_cacerts = "%s/jre/lib/security/cacerts" % java_home
@@ -132,9 +161,82 @@ def setup_certs(cert_host, shell=Shell()):
         logger.info("trying %s" % jre_cacerts)
     if not exists(jre_cacerts):
         raise RuntimeError("%s does not exist" % jre_cacerts)
-    shutil.copyfile(jre_cacerts, 'mycacerts')
-    proc = shell.exec(
-        '%s/bin/keytool -import -alias myNewCertificate -file %s.cer -noprompt -keystore mycacerts -storepass changeit'
-        % (java_home, cert_host), capture_output=False)
-    if proc.returncode > 0:
-        raise RuntimeError("Unable to create keystore ' %s" % shell.stdout_to_s(proc))
+    return jre_cacerts
+
+
+def truststore_key(cacerts, certificates):
+    """
+    A truststore is identified by the JDK cacerts it extends and the fingerprints of the certificates added to it.
+    """
+    digest = hashlib.sha256()
+    with open(cacerts, 'rb') as file:
+        digest.update(file.read())
+    for fingerprint in sorted([hashlib.sha256(cert).hexdigest() for cert in certificates]):
+        digest.update(fingerprint.encode())
+    return digest.hexdigest()
+
+
+def setup_certs(cert_hosts, cache_dir=None, truststore='mycacerts', ca_bundle='mycacerts.pem', shell=Shell(),
+                fetch=fetch_certificates):
+    """
+    Create a JDK truststore, trusting the certificates presented by each of the cert_hosts, from a copy of the JDK
+    cacerts. The certificates are fetched in parallel. If cache_dir is set, a truststore is only built once for
+    the same JDK cacerts and certificates. The same certificates are added to a copy of the requests CA bundle,
+    ca_bundle, for the installer's own HTTP calls. Returns the truststore, or None if there are no cert_hosts.
+    """
+    if isinstance(cert_hosts, str):
+        cert_hosts = [cert_hosts]
+    if not cert_hosts:
+        logger.debug("no certificates to import")
+        return None
+    java_home = os.getenv('JAVA_HOME')
+    if not java_home:
+        raise ValueError('JAVA_HOME is not set')
+    jre_cacerts = jdk_cacerts(java_home)
+
+    logger.debug("importing the certificates for %s to a JDK trust-store" % str(cert_hosts))
+    with ThreadPoolExecutor(max_workers=len(cert_hosts)) as executor:
+        try:
+            host_certificates = dict(zip(cert_hosts, executor.map(fetch, cert_hosts)))
+        except OSError as e:
+            raise RuntimeError("Failed to import certs from %s: %s" % (str(cert_hosts), str(e)))
+
+    certificates = {}
+    for host, certs in host_certificates.items():
+        for i in range(len(certs)):
+            certificates.setdefault(hashlib.sha256(certs[i]).hexdigest(), ('%s-%d' % (host, i), certs[i]))
+
+    if ca_bundle:
+        shutil.copyfile(requests.certs.where(), ca_bundle)
+        with open(ca_bundle, 'a') as file:
+            for alias, cert in certificates.values():
+                file.write(ssl.DER_cert_to_PEM_cert(cert))
+
+    key = truststore_key(jre_cacerts, [cert for alias, cert in certificates.values()])
+    cached = os.path.join(cache_dir, key) if cache_dir else None
+    if cached and exists(cached):
+        logger.info("using cached trust-store %s" % cached)
+        shutil.copyfile(cached, truststore)
+        return truststore
+
+    with tempfile.TemporaryDirectory() as tmp:
+        keystore = os.path.join(tmp, 'cacerts')
+        shutil.copyfile(jre_cacerts, keystore)
+        for alias, cert in certificates.values():
+            cert_file = os.path.join(tmp, alias + '.cer')
+            with open(cert_file, 'w') as file:
+                file.write(ssl.DER_cert_to_PEM_cert(cert))
+            proc = shell.exec(
+                '%s/bin/keytool -importcert -alias scdf-cf-setup-%s -file %s -noprompt -keystore %s '
+                '-storepass changeit' % (java_home, alias, cert_file, keystore), capture_output=False)
+            if proc.returncode > 0:
+                raise RuntimeError("Unable to create keystore ' %s" % shell.stdout_to_s(proc))
+        if cached:
+            Path(cache_dir).mkdir(parents=True, exist_ok=True)
+            # Concurrent installs may build the same trust-store
+            fd, partial = tempfile.mkstemp(dir=cache_dir, suffix='.partial')
+            os.close(fd)
+            shutil.copyfile(keystore, partial)
+            os.replace(partial, cached)
+        shutil.copyfile(keystore, truststore)
+    return truststore
@@ -0,0 +1,88 @@
+__copyright__ = '''
+Copyright 2022 the original author or authors.
+  Licensed under the Apache License, Version 2.0 (the "License");
+  you may not use this file except in compliance with the License.
+  You may obtain a copy of the License at
+      http://www.apache.org/licenses/LICENSE-2.0
+  Unless required by applicable law or agreed to in writing, software
+  distributed under the License is distributed on an "AS IS" BASIS,
+  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+  See the License for the specific language governing permissions and
+  limitations under the License.
+'''
+
+__author__ = 'David Turanski'
+
+import os
+import tempfile
+import unittest
+import logging
+from pathlib import Path
+from unittest.mock import patch
+
+import requests
+
+from src import install
+from install.shell import Shell
+from install.util import setup_certs, truststore_key
+
+install.enable_debug_logging()
+
+logger = logging.getLogger(__name__)
+
+
+class RecordingShell(Shell):
+    def __init__(self):
+        super().__init__(dry_run=True)
+        self.commands = []
+
+    def exec(self, cmd, capture_output=True):
+        self.commands.append(cmd)
+        return super().exec(cmd, capture_output)
+
+
+class TestCerts(unittest.TestCase):
+    certs = {'api.example.com': [b'leaf-api', b'intermediate'], 'uaa.example.com:8443': [b'leaf-uaa', b'intermediate']}
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.java_home = os.path.join(self.tmp.name, 'jdk')
+        Path(self.java_home, 'lib', 'security').mkdir(parents=True)
+        Path(self.java_home, 'lib', 'security', 'cacerts').write_bytes(b'cacerts')
+        self.java_home_env = patch.dict(os.environ, {'JAVA_HOME': self.java_home})
+        self.java_home_env.start()
+        self.cache_dir = os.path.join(self.tmp.name, 'truststores')
+        self.truststore = os.path.join(self.tmp.name, 'mycacerts')
+
+    def tearDown(self):
+        self.java_home_env.stop()
+        self.tmp.cleanup()
+
+    def test_truststore_is_built_once(self):
+        shell = RecordingShell()
+        for i in range(2):
+            setup_certs(list(self.certs.keys()), cache_dir=self.cache_dir, truststore=self.truststore,
+                        ca_bundle=self.truststore + '.pem', shell=shell,
+                        fetch=lambda host: self.certs[host])
+            self.assertTrue(os.path.exists(self.truststore))
+            with open(requests.certs.where()) as default_bundle, open(self.truststore + '.pem') as ca_bundle:
+                self.assertEqual(3, ca_bundle.read().count('BEGIN CERTIFICATE') -
+                                 default_bundle.read().count('BEGIN CERTIFICATE'))
+        # The shared intermediate cert is only imported once
+        self.assertEqual(3, len(shell.commands))
+        self.assertEqual(1, len(os.listdir(self.cache_dir)))
+
+    def test_no_cert_hosts(self):
+        shell = RecordingShell()
+        self.assertIsNone(setup_certs([], truststore=self.truststore, ca_bundle=self.truststore + '.pem', shell=shell))
+        self.assertEqual([], shell.commands)
+        self.assertFalse(os.path.exists(self.truststore))
+
+    def test_truststore_key(self):
+        cacerts = os.path.join(self.java_home, 'lib', 'security', 'cacerts')
+        self.assertEqual(truststore_key(cacerts, [b'a', b'b']), truststore_key(cacerts, [b'b', b'a']))
+        self.assertNotEqual(truststore_key(cacerts, [b'a']), truststore_key(cacerts, [b'a', b'b']))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -13,9 +13,11 @@ Copyright 2022 the original author or authors.
 
 __author__ = 'David Turanski'
 
+import os
 import subprocess
 import unittest
 
+from cloudfoundry.cache import ReadCache
 from cloudfoundry.cli import CloudFoundry
 from cloudfoundry.platform.config.dataflow import DataflowConfig
 from cloudfoundry.platform.config.deployer import CloudFoundryDeployerConfig
@@ -39,16 +41,95 @@ Getting key %s for service instance %s as admin...
 }
             """ % ('ci-scheduler', 'scdf-at')
 
+    def with_env(self, env):
+        return self
+
     def exec(self, cmd):
         return subprocess.CompletedProcess([], 0)
 
 
+class NewSpaceShell(MockShell):
+    """
+    The space can only be targeted once it is created.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.commands = []
+
+    def exec(self, cmd, capture_output=True):
+        self.commands.append(cmd)
+        if cmd.startswith('cf target -s') and 'cf create-space space' not in self.commands:
+            return subprocess.CompletedProcess([], 1)
+        return super().exec(cmd)
+
+
+class CountingShell(MockShell):
+    def __init__(self):
+        super().__init__()
+        self.commands = []
+
+    def exec(self, cmd, capture_output=True):
+        self.commands.append(cmd)
+        return super().exec(cmd)
+
+    def log_stdout(self, proc):
+        pass
+
+
 class TestCommands(unittest.TestCase):
     def test_service_key(self):
         cf = CloudFoundry(self.installation().deployer_config, self.installation().config_props, MockShell())
         service_key = cf.service_key('ci-scheduler', 'scdf-at')
         self.assertEqual('https://scheduler.sys.somehost.cf-app.com', service_key.get( 'api_endpoint'))
 
+    def test_read_cache(self):
+        installation = self.installation()
+        installation.config_props.cf_read_cache_enabled = True
+        shell = CountingShell()
+        cf = CloudFoundry(installation.deployer_config, installation.config_props, shell)
+        cf.service_key('ci-scheduler', 'scdf-at')
+        cf.service_key('ci-scheduler', 'scdf-at')
+        self.assertEqual(1, shell.commands.count('cf service-key ci-scheduler scdf-at'))
+        cf.delete_service_key('ci-scheduler', 'scdf-at')
+        cf.service_key('ci-scheduler', 'scdf-at')
+        self.assertEqual(2, shell.commands.count('cf service-key ci-scheduler scdf-at'))
+        cf.service('rabbit')
+        cf.service('rabbit')
+        self.assertEqual(1, shell.commands.count('cf service rabbit'))
+        cf.delete_service('rabbit')
+        cf.service('rabbit')
+        self.assertEqual(2, shell.commands.count('cf service rabbit'))
+
+    def test_read_cache_during_change(self):
+        cache = ReadCache({'apps': 10})
+        apps = ['old-app']
+        with cache.invalidating('apps'):
+            # A concurrent reader sees the state before the change
+            self.assertEqual(['old-app'], cache.get('apps', None, lambda: list(apps)))
+            apps[0] = 'new-app'
+        self.assertEqual(['new-app'], cache.get('apps', None, lambda: list(apps)))
+        with self.assertRaises(RuntimeError):
+            with cache.invalidating('apps'):
+                raise RuntimeError('cf command failed')
+        apps[0] = 'newer-app'
+        self.assertEqual(['newer-app'], cache.get('apps', None, lambda: list(apps)))
+
+    def test_default_cf_home(self):
+        cf = self.cloudfoundry()
+        self.assertIsNone(cf.cf_home)
+        self.assertNotIn('CF_HOME', cf.shell.env)
+
+    def test_isolated_cf_home(self):
+        cfs = [self.cloudfoundry(cf_home_isolated=True) for i in range(2)]
+        self.assertNotEqual(cfs[0].cf_home, cfs[1].cf_home)
+        self.assertEqual(cfs[0].cf_home, cfs[0].shell.env['CF_HOME'])
+        cfs[0].initialized = False
+        self.assertTrue(cfs[1].initialized)
+        for cf in cfs:
+            cf.close()
+            self.assertFalse(os.path.exists(cf.cf_home))
+
     def test_basic_shell(self):
         shell = Shell()
         p = shell.exec("ls -l")
@@ -56,6 +137,10 @@ class TestCommands(unittest.TestCase):
         self.assertEqual(['ls', '-l'], p.args)
         shell.log_stdout(p)
 
+    def test_shell_env(self):
+        p = Shell().with_env({'SCDF_CF_SETUP_TEST': 'isolated'}).exec("env")
+        self.assertIn('SCDF_CF_SETUP_TEST=isolated', Shell.stdout_to_s(p))
+
     def test_target(self):
         cf = self.cloudfoundry()
         p = cf.target(org='p-dataflow', space='dturanski')
@@ -69,9 +154,15 @@ class TestCommands(unittest.TestCase):
     def test_login(self):
         cf = self.cloudfoundry()
         p = cf.login()
-        self.assertEqual(['cf', 'login', '-a', 'https://api.mycf.org', '-o', 'org', '-s', 'space',
+        self.assertEqual(['cf', 'login', '-a', 'https://api.mycf.org', '-o', 'org',
                           '-u', 'user', '-p', 'password', '--skip-ssl-validation'], p.args)
 
+    def test_target_new_space(self):
+        cf = self.cloudfoundry()
+        cf.shell = NewSpaceShell()
+        cf.target_space()
+        self.assertEqual(['cf target -s space', 'cf create-space space', 'cf target -s space'], cf.shell.commands)
+
     def test_delete_all(self):
         cf = self.cloudfoundry()
         apps = ['scdf-app-repo', 'skipper-server-1411', 'dataflow-server-19655', 'LKg7lBB-taphttp-log-v1',
@@ -86,8 +177,9 @@ class TestCommands(unittest.TestCase):
         p = cf.create_service(service_config=ServiceConfig(name="rabbit", service="p.rabbitmq", plan="single-node"))
         self.assertEqual(['cf', 'create-service', 'p.rabbitmq', 'single-node', 'rabbit'], p.args)
 
-    def cloudfoundry(self):
+    def cloudfoundry(self, cf_home_isolated=False):
         installation = self.installation()
+        installation.config_props.cf_home_isolated = cf_home_isolated
         return CloudFoundry(deployer_config=installation.deployer_config, config_props=installation.config_props,
                             shell=Shell(dry_run=True))
 
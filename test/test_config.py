@@ -19,6 +19,7 @@ from cloudfoundry.platform.config.configuration import ConfigurationProperties
 from cloudfoundry.platform.config.deployer import CloudFoundryDeployerConfig
 from cloudfoundry.platform.config.service import CloudFoundryServicesConfig, ServiceConfig
 from cloudfoundry.platform.config.kafka import KafkaConfig
+from cloudfoundry.platform.config.binder import KafkaPerformanceConfig, RabbitPerformanceConfig
 from cloudfoundry.platform.config.installation import InstallationContext
 import logging
 from src import install
@@ -72,6 +73,40 @@ class TestConfigProperties(unittest.TestCase):
         test_config = ConfigurationProperties.from_env_vars(env)
         self.assertEqual("https://dataflow.spring.io/kafka-maven-latest", test_config.stream_apps_uri)
 
+    def test_kafka_performance_preset(self):
+        env = merged_env([deployer_env(), standalone_test_env(),
+                          {'BINDER': 'kafka', 'KAFKA_BROKER_ADDRESS': 'kafka:9092', 'KAFKA_USERNAME': 'user',
+                           'KAFKA_PASSWORD': 'password', 'KAFKA_PERFORMANCE_PRESET': 'throughput',
+                           'KAFKA_LINGER_MS': '5'}])
+        dataflow_env = InstallationContext.from_env_vars(env).dataflow_config.as_env()
+        key = 'spring.cloud.dataflow.applicationProperties.stream.spring.cloud.stream.'
+        self.assertEqual(dataflow_env[key + 'kafka.binder.producerProperties.linger.ms'], '5')
+        self.assertEqual(dataflow_env[key + 'kafka.binder.producerProperties.compression.type'], 'lz4')
+        self.assertEqual(dataflow_env[key + 'kafka.binder.minPartitionCount'], 4)
+        self.assertEqual(dataflow_env[key + 'default.consumer.concurrency'], 4)
+        self.assertEqual(dataflow_env[key + 'kafka.binder.brokers'], 'kafka:9092')
+
+        self.assertIsNone(KafkaPerformanceConfig.from_env_vars({}))
+        with self.assertRaises(ValueError):
+            KafkaPerformanceConfig.from_env_vars({'KAFKA_PERFORMANCE_PRESET': 'fastest'})
+
+    def test_rabbit_performance_preset(self):
+        env = merged_env([deployer_env(), standalone_test_env(),
+                          {'RABBIT_PERFORMANCE_PRESET': 'throughput', 'RABBIT_COMPRESS': 'true'}])
+        installation = InstallationContext.from_env_vars(env)
+        self.assertIsInstance(installation.binder_performance_config, RabbitPerformanceConfig)
+        dataflow_env = installation.dataflow_config.as_env()
+        key = 'spring.cloud.dataflow.applicationProperties.stream.spring.cloud.stream.'
+        self.assertEqual(dataflow_env[key + 'rabbit.default.consumer.prefetch'], 250)
+        self.assertEqual(dataflow_env[key + 'rabbit.default.consumer.maxConcurrency'], 4)
+        self.assertEqual(dataflow_env[key + 'rabbit.default.producer.batchingEnabled'], 'true')
+        self.assertEqual(dataflow_env[key + 'rabbit.default.producer.compress'], 'true')
+        self.assertNotIn(key + 'rabbit.default.consumer.enableBatching', dataflow_env)
+
+        env['BINDER'] = 'kafka'
+        env.update({'KAFKA_BROKER_ADDRESS': 'kafka:9092', 'KAFKA_USERNAME': 'user', 'KAFKA_PASSWORD': 'password'})
+        self.assertIsNone(InstallationContext.from_env_vars(env).binder_performance_config)
+
 
 def deployer_env():
     return {'SPRING_CLOUD_DEPLOYER_CLOUDFOUNDRY_URL': 'https://api.sys.some-host.cf.app.com',
@@ -0,0 +1,153 @@
+__copyright__ = '''
+Copyright 2022 the original author or authors.
+  Licensed under the Apache License, Version 2.0 (the "License");
+  you may not use this file except in compliance with the License.
+  You may obtain a copy of the License at
+      http://www.apache.org/licenses/LICENSE-2.0
+  Unless required by applicable law or agreed to in writing, software
+  distributed under the License is distributed on an "AS IS" BASIS,
+  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+  See the License for the specific language governing permissions and
+  limitations under the License.
+'''
+
+__author__ = 'David Turanski'
+
+import io
+import logging
+import os
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+
+from install.daemon import DaemonServer, InstallerDaemon, StreamingLogHandler
+from install.daemon_client import request
+
+logger = logging.getLogger(__name__)
+
+
+class EchoDaemon:
+    def handle(self, command, args, send, properties_path, env=None, cwd=None):
+        if command == 'fail':
+            raise RuntimeError('failed on purpose')
+        handler = StreamingLogHandler(send)
+        logger.addHandler(handler)
+        try:
+            logger.warning("running %s" % command)
+        finally:
+            logger.removeHandler(handler)
+        return {'command': command, 'args': args, 'cwd': cwd, 'space': env.get('SPACE')}
+
+
+class FakeCloudFoundry:
+    def __init__(self, work_dir):
+        self.work_dir = work_dir
+
+
+def installer_env(space='space', **kwargs):
+    env = {'SPRING_CLOUD_DEPLOYER_CLOUDFOUNDRY_URL': 'https://api.sys.some-host.cf.app.com',
+           'SPRING_CLOUD_DEPLOYER_CLOUDFOUNDRY_ORG': 'org',
+           'SPRING_CLOUD_DEPLOYER_CLOUDFOUNDRY_SPACE': space,
+           'SPRING_CLOUD_DEPLOYER_CLOUDFOUNDRY_DOMAIN': 'apps.some-host.cf.app.com',
+           'SPRING_CLOUD_DEPLOYER_CLOUDFOUNDRY_USERNAME': 'user',
+           'SPRING_CLOUD_DEPLOYER_CLOUDFOUNDRY_PASSWORD': 'password',
+           'DATAFLOW_VERSION': '2.10.0-SNAPSHOT',
+           'SKIPPER_VERSION': '2.9.0-SNAPSHOT',
+           'PLATFORM': 'cloudfoundry'}
+    env.update(kwargs)
+    return env
+
+
+class TestDaemon(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.socket_path = os.path.join(self.tmp.name, 'daemon.sock')
+        self.server = DaemonServer(self.socket_path, EchoDaemon())
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmp.cleanup()
+
+    def test_request(self):
+        out = io.StringIO()
+        response = request(self.socket_path, 'clean', ['--appsOnly'], out=out, env={'SPACE': 'at-1'})
+        self.assertTrue(response['ok'])
+        self.assertEqual({'command': 'clean', 'args': ['--appsOnly'], 'cwd': os.getcwd(), 'space': 'at-1'},
+                         response['result'])
+        self.assertIn('running clean', out.getvalue())
+
+    def test_failed_request(self):
+        response = request(self.socket_path, 'fail', out=io.StringIO())
+        self.assertFalse(response['ok'])
+        self.assertEqual('failed on purpose', response['error'])
+
+
+class TestInstallerDaemon(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cf = FakeCloudFoundry(self.tmp.name)
+        self.daemon = InstallerDaemon(installer_env(), cf=self.cf)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_setup_uses_client_env_and_cwd(self):
+        calls = []
+
+        def setup(args, installation, cf):
+            calls.append((args, installation.config_props.dataflow_version, os.getcwd(), cf.work_dir))
+            return {'SPRING_CLOUD_DATAFLOW_CLIENT_SERVER_URI': 'https://dataflow'}
+
+        client_cwd = os.path.realpath(tempfile.mkdtemp(dir=self.tmp.name))
+        daemon_cwd = os.getcwd()
+        properties_path = os.path.join(client_cwd, 'cf_scdf.properties')
+        with patch('install.daemon.setup', setup):
+            result = self.daemon.handle('setup', ['--initializeDB'], lambda message: None, properties_path,
+                                        env=installer_env(DATAFLOW_VERSION='2.11.0', WORK_DIR='work'), cwd=client_cwd)
+        self.assertEqual([(['--initializeDB'], '2.11.0', client_cwd, os.path.join(client_cwd, 'work'))], calls)
+        self.assertEqual('https://dataflow', result['SPRING_CLOUD_DATAFLOW_CLIENT_SERVER_URI'])
+        self.assertTrue(os.path.exists(properties_path))
+        self.assertEqual(daemon_cwd, os.getcwd())
+        self.assertEqual(self.tmp.name, self.cf.work_dir)
+
+    def test_log_handler_ignores_other_threads(self):
+        messages = []
+        started = threading.Event()
+        stop = threading.Event()
+
+        def other_request():
+            started.set()
+            stop.wait()
+            logger.warning('other request')
+
+        other = threading.Thread(target=other_request)
+        other.start()
+        started.wait()
+        handler = StreamingLogHandler(messages.append)
+        logger.addHandler(handler)
+        try:
+            worker = threading.Thread(target=lambda: logger.warning('worker'))
+            worker.start()
+            worker.join()
+            stop.set()
+            other.join()
+            logger.warning('request')
+        finally:
+            logger.removeHandler(handler)
+        self.assertEqual(['worker', 'request'], [message['log'].split(':  ')[-1] for message in messages])
+
+    def test_refuse_different_session(self):
+        with patch('install.daemon.setup') as setup:
+            with self.assertRaises(ValueError):
+                self.daemon.handle('setup', [], lambda message: None, env=installer_env(space='other'))
+            with self.assertRaises(ValueError):
+                self.daemon.handle('setup', [], lambda message: None,
+                                   env=installer_env(LD_LIBRARY_PATH='/opt/instantclient'))
+            setup.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -13,14 +13,25 @@ Copyright 2022 the original author or authors.
 
 __author__ = 'David Turanski'
 
+import logging
+import os
+import subprocess
+import sys
+import time
 import unittest
 
+import psycopg2.errors
+
 import install
-from cloudfoundry.platform.config.db import DBConfig
-from install.db import init_db
+from cloudfoundry.platform.config.db import DBConfig, Provider
+from install.db import init_db, db_templates, template_db_name, db_server_versions, schema_versions_comment, \
+    init_concurrently, DBProviders, postgresql_datasources, check_probe, DBProbeResult, reset_servers
+from install.postgresql import init_postgres_db
 
 install.enable_debug_logging()
 
+logger = logging.getLogger(__name__)
+
 
 class DBTestCase(unittest.TestCase):
     def test_db_config(self):
@@ -68,6 +79,139 @@ class DBTestCase(unittest.TestCase):
         self.assertEqual('password', datasources['dataflow'].password)
         self.assertEqual('jdbc:oracle:thin:@host:1521:exeeeee', datasources['dataflow'].url)
 
+    def test_db_templates(self):
+        versions = {'dataflow': '2.10.0-SNAPSHOT', 'skipper': '2.9.0-SNAPSHOT'}
+        self.assertEqual({'scdf1234': 'scdf1234_tpl_2_10_0_snapshot', 'skipper5678': 'skipper5678_tpl_2_9_0_snapshot'},
+                         db_templates(postgres_env(), versions))
+        self.assertEqual({'scdf1234': 'scdf1234_tpl_2_10_0_snapshot_2_9_0_snapshot'},
+                         db_templates(postgres_env({'SQL_SKIPPER_DB_NAME': ''}), versions))
+        long_name = template_db_name('a' * 50, ['2.10.0-SNAPSHOT', '2.9.0-SNAPSHOT'])
+        self.assertTrue(len(long_name) <= 63)
+        self.assertNotEqual(long_name, template_db_name('a' * 50, ['2.10.0-SNAPSHOT', '2.9.1-SNAPSHOT']))
+
+    def test_db_server_versions(self):
+        versions = {'dataflow': '2.10.0-SNAPSHOT', 'skipper': '2.9.0-SNAPSHOT'}
+        self.assertEqual({'scdf1234': ['2.10.0-SNAPSHOT'], 'skipper5678': ['2.9.0-SNAPSHOT']},
+                         db_server_versions(postgres_env(), versions))
+        shared = db_server_versions(postgres_env({'SQL_SKIPPER_DB_NAME': ''}), versions)
+        self.assertEqual('scdf_cf_setup:2.10.0-SNAPSHOT,2.9.0-SNAPSHOT', schema_versions_comment(shared['scdf1234']))
+
+    def test_init_concurrently(self):
+        def fail():
+            raise ValueError('connection refused')
+
+        results = init_concurrently({'scdf1234': lambda: 'created', 'skipper5678': lambda: 'truncated'})
+        self.assertEqual('created', results['scdf1234'].outcome)
+        self.assertEqual('truncated', results['skipper5678'].outcome)
+        with self.assertRaises(RuntimeError) as context:
+            init_concurrently({'scdf1234': lambda: 'created', 'skipper5678': fail})
+        self.assertTrue('skipper5678: connection refused' in str(context.exception))
+
+    def test_failed_clone_creates_db(self):
+        pool = FakePostgresPool(fail_on='TEMPLATE')
+        self.assertEqual('created', init_postgres_db(postgres_env(), 'scdf1234', 'scdf1234_tpl', pool))
+        self.assertEqual(['DROP DATABASE IF EXISTS scdf1234 WITH (FORCE);',
+                          'CREATE DATABASE scdf1234 TEMPLATE scdf1234_tpl;', 'CREATE DATABASE scdf1234;'],
+                         [sql for sql in pool.conn.statements if not sql.startswith('SELECT')])
+        pool = FakePostgresPool()
+        self.assertEqual('cloned', init_postgres_db(postgres_env(), 'scdf1234', 'scdf1234_tpl', pool))
+
+    def test_reset_servers(self):
+        results = init_concurrently({'scdf1234': lambda: 'cloned', 'skipper5678': lambda: 'created'})
+        self.assertEqual({'dataflow-server': 'cloned', 'skipper-server': 'created'},
+                         reset_servers(postgres_env(), results))
+        results = init_concurrently({'scdf1234': lambda: 'truncated'})
+        self.assertEqual({'dataflow-server': 'truncated', 'skipper-server': 'truncated'},
+                         reset_servers(postgres_env({'SQL_SKIPPER_DB_NAME': ''}), results))
+        self.assertEqual({}, reset_servers(postgres_env(), {}))
+
+    def test_check_probe(self):
+        db_config = postgres_env({'SQL_PROBE_WARN_LATENCY_MS': '10', 'SQL_PROBE_MAX_LATENCY_MS': '50'})
+        self.assertEqual(50, db_config.probe_max_latency_ms)
+        check_probe(db_config, DBProbeResult(name='scdf1234', connect_sec=0.2, query_sec=0.001, can_create_tables=True))
+        check_probe(db_config, DBProbeResult(name='scdf1234', connect_sec=0.2, query_sec=0.02, can_create_tables=True))
+        with self.assertRaises(RuntimeError):
+            check_probe(db_config,
+                        DBProbeResult(name='scdf1234', connect_sec=0.2, query_sec=0.06, can_create_tables=True))
+        with self.assertRaises(RuntimeError):
+            check_probe(db_config,
+                        DBProbeResult(name='scdf1234', connect_sec=0.2, query_sec=0.001, can_create_tables=False))
+
+    def test_register_provider(self):
+        DBProviders.register('mysql', postgresql_datasources, 'install.mysql', aliases=['mariadb'])
+        try:
+            self.assertEqual('mysql', Provider('mariadb').name)
+            self.assertEqual('jdbc:postgresql://host:5432/scdf1234?user=user&password=password',
+                             init_db(postgres_env({'SQL_PROVIDER': 'mariadb'}))['dataflow'].url)
+        finally:
+            DBProviders.registry.pop('mysql')
+            Provider.names.pop('mysql')
+            Provider.names.pop('mariadb')
+        with self.assertRaises(ValueError):
+            Provider('mysql')
+
+    def test_setup_does_not_load_db_drivers(self):
+        env = os.environ.copy()
+        env.update({'SPRING_CLOUD_DEPLOYER_CLOUDFOUNDRY_URL': 'https://api.sys.some-host.cf.app.com',
+                    'SPRING_CLOUD_DEPLOYER_CLOUDFOUNDRY_ORG': 'org',
+                    'SPRING_CLOUD_DEPLOYER_CLOUDFOUNDRY_SPACE': 'space',
+                    'SPRING_CLOUD_DEPLOYER_CLOUDFOUNDRY_DOMAIN': 'apps.some-host.cf.app.com',
+                    'SPRING_CLOUD_DEPLOYER_CLOUDFOUNDRY_USERNAME': 'user',
+                    'SPRING_CLOUD_DEPLOYER_CLOUDFOUNDRY_PASSWORD': 'password',
+                    'PYTHONPATH': os.path.join(os.getcwd(), 'src')})
+        start = time.time()
+        proc = subprocess.run([sys.executable, '-X', 'importtime', '-m', 'install.setup', '--help'], env=env,
+                              capture_output=True)
+        logger.info("python -m install.setup --help took %.3f sec" % (time.time() - start))
+        imported = [line.split('|')[-1].strip() for line in proc.stderr.decode().split('\n')
+                    if line.startswith('import time:')]
+        self.assertEqual(0, proc.returncode, proc.stderr.decode())
+        self.assertTrue('install.db' in imported)
+        self.assertFalse('psycopg2' in imported)
+        self.assertFalse('cx_Oracle' in imported)
+
+
+class FakePostgresCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def execute(self, sql):
+        self.conn.statements.append(sql)
+        if self.conn.fail_on and self.conn.fail_on in sql:
+            raise psycopg2.errors.ObjectInUse('source database "scdf1234_tpl" is being accessed by other users')
+
+    def fetchone(self):
+        # The template exists, and nothing is connected to it
+        return (1,) if 'pg_database' in self.conn.statements[-1] else (0,)
+
+
+class FakePostgresConnection:
+    server_version = 140000
+
+    def __init__(self, fail_on):
+        self.fail_on = fail_on
+        self.statements = []
+
+    def cursor(self):
+        return FakePostgresCursor(self)
+
+
+class FakePostgresPool:
+    def __init__(self, fail_on=None):
+        self.conn = FakePostgresConnection(fail_on)
+
+    def getconn(self):
+        return self.conn
+
+    def putconn(self, conn):
+        pass
+
 
 def postgres_env(test_env={}):
     env = {
@@ -0,0 +1,81 @@
+__copyright__ = '''
+Copyright 2022 the original author or authors.
+  Licensed under the Apache License, Version 2.0 (the "License");
+  you may not use this file except in compliance with the License.
+  You may obtain a copy of the License at
+      http://www.apache.org/licenses/LICENSE-2.0
+  Unless required by applicable law or agreed to in writing, software
+  distributed under the License is distributed on an "AS IS" BASIS,
+  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+  See the License for the specific language governing permissions and
+  limitations under the License.
+'''
+
+__author__ = 'David Turanski'
+
+import json
+import os
+import tempfile
+import unittest
+from optparse import Values
+
+from cloudfoundry.platform.config.deployer import CloudFoundryDeployerConfig
+from install.fanout import fanout_targets, target_env, target_name, assert_no_shared_db_initialization, \
+    download_shared_jars
+
+
+class TestFanout(unittest.TestCase):
+    def test_space_pattern(self):
+        targets = fanout_targets(Values({'targets_path': None, 'space_pattern': 'scdf-at-%d', 'count': 3}))
+        self.assertEqual(['scdf-at-1', 'scdf-at-2', 'scdf-at-3'],
+                         [target_name(targets[i], i + 1) for i in range(len(targets))])
+        with self.assertRaises(ValueError):
+            fanout_targets(Values({'targets_path': None, 'space_pattern': 'scdf-at-%d', 'count': None}))
+
+    def test_space_pattern_db_names(self):
+        db_env = {'SQL_PROVIDER': 'postgresql', 'SQL_HOST': 'db', 'SQL_PORT': '5432', 'SQL_DATAFLOW_DB_NAME': 'dataflow',
+                  'SQL_SKIPPER_DB_NAME': 'skipper'}
+        targets = fanout_targets(Values({'targets_path': None, 'space_pattern': 'scdf-at-%d', 'count': 2}), db_env)
+        self.assertEqual({'SPRING_CLOUD_DEPLOYER_CLOUDFOUNDRY_SPACE': 'scdf-at-1',
+                          'SQL_DATAFLOW_DB_NAME': 'dataflow_scdf_at_1', 'SQL_SKIPPER_DB_NAME': 'skipper_scdf_at_1'},
+                         targets[0])
+        target_envs = {target_name(target, 0): target_env(db_env, target, '/tmp') for target in targets}
+        assert_no_shared_db_initialization(target_envs, ['--initializeDB'])
+
+    def test_targets_file(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'targets.json')
+            with open(path, 'w') as file:
+                json.dump([{CloudFoundryDeployerConfig.space_key: 'at-1'},
+                           {'NAME': 'other', CloudFoundryDeployerConfig.url_key: 'https://api.other.cf'}], file)
+            targets = fanout_targets(Values({'targets_path': path, 'space_pattern': None, 'count': None}))
+        self.assertEqual(['at-1', 'other'], [target_name(targets[i], i + 1) for i in range(len(targets))])
+        env = target_env({CloudFoundryDeployerConfig.space_key: 'default', 'BINDER': 'kafka'}, targets[0], '/tmp/at-1')
+        self.assertEqual('at-1', env[CloudFoundryDeployerConfig.space_key])
+        self.assertEqual('kafka', env['BINDER'])
+        self.assertEqual('/tmp/at-1', env['WORK_DIR'])
+        self.assertEqual('true', env['CF_HOME_ISOLATED'])
+        self.assertNotIn('NAME', target_env({}, targets[1], '/tmp/other'))
+
+    def test_shared_db_initialization(self):
+        db_env = {'SQL_PROVIDER': 'postgresql', 'SQL_HOST': 'db', 'SQL_PORT': '5432', 'SQL_DATAFLOW_DB_NAME': 'dataflow',
+                  'SQL_SKIPPER_DB_NAME': 'skipper'}
+        target_envs = {'at-1': target_env(db_env, {}, '/tmp/at-1'), 'at-2': target_env(db_env, {}, '/tmp/at-2')}
+        assert_no_shared_db_initialization(target_envs, [])
+        with self.assertRaises(ValueError):
+            assert_no_shared_db_initialization(target_envs, ['--initializeDB'])
+        target_envs['at-2'] = target_env(db_env, {'SQL_DATAFLOW_DB_NAME': 'dataflow2', 'SQL_SKIPPER_DB_NAME': 'skipper2'},
+                                         '/tmp/at-2')
+        assert_no_shared_db_initialization(target_envs, ['--initializeDB'])
+        # No external DB
+        assert_no_shared_db_initialization({'at-1': {}, 'at-2': {}}, ['--initializeDB'])
+
+    def test_download_versions(self):
+        env = {'PLATFORM': 'cloudfoundry', 'DATAFLOW_VERSION': '2.9.0', 'SKIPPER_VERSION': '2.8.0'}
+        with self.assertRaises(ValueError):
+            download_shared_jars([], [env, target_env(env, {'DATAFLOW_VERSION': '2.10.0'}, '/tmp/at-2')])
+        self.assertEqual(['-d'], download_shared_jars(['-d'], [env]))
+
+
+if __name__ == '__main__':
+    unittest.main()
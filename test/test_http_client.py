@@ -0,0 +1,97 @@
+__copyright__ = '''
+Copyright 2022 the original author or authors.
+  Licensed under the Apache License, Version 2.0 (the "License");
+  you may not use this file except in compliance with the License.
+  You may obtain a copy of the License at
+      http://www.apache.org/licenses/LICENSE-2.0
+  Unless required by applicable law or agreed to in writing, software
+  distributed under the License is distributed on an "AS IS" BASIS,
+  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+  See the License for the specific language governing permissions and
+  limitations under the License.
+'''
+
+__author__ = 'David Turanski'
+
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from install.http_client import HttpClient
+from install.util import Poller, wait_for_200
+
+
+class FlakyHandler(BaseHTTPRequestHandler):
+    """
+    Fails the first request to each path with a 503, then succeeds.
+    """
+    failed = set()
+    authorizations = []
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.authorizations.append(self.headers.get('Authorization'))
+        status = 200 if self.path in self.failed or self.path == '/ok' else 503
+        self.failed.add(self.path)
+        self.send_response(status)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_POST(self):
+        self.do_GET()
+
+
+class TestHttpClient(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), FlakyHandler)
+        self.url = 'http://127.0.0.1:%d' % self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_retries_idempotent_requests(self):
+        http = HttpClient(backoff_factor=0)
+        self.assertEqual(200, http.get(self.url + '/get').status_code)
+        # POST is not idempotent
+        self.assertEqual(503, http.post(self.url + '/post').status_code)
+
+    def test_latency_metrics(self):
+        http = HttpClient()
+        for i in range(3):
+            http.get(self.url + '/ok')
+        stats = http.metrics['GET 127.0.0.1:%d' % self.server.server_address[1]]
+        self.assertEqual(3, stats.count)
+        self.assertEqual(0, stats.errors)
+        self.assertTrue(stats.max_sec >= stats.total_sec / stats.count)
+        http.log_metrics()
+
+    def test_default_timeout(self):
+        http = HttpClient(timeout=0.001, retries=0)
+        with self.assertRaises(requests.RequestException):
+            http.get('http://10.255.255.1/')
+
+    def test_no_credentials_over_http(self):
+        def bearer(request):
+            request.headers['Authorization'] = 'Bearer token'
+            return request
+
+        self.assertTrue(wait_for_200(Poller(0, 0), self.url + '/ok', auth=bearer, http=HttpClient()))
+        self.assertIsNone(FlakyHandler.authorizations[-1])
+
+
+    def test_poll_without_retries(self):
+        http = HttpClient(backoff_factor=0)
+        # The first request fails, and it is not retried
+        self.assertFalse(wait_for_200(Poller(0, 0), self.url + '/poll', http=http))
+        self.assertTrue(wait_for_200(Poller(0, 0), self.url + '/poll', http=http))
+        self.assertEqual(2, http.metrics['GET 127.0.0.1:%d' % self.server.server_address[1]].count)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -16,11 +16,12 @@ __author__ = 'David Turanski'
 import json
 import logging
 import os
+import tempfile
 import unittest
 
 import yaml
 
-from cloudfoundry.platform.standalone import deploy
+from cloudfoundry.platform.standalone import deploy, record_push_time, push_time_summary
 from src import install
 from cloudfoundry.cli import CloudFoundry
 from cloudfoundry.platform.config.db import DatasourceConfig
@@ -30,6 +31,8 @@ from cloudfoundry.platform.config.configuration import ConfigurationProperties
 from cloudfoundry.platform.config.deployer import CloudFoundryDeployerConfig
 from cloudfoundry.platform.config.service import CloudFoundryServicesConfig
 from cloudfoundry.platform.config.installation import InstallationContext
+from cloudfoundry.platform.config.sizing import ServerSizingConfig
+from cloudfoundry.platform.config.deployment import TaskDeploymentConfig, StreamDeploymentConfig
 
 import cloudfoundry.platform.manifest.skipper as skipper_manifest
 import cloudfoundry.platform.manifest.dataflow as dataflow_manifest
@@ -69,7 +72,7 @@ class TestManifest(unittest.TestCase):
         app = doc['applications'][0]
         self.assertEqual(app['name'], 'dataflow-server')
         self.assertEqual(app['buildpack'], 'java_buildpack_offline')
-        self.assertEqual(app['path'], 'test/dataflow.jar')
+        self.assertEqual(app['path'], os.path.abspath('test/dataflow.jar'))
         self.assertEqual(app['env']['SPRING_DATASOURCE_URL'], 'jdbc://oracle:thin:123.456.78:1234/xe/dataflow')
         self.assertEqual(app['env']['SPRING_CLOUD_SKIPPER_CLIENT_SERVER_URI'], params['skipper_uri'])
         self.assertEqual(app['services'], ['mysql'])
@@ -100,7 +103,7 @@ class TestManifest(unittest.TestCase):
         app = doc['applications'][0]
         self.assertEqual(app['name'], 'skipper-server')
         self.assertEqual(app['buildpack'], 'java_buildpack_offline')
-        self.assertEqual(app['path'], 'test/skipper.jar')
+        self.assertEqual(app['path'], os.path.abspath('test/skipper.jar'))
         self.assertEqual(app['env']['SPRING_DATASOURCE_URL'], 'jdbc://oracle:thin:123.456.78:1234/xe/skipper')
         self.assertEqual(app['services'], ['mysql'])
         saj = json.loads(app['env']['SPRING_APPLICATION_JSON'])
@@ -108,6 +111,103 @@ class TestManifest(unittest.TestCase):
             saj['spring.cloud.skipper.server.platform.cloudfoundry.accounts']['default']['deployment']['services'],
             ['rabbit'])
 
+    def test_server_sizing(self):
+        installation = self.installation()
+        installation.sizing_config = ServerSizingConfig.from_env_vars(
+            {'SERVER_SIZING': 'large', 'DATAFLOW_SERVER_MEMORY': '6G', 'SKIPPER_SERVER_DB_POOL_SIZE': '30'})
+        params = {'skipper_uri': 'https://skipper-server.somehost.cf-app.com/api'}
+        app = yaml.safe_load(dataflow_manifest.create_manifest(installation=installation, params=params))[
+            'applications'][0]
+        self.assertEqual(app['memory'], '6G')
+        self.assertEqual(app['disk_quota'], '2G')
+        self.assertEqual(app['instances'], 2)
+        self.assertEqual(app['env']['SERVER_TOMCAT_THREADS_MAX'], 400)
+        self.assertEqual(app['env']['SPRING_DATASOURCE_HIKARI_MAXIMUM_POOL_SIZE'], 20)
+        self.assertEqual(yaml.safe_load(app['env']['JBP_CONFIG_OPEN_JDK_JRE']),
+                         {'jre': {'version': '1.8.+'}, 'memory_calculator': {'stack_threads': 450}})
+
+        app = yaml.safe_load(skipper_manifest.create_manifest(installation=installation))['applications'][0]
+        self.assertEqual(app['memory'], '4G')
+        self.assertEqual(app['instances'], 1)
+        self.assertEqual(app['env']['SPRING_DATASOURCE_HIKARI_MAXIMUM_POOL_SIZE'], 30)
+
+    def test_default_server_sizing(self):
+        app = yaml.safe_load(skipper_manifest.create_manifest(installation=self.installation()))['applications'][0]
+        self.assertEqual(app['memory'], '2G')
+        self.assertEqual(app['disk_quota'], '2G')
+        self.assertEqual(app['instances'], 1)
+        with self.assertRaises(ValueError):
+            ServerSizingConfig.from_env_vars({'SERVER_SIZING': 'huge'})
+        with self.assertRaises(ValueError):
+            ServerSizingConfig.from_env_vars({'SERVER_SIZING': 'large', 'SKIPPER_SERVER_INSTANCES': '2'})
+
+    def test_fast_start(self):
+        installation = self.installation()
+        params = {'skipper_uri': 'https://skipper-server.somehost.cf-app.com/api'}
+        app = yaml.safe_load(dataflow_manifest.create_manifest(installation=installation, params=params))[
+            'applications'][0]
+        self.assertNotIn('health-check-type', app)
+        self.assertNotIn('JBP_CONFIG_JAVA_OPTS', app['env'])
+
+        installation.config_props.fast_start_enabled = True
+        app = yaml.safe_load(dataflow_manifest.create_manifest(installation=installation, params=params))[
+            'applications'][0]
+        self.assertEqual(app['health-check-type'], 'http')
+        self.assertEqual(app['health-check-http-endpoint'], '/actuator/health/readiness')
+        self.assertEqual(yaml.safe_load(app['env']['JBP_CONFIG_JAVA_OPTS']),
+                         {'from_environment': True, 'java_opts': '-XX:TieredStopAtLevel=1'})
+        self.assertTrue(app['env']['SPRING_MAIN_LAZY_INITIALIZATION'])
+
+        app = yaml.safe_load(skipper_manifest.create_manifest(installation=installation))['applications'][0]
+        self.assertEqual(app['health-check-type'], 'http')
+        self.assertNotIn('SPRING_MAIN_LAZY_INITIALIZATION', app['env'])
+
+    def test_push_times(self):
+        config_props = self.installation().config_props
+        with tempfile.TemporaryDirectory() as cache_dir:
+            config_props.cache_dir = cache_dir
+            record_push_time(config_props, 'dataflow-server', 100.0)
+            record_push_time(config_props, 'dataflow-server', 80.0)
+            config_props.fast_start_enabled = True
+            record_push_time(config_props, 'dataflow-server', 45.0)
+            record_push_time(config_props, 'skipper-server', 30.0)
+            self.assertEqual(push_time_summary(config_props.cache_path('push-times.jsonl'), 'dataflow-server'),
+                             [(False, 90.0, 2), (True, 45.0, 1)])
+
+    def test_task_deployment(self):
+        installation = self.installation()
+        installation.task_deployment_config = TaskDeploymentConfig.from_env_vars(
+            {'TASK_DEPLOYMENT_PRESET': 'high_concurrency', 'TASK_DEPLOYMENT_MAXIMUM_CONCURRENT_TASKS': '50'})
+        params = {'skipper_uri': 'https://skipper-server.somehost.cf-app.com/api'}
+        app = yaml.safe_load(dataflow_manifest.create_manifest(installation=installation, params=params))[
+            'applications'][0]
+        deployment = json.loads(app['env']['SPRING_APPLICATION_JSON'])[
+            'spring.cloud.dataflow.task.platform.cloudfoundry.accounts']['default']['deployment']
+        self.assertEqual(deployment['maximumConcurrentTasks'], '50')
+        self.assertEqual(deployment['stagingTimeout'], '30m')
+        self.assertEqual(deployment['apiTimeout'], 600)
+        self.assertEqual(deployment['services'], ['mysql'])
+        with self.assertRaises(ValueError):
+            TaskDeploymentConfig.from_env_vars({'TASK_DEPLOYMENT_PRESET': 'unlimited'})
+
+    def test_stream_deployment(self):
+        installation = self.installation()
+        account_key = 'spring.cloud.skipper.server.platform.cloudfoundry.accounts'
+        app = yaml.safe_load(skipper_manifest.create_manifest(installation=installation))['applications'][0]
+        deployment = json.loads(app['env']['SPRING_APPLICATION_JSON'])[account_key]['default']['deployment']
+        self.assertEqual(deployment['memory'], 2048)
+        self.assertNotIn('healthCheck', deployment)
+
+        installation.stream_deployment_config = StreamDeploymentConfig.from_env_vars(
+            {'STREAM_DEPLOYMENT_PRESET': 'large_streams', 'STREAM_DEPLOYMENT_MEMORY': '768'})
+        app = yaml.safe_load(skipper_manifest.create_manifest(installation=installation))['applications'][0]
+        deployment = json.loads(app['env']['SPRING_APPLICATION_JSON'])[account_key]['default']['deployment']
+        self.assertEqual(deployment['memory'], '768')
+        self.assertEqual(deployment['healthCheck'], 'port')
+        self.assertEqual(deployment['stagingTimeout'], '30m')
+        self.assertEqual(deployment['services'], ['rabbit'])
+        self.assertFalse(deployment['deleteRoutes'])
+
     def installation(self):
         deployer_env = {
             CloudFoundryDeployerConfig.scheduler_url_key:
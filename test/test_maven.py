@@ -0,0 +1,239 @@
+__copyright__ = '''
+Copyright 2022 the original author or authors.
+  Licensed under the Apache License, Version 2.0 (the "License");
+  you may not use this file except in compliance with the License.
+  You may obtain a copy of the License at
+      http://www.apache.org/licenses/LICENSE-2.0
+  Unless required by applicable law or agreed to in writing, software
+  distributed under the License is distributed on an "AS IS" BASIS,
+  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+  See the License for the specific language governing permissions and
+  limitations under the License.
+'''
+
+__author__ = 'David Turanski'
+
+import functools
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import requests
+
+from cloudfoundry.platform.maven import MavenArtifact, MavenResolver, ArtifactCache, Downloader, MavenRepositories, \
+    install_artifact, snapshot_version
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def send_head(self):
+        # Adds support for 'Range: bytes=<start>-' to resume downloads
+        range_header = self.headers.get('Range')
+        path = self.translate_path(self.path)
+        if not range_header or not os.path.isfile(path):
+            return super().send_head()
+        start = int(range_header.replace('bytes=', '').split('-')[0])
+        file = open(path, 'rb')
+        size = os.fstat(file.fileno()).st_size
+        if start >= size:
+            file.close()
+            self.send_error(416)
+            return None
+        file.seek(start)
+        self.send_response(206)
+        self.send_header('Content-Length', str(size - start))
+        self.send_header('Content-Range', 'bytes %d-%d/%d' % (start, size - 1, size))
+        self.end_headers()
+        return file
+
+
+class LocalMavenRepo:
+    """
+    A stand-in for a remote maven repository, serving files from a temp directory.
+    """
+
+    def __init__(self):
+        self.root = tempfile.mkdtemp()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0),
+                                          functools.partial(QuietHandler, directory=self.root))
+        self.url = 'http://127.0.0.1:%d' % self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def add(self, path, contents=b'jar'):
+        file = Path(self.root, path)
+        file.parent.mkdir(parents=True, exist_ok=True)
+        file.write_bytes(contents)
+        return file
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.root)
+
+
+class MavenTestCase(unittest.TestCase):
+    def setUp(self):
+        self.repo = LocalMavenRepo()
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.repo.close()
+        shutil.rmtree(self.cache_dir)
+
+    def test_parse_artifact(self):
+        artifact = MavenArtifact.parse('maven://io.spring:scenario-task:0.0.1-SNAPSHOT')
+        self.assertEqual('io/spring/scenario-task/0.0.1-SNAPSHOT/scenario-task-0.0.1-SNAPSHOT.jar', artifact.path())
+        self.assertTrue(artifact.is_snapshot())
+        artifact = MavenArtifact.parse('maven://io.spring:scenario-task:jar:exec:1.0.0')
+        self.assertEqual('io/spring/scenario-task/1.0.0/scenario-task-1.0.0-exec.jar', artifact.path())
+        self.assertFalse(artifact.is_snapshot())
+        with self.assertRaises(ValueError):
+            MavenArtifact.parse('maven://io.spring')
+
+    def test_missing_artifacts(self):
+        release = MavenArtifact.parse('maven://io.spring:release-task:1.0.0')
+        snapshot = MavenArtifact.parse('maven://io.spring:snapshot-task:1.0.1-SNAPSHOT')
+        missing = MavenArtifact.parse('maven://io.spring:missing-task:1.0.0')
+        self.repo.add(release.path())
+        self.repo.add(snapshot.metadata_path(), b'<metadata/>')
+        cache_path = os.path.join(self.cache_dir, 'maven-resolved.json')
+        resolver = MavenResolver({'unreachable': 'http://127.0.0.1:1', 'local': self.repo.url},
+                                 cache_path=cache_path, timeout=2)
+
+        self.assertEqual([missing], resolver.missing([release, snapshot, missing, release]))
+        self.assertTrue(os.path.exists(cache_path))
+
+        # Found artifacts are cached between runs
+        resolver = MavenResolver({'local': self.repo.url}, cache_path=cache_path)
+        os.remove(os.path.join(self.repo.root, release.path()))
+        self.assertEqual(self.repo.url, resolver.resolve(release))
+        self.assertIsNone(resolver.resolve(missing))
+        # A SNAPSHOT is checked every time
+        os.remove(os.path.join(self.repo.root, snapshot.metadata_path()))
+        self.assertIsNone(resolver.resolve(snapshot))
+
+    def test_snapshot_version(self):
+        artifact = MavenArtifact.parse('maven://io.spring:snapshot-task:1.0.1-SNAPSHOT')
+        self.assertEqual('1.0.1-20220510.143215-12', snapshot_version(artifact, snapshot_metadata('20220510.143215', 12)))
+        self.assertEqual('1.0.1-20220510.143215-12', snapshot_version(artifact, snapshot_metadata('20220510.143215', 12,
+                                                                                                   legacy=True)))
+        self.assertIsNone(snapshot_version(artifact, b'<metadata/>'))
+
+    def test_artifact_cache(self):
+        artifact = MavenArtifact(group_id='org.springframework.cloud', artifact_id='spring-cloud-dataflow-server',
+                                 version='2.10.0-SNAPSHOT')
+        self.repo.add(artifact.metadata_path(), snapshot_metadata('20220510.143215', 1, version='2.10.0'))
+        self.repo.add('%s/%s' % (artifact.directory(), artifact.file_name('2.10.0-20220510.143215-1')), b'build 1')
+        cache = ArtifactCache(self.cache_dir)
+        downloads = []
+
+        def download(url, path):
+            downloads.append(url)
+            with open(path, 'wb') as file:
+                file.write(requests.get(url).content)
+
+        path = cache.fetch(self.repo.url, artifact, download)
+        self.assertEqual(1, len(downloads))
+        self.assertEqual(path, cache.fetch(self.repo.url, artifact, download))
+        self.assertEqual(1, len(downloads))
+
+        destination = os.path.join(self.cache_dir, 'build', 'dataflow-server.jar')
+        install_artifact(path, destination)
+        install_artifact(path, destination)
+        self.assertEqual(b'build 1', Path(destination).read_bytes())
+
+        # A new SNAPSHOT build replaces the cached one
+        self.repo.add(artifact.metadata_path(), snapshot_metadata('20220511.090000', 2, version='2.10.0'))
+        self.repo.add('%s/%s' % (artifact.directory(), artifact.file_name('2.10.0-20220511.090000-2')), b'build 2')
+        new_path = cache.fetch(self.repo.url, artifact, download)
+        self.assertEqual(2, len(downloads))
+        self.assertEqual(b'build 2', Path(new_path).read_bytes())
+        self.assertFalse(os.path.exists(path))
+
+    def test_download(self):
+        contents = os.urandom(100000)
+        self.repo.add('server.jar', contents)
+        self.repo.add('server.jar.sha1', ('%s  server.jar' % hashlib.sha1(contents).hexdigest()).encode())
+        downloader = Downloader(chunk_size=4096)
+        path = os.path.join(self.cache_dir, 'server.jar')
+
+        result = downloader.download(self.repo.url + '/server.jar', path)
+        self.assertEqual(len(contents), result.size)
+        self.assertEqual(0, result.resumed_from)
+        self.assertEqual(contents, Path(path).read_bytes())
+
+        # Resume a partial download
+        Path(path).write_bytes(contents[:30000])
+        result = downloader.download(self.repo.url + '/server.jar', path)
+        self.assertEqual(30000, result.resumed_from)
+        self.assertEqual(contents, Path(path).read_bytes())
+
+        # Partial download that is already complete
+        result = downloader.download(self.repo.url + '/server.jar', path)
+        self.assertEqual(len(contents), result.resumed_from)
+        self.assertEqual(contents, Path(path).read_bytes())
+
+        # Partial download longer than the remote file
+        Path(path).write_bytes(contents + b'x' * 100)
+        result = downloader.download(self.repo.url + '/server.jar', path)
+        self.assertEqual(0, result.resumed_from)
+        self.assertEqual(contents, Path(path).read_bytes())
+
+        # Corrupt partial download
+        Path(path).write_bytes(b'x' * 30000)
+        with self.assertRaises(RuntimeError):
+            downloader.download(self.repo.url + '/server.jar', path)
+        self.assertFalse(os.path.exists(path))
+
+        with self.assertRaises(RuntimeError):
+            downloader.download(self.repo.url + '/missing.jar', path)
+
+    def test_repositories_fastest_first_with_fallback(self):
+        mirror = LocalMavenRepo()
+        try:
+            artifact = MavenArtifact.parse('maven://io.spring:release-task:1.0.0')
+            mirror.add(artifact.path())
+            stats_path = os.path.join(self.cache_dir, 'maven-repo-stats.json')
+            repos = MavenRepositories({'repo1': self.repo.url, 'mirror': mirror.url}, stats_path=stats_path)
+            self.assertEqual([mirror.url, self.repo.url], repos.rank(artifact))
+
+            def fetch(repo):
+                if repo == mirror.url:
+                    raise RuntimeError('download failed')
+                return repo
+
+            self.assertEqual(self.repo.url, repos.fetch(artifact, fetch))
+            self.assertEqual(1, repos.stats[mirror.url]['failures'])
+            self.assertTrue(os.path.exists(stats_path))
+
+            with self.assertRaises(RuntimeError):
+                repos.fetch(artifact, lambda repo: fetch(mirror.url))
+        finally:
+            mirror.close()
+
+
+def snapshot_metadata(timestamp, build_number, legacy=False, version='1.0.1'):
+    snapshot_versions = '' if legacy else \
+        """<snapshotVersions>
+      <snapshotVersion><extension>pom</extension><value>%s-%s-%d</value></snapshotVersion>
+      <snapshotVersion><extension>jar</extension><value>%s-%s-%d</value></snapshotVersion>
+    </snapshotVersions>""" % (version, timestamp, build_number, version, timestamp, build_number)
+    return ("""<?xml version="1.0" encoding="UTF-8"?>
+<metadata>
+  <versioning>
+    <snapshot><timestamp>%s</timestamp><buildNumber>%d</buildNumber></snapshot>
+    %s
+  </versioning>
+</metadata>""" % (timestamp, build_number, snapshot_versions)).encode()
+
+
+if __name__ == '__main__':
+    unittest.main()
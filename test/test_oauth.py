@@ -0,0 +1,81 @@
+__copyright__ = '''
+Copyright 2022 the original author or authors.
+  Licensed under the Apache License, Version 2.0 (the "License");
+  you may not use this file except in compliance with the License.
+  You may obtain a copy of the License at
+      http://www.apache.org/licenses/LICENSE-2.0
+  Unless required by applicable law or agreed to in writing, software
+  distributed under the License is distributed on an "AS IS" BASIS,
+  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+  See the License for the specific language governing permissions and
+  limitations under the License.
+'''
+
+__author__ = 'David Turanski'
+
+import base64
+import json
+import os
+import tempfile
+import unittest
+
+from cloudfoundry.oauth import TokenProvider, jwt_expiry, token_cache_path
+
+
+def jwt(exp):
+    payload = base64.urlsafe_b64encode(json.dumps({'exp': exp, 'user_name': 'admin'}).encode()).decode().rstrip('=')
+    return 'bearer eyJhbGciOiJSUzI1NiJ9.%s.c2lnbmF0dXJl' % payload
+
+
+class Clock:
+    def __init__(self, now=1000):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class Fetch:
+    def __init__(self, clock, ttl=600):
+        self.clock = clock
+        self.ttl = ttl
+        self.count = 0
+
+    def __call__(self):
+        self.count = self.count + 1
+        return jwt(self.clock() + self.ttl)
+
+
+class TestOAuth(unittest.TestCase):
+    def test_jwt_expiry(self):
+        self.assertEqual(1234, jwt_expiry(jwt(1234)))
+        self.assertIsNone(jwt_expiry('bearer not-a-jwt'))
+
+    def test_refresh_before_expiry(self):
+        clock = Clock()
+        fetch = Fetch(clock)
+        provider = TokenProvider(fetch, refresh_margin_sec=60, clock=clock)
+        token = provider.token()
+        clock.now = clock.now + 500
+        self.assertEqual(token, provider.token())
+        self.assertEqual(1, fetch.count)
+        clock.now = clock.now + 50
+        self.assertNotEqual(token, provider.token())
+        self.assertEqual(2, fetch.count)
+
+    def test_cached_on_disk(self):
+        clock = Clock()
+        fetch = Fetch(clock)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = token_cache_path(tmp, 'https://api.sys.somehost.cf-app.com', 'admin')
+            token = TokenProvider(fetch, cache_path=path, clock=clock).token()
+            self.assertEqual(0o600, os.stat(path).st_mode & 0o777)
+            provider = TokenProvider(fetch, cache_path=path, clock=clock)
+            self.assertEqual(token, provider.token())
+            self.assertEqual(1, fetch.count)
+            provider.invalidate()
+            self.assertFalse(os.path.exists(path))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,167 @@
+__copyright__ = '''
+Copyright 2022 the original author or authors.
+  Licensed under the Apache License, Version 2.0 (the "License");
+  you may not use this file except in compliance with the License.
+  You may obtain a copy of the License at
+      http://www.apache.org/licenses/LICENSE-2.0
+  Unless required by applicable law or agreed to in writing, software
+  distributed under the License is distributed on an "AS IS" BASIS,
+  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+  See the License for the specific language governing permissions and
+  limitations under the License.
+'''
+
+__author__ = 'David Turanski'
+
+import os
+import subprocess
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from cloudfoundry.domain import Service
+from cloudfoundry.platform.config.service import ServiceConfig
+from cloudfoundry.platform.registration import AppImport, AppImports
+from install.plan import plan_services, plan_registrations, plan_app, record_app, read_services, apply_changes, \
+    AppState, CREATE, DELETE_AND_CREATE, NONE, PUSH, REGISTER, REPLACE, WAIT_FOR_CREATE
+from install.setup import ensure_required_services
+
+
+class MockCloudFoundry:
+    def __init__(self, work_dir, pages={}):
+        self.work_dir = work_dir
+        self.pages = pages
+
+    def work_path(self, name):
+        return '%s/%s' % (self.work_dir, name)
+
+    def curl(self, path):
+        return self.pages[path.split('?')[0]]
+
+
+class ServiceRecordingCloudFoundry:
+    def __init__(self):
+        self.commands = []
+
+    def delete_service(self, service_name):
+        self.commands.append(('delete', service_name))
+
+    def create_service(self, service_config):
+        self.commands.append(('create', service_config.name))
+        return subprocess.CompletedProcess([], 0)
+
+
+class TestPlan(unittest.TestCase):
+    def test_plan_services(self):
+        services_config = {'rabbit': ServiceConfig(name='rabbit', service='p.rabbitmq', plan='single-node'),
+                           'sql': ServiceConfig(name='mysql', service='p.mysql', plan='db-small'),
+                           'scheduler': ServiceConfig(name='scheduler', service='scheduler-for-pcf', plan='standard'),
+                           'config': ServiceConfig(name='config', service='p.config-server', plan='standard')}
+        services = {'rabbit': Service('rabbit', 'p.rabbitmq', 'single-node', 'create succeeded', None),
+                    'mysql': Service('mysql', 'p.mysql', 'db-small', 'create in progress', None),
+                    'scheduler': Service('scheduler', 'scheduler-for-pcf', 'standard', 'create failed', None),
+                    'config': Service('config', 'p.config-server', 'large', 'create succeeded', None)}
+        changes = {change.name: change.action for change in plan_services(services_config, services)}
+        self.assertEqual({'rabbit': NONE, 'mysql': WAIT_FOR_CREATE, 'scheduler': DELETE_AND_CREATE,
+                          'config': REPLACE}, changes)
+        del services['config']
+        changes = {change.name: change.action for change in plan_services(services_config, services)}
+        self.assertEqual(CREATE, changes['config'])
+
+    def test_replace_service_requires_opt_in(self):
+        services_config = {'rabbit': ServiceConfig(name='rabbit', service='p.rabbitmq', plan='single-node')}
+        services = {'rabbit': Service('rabbit', 'p.rabbitmq', 'cluster', 'create succeeded', None)}
+        cf = ServiceRecordingCloudFoundry()
+        with patch('install.setup.read_service_states', return_value=services):
+            with self.assertRaises(RuntimeError) as context:
+                ensure_required_services(cf, services_config)
+            self.assertIn('--recreateServices', str(context.exception))
+            self.assertEqual([], cf.commands)
+            ensure_required_services(cf, services_config, recreate_services=True)
+        self.assertEqual([('delete', 'rabbit'), ('create', 'rabbit')], cf.commands)
+
+    def test_plan_registrations(self):
+        app_imports = AppImports('app-imports.properties', [
+            AppImport('sink', 'log', 'maven://org:log-sink:1.0', '1.0', 1),
+            AppImport('sink', 'ver-log', 'maven://org:log-sink:2.0', '2.0', 2),
+            AppImport('task', 'timestamp', 'maven://org:timestamp-task:1.0', '1.0', 3)], [], [])
+        registered = [{'type': 'sink', 'name': 'log', 'version': '1.0', 'uri': 'maven://org:log-sink:1.0'},
+                      {'type': 'task', 'name': 'timestamp', 'version': '1.0', 'uri': 'maven://org:timestamp-task:0.9'}]
+        changes = {change.name: change.action for change in plan_registrations(app_imports, registered)}
+        self.assertEqual({'sink.log:1.0': NONE, 'sink.ver-log:2.0': REGISTER, 'task.timestamp:1.0': REGISTER}, changes)
+
+    def test_plan_app(self):
+        manifest = 'applications:\n- name: dataflow-server\n  host: dataflow-server-%d\n  memory: 2G\n'
+        with tempfile.TemporaryDirectory() as tmp:
+            cf = MockCloudFoundry(tmp)
+            apps = {'dataflow-server': AppState('dataflow-server', 'STARTED', ['dataflow-server-1.apps.cf'])}
+            self.assertEqual(PUSH, plan_app(cf, 'skipper-server', manifest % 1, apps).action)
+            self.assertEqual(PUSH, plan_app(cf, 'dataflow-server', manifest % 1, apps).action)
+            record_app(cf, 'dataflow-server', manifest % 1)
+            # Only the random host name is different
+            self.assertEqual(NONE, plan_app(cf, 'dataflow-server', manifest % 2, apps).action)
+            self.assertEqual(PUSH, plan_app(cf, 'dataflow-server', manifest.replace('2G', '4G') % 1, apps).action)
+            apps['dataflow-server'] = AppState('dataflow-server', 'STOPPED', [])
+            self.assertEqual(PUSH, plan_app(cf, 'dataflow-server', manifest % 1, apps).action)
+
+    def test_plan_app_db_reset(self):
+        manifest = 'applications:\n- name: dataflow-server\n  memory: 2G\n'
+        with tempfile.TemporaryDirectory() as tmp:
+            cf = MockCloudFoundry(tmp)
+            apps = {'dataflow-server': AppState('dataflow-server', 'STARTED', ['dataflow-server-1.apps.cf'])}
+            record_app(cf, 'dataflow-server', manifest)
+            self.assertEqual(NONE, plan_app(cf, 'dataflow-server', manifest, apps).action)
+            # The running server still uses the schema of the dropped DB
+            change = plan_app(cf, 'dataflow-server', manifest, apps, db_reset='cloned')
+            self.assertEqual(PUSH, change.action)
+            self.assertEqual('DB was cloned', change.reason)
+
+    def test_plan_app_jar_changed(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            cf = MockCloudFoundry(tmp)
+            jar_path = os.path.join(tmp, 'dataflow-server.jar')
+            manifest = 'applications:\n- name: dataflow-server\n  path: %s\n' % jar_path
+            apps = {'dataflow-server': AppState('dataflow-server', 'STARTED', ['dataflow-server-1.apps.cf'])}
+            with open(jar_path, 'wb') as jar:
+                jar.write(b'2.9.0')
+            record_app(cf, 'dataflow-server', manifest)
+            self.assertEqual(NONE, plan_app(cf, 'dataflow-server', manifest, apps).action)
+            # A new version is downloaded to the same path
+            with open(jar_path, 'wb') as jar:
+                jar.write(b'2.10.0')
+            self.assertEqual(PUSH, plan_app(cf, 'dataflow-server', manifest, apps).action)
+
+    def test_read_services(self):
+        cf = MockCloudFoundry(None, {'/v3/service_instances': {
+            'pagination': {'next': None},
+            'resources': [
+                {'name': 'rabbit', 'type': 'managed', 'last_operation': {'type': 'create', 'state': 'succeeded'},
+                 'relationships': {'service_plan': {'data': {'guid': 'plan-1'}}}},
+                {'name': 'sql', 'type': 'user-provided', 'last_operation': {'type': 'create', 'state': 'succeeded'},
+                 'relationships': {}}],
+            'included': {
+                'service_plans': [{'guid': 'plan-1', 'name': 'single-node',
+                                   'relationships': {'service_offering': {'data': {'guid': 'offering-1'}}}}],
+                'service_offerings': [{'guid': 'offering-1', 'name': 'p.rabbitmq'}]}}})
+        services = read_services(cf, 'space-guid')
+        self.assertEqual(('p.rabbitmq', 'single-node', 'create succeeded'),
+                         (services['rabbit'].service, services['rabbit'].plan, services['rabbit'].status))
+        self.assertEqual('user-provided', services['sql'].service)
+
+    def test_apply_changes(self):
+        applied = []
+
+        def apply(change):
+            if change.name == 'bad':
+                raise ValueError(change.name)
+            applied.append(change.name)
+
+        changes = plan_services({'good': ServiceConfig(name='good', service='s', plan='p'),
+                                 'bad': ServiceConfig(name='bad', service='s', plan='p')}, {})
+        with self.assertRaises(RuntimeError):
+            apply_changes(changes, apply)
+        self.assertEqual(['good'], applied)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+__copyright__ = '''
+Copyright 2022 the original author or authors.
+  Licensed under the Apache License, Version 2.0 (the "License");
+  you may not use this file except in compliance with the License.
+  You may obtain a copy of the License at
+      http://www.apache.org/licenses/LICENSE-2.0
+  Unless required by applicable law or agreed to in writing, software
+  distributed under the License is distributed on an "AS IS" BASIS,
+  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+  See the License for the specific language governing permissions and
+  limitations under the License.
+'''
+
+__author__ = 'David Turanski'
+
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from install.pool import WarmPool, READY, CLAIMED, RELEASED, PROVISIONING, FAILED
+
+
+class TestPool(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.pool = WarmPool(self.tmp.name, env={})
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_claim_once(self):
+        with self.pool.locked() as entries:
+            for i in range(5):
+                self.pool.set_state(entries, 'scdf-pool-%d' % i, READY)
+            self.pool.set_state(entries, 'scdf-pool-5', RELEASED)
+        with ThreadPoolExecutor(max_workers=10) as executor:
+            claims = list(executor.map(lambda i: self.pool.claim('job-%d' % i), range(10)))
+        claimed = [entry['space'] for entry in claims if entry]
+        self.assertEqual(5, len(set(claimed)))
+        self.assertEqual(5, len(claimed))
+        self.assertNotIn('scdf-pool-5', claimed)
+        self.assertEqual([CLAIMED] * 5 + [RELEASED], [entry['state'] for entry in
+                                                      sorted(self.pool.load().values(), key=lambda e: e['space'])])
+        for entry in [entry for entry in claims if entry]:
+            self.assertRegex(entry['claimed_by'], '^job-[0-9]$')
+
+    def test_release_requires_claim(self):
+        with self.pool.locked() as entries:
+            self.pool.set_state(entries, 'scdf-pool-1', READY)
+        with self.assertRaises(ValueError):
+            self.pool.release('scdf-pool-1')
+
+    def test_space_db_names(self):
+        pool = WarmPool(self.tmp.name, env={'SQL_PROVIDER': 'postgresql', 'SQL_DATAFLOW_DB_NAME': 'scdf'})
+        env = pool.target_env('scdf-pool-1')
+        self.assertEqual('scdf-pool-1', env['SPRING_CLOUD_DEPLOYER_CLOUDFOUNDRY_SPACE'])
+        self.assertEqual('scdf_scdf_pool_1', env['SQL_DATAFLOW_DB_NAME'])
+        self.assertEqual('scdf_scdf_pool_1', env['SQL_SKIPPER_DB_NAME'])
+        self.assertNotIn('SQL_DATAFLOW_DB_NAME', self.pool.target_env('scdf-pool-1'))
+
+    def test_stale_provisioning(self):
+        now = [1000.0]
+        pool = WarmPool(self.tmp.name, env={}, provisioning_timeout_sec=600, clock=lambda: now[0])
+        with pool.locked() as entries:
+            pool.set_state(entries, 'scdf-pool-1', PROVISIONING)
+            now[0] = 1500.0
+            pool.set_state(entries, 'scdf-pool-2', PROVISIONING)
+        now[0] = 1700.0
+        with pool.locked() as entries:
+            pool.fail_stale_provisioning(entries)
+        self.assertEqual({'scdf-pool-1': FAILED, 'scdf-pool-2': PROVISIONING},
+                         {space: entry['state'] for space, entry in pool.load().items()})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,15 +1,50 @@
+import logging
+import os
+import tempfile
+import time
 import unittest
 
+import requests
+
+from cloudfoundry.oauth import TokenProvider
+from install.http_client import HttpClient
 from cloudfoundry.platform.config.configuration import ConfigurationProperties
-from cloudfoundry.platform.registration import AppRegistrations
+from cloudfoundry.platform.registration import AppRegistrations, AppImportsParser
+
+logger = logging.getLogger(__name__)
 
 
 class MockCloudFoundry:
+    def __init__(self):
+        self.token_provider = TokenProvider(self.oauth_token)
+        self.http = HttpClient()
+
     def oauth_token(self):
         return 'bearer eyJhbGciOiJSUzI1NiIsImprdSI6I'
 
 
+class RecordingHttpClient(HttpClient):
+    def __init__(self):
+        super().__init__()
+        self.requests = []
+
+    def request(self, method, url, *args, **kwargs):
+        self.requests.append((method, kwargs))
+        return requests.Response()
+
+
 class RegistrationTests(unittest.TestCase):
+    def test_bulk_imports_wait_for_the_server(self):
+        cf = MockCloudFoundry()
+        cf.http = RecordingHttpClient()
+        config_props = ConfigurationProperties.from_env_vars({'BINDER': 'rabbit'})
+        app_reg = AppRegistrations(cf=cf, config_props=config_props,
+                                   server_uri='https://dataflow-server.apps.somehost.cf-app.com')
+        app_reg.register_stream_apps()
+        app_reg.register_task_apps()
+        self.assertEqual([('POST', None), ('POST', None)],
+                         [(method, kwargs['timeout']) for method, kwargs in cf.http.requests])
+
     def test_parse_app_import_entries(self):
         config_props = ConfigurationProperties.from_env_vars(
             {'BINDER': 'rabbit'})
@@ -28,3 +63,48 @@ class RegistrationTests(unittest.TestCase):
         self.assertEqual('scenario', app_name)
         self.assertEqual('maven://io.spring:scenario-task:0.0.1-SNAPSHOT', url)
         self.assertEqual('0.0.1-SNAPSHOT', version)
+
+    def test_read_app_imports_reports_duplicates_and_errors(self):
+        parser = AppImportsParser(binder='kafka', dataflow_version='2.10.0')
+        contents = '''# comment
+sink.log=maven://org.springframework.cloud.stream.app:log-sink-$BINDER:3.0.1
+sink.log=maven://org.springframework.cloud.stream.app:log-sink-$BINDER:2.1.5.RELEASE
+sink.log=maven://org.springframework.cloud.stream.app:log-sink-$BINDER:3.0.1
+
+not a registration
+task.bad=maven://io.spring:scenario-task:$UNKNOWN
+task.noversion=https://some.host/task.jar
+'''
+        with tempfile.NamedTemporaryFile('w', suffix='.properties', delete=False) as f:
+            f.write(contents)
+        try:
+            app_imports = parser.read(f.name)
+        finally:
+            os.remove(f.name)
+
+        self.assertEqual(['2.1.5.RELEASE', '3.0.1'], [app.version for app in app_imports.apps])
+        self.assertEqual('maven://org.springframework.cloud.stream.app:log-sink-kafka:3.0.1', app_imports.apps[1].uri)
+        self.assertEqual(1, len(app_imports.duplicates))
+        self.assertEqual(4, app_imports.duplicates[0].line_number)
+        self.assertEqual(2, app_imports.duplicates[0].overridden_line_number)
+        self.assertEqual([6, 7, 8], [error.line_number for error in app_imports.errors])
+        with self.assertRaises(ValueError):
+            app_imports.assert_valid()
+
+    def test_read_large_app_imports(self):
+        parser = AppImportsParser(binder='rabbit', dataflow_version='2.10.0')
+        lines = 10000
+        with tempfile.NamedTemporaryFile('w', suffix='.properties', delete=False) as f:
+            for i in range(lines):
+                f.write('sink.app-%d=maven://org.springframework.cloud:app-%d-$BINDER:$DATAFLOW_VERSION\n' % (i, i))
+        try:
+            start = time.perf_counter()
+            app_imports = parser.read(f.name)
+            elapsed = time.perf_counter() - start
+        finally:
+            os.remove(f.name)
+        logger.info("parsed %d app registrations in %.3f sec" % (lines, elapsed))
+        self.assertEqual(lines, len(app_imports.apps))
+        self.assertFalse(app_imports.duplicates)
+        self.assertFalse(app_imports.errors)
+        self.assertEqual('maven://org.springframework.cloud:app-9999-rabbit:2.10.0', app_imports.apps[-1].uri)